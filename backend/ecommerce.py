@@ -3,9 +3,8 @@
 
 from fastapi import APIRouter, HTTPException, Request, BackgroundTasks, UploadFile, File, Form, Response
 from fastapi.responses import FileResponse
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import List, Optional, Dict, Any
-import httpx
 import os
 import googlemaps
 from datetime import datetime, timezone, timedelta
@@ -15,7 +14,13 @@ import math
 import re
 import logging
 import unicodedata
+import hashlib
+import hmac
+import json
+import time
 from io import BytesIO
+from pymongo import UpdateOne, UpdateMany, ReplaceOne, DeleteMany, ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from PIL import Image as PILImage
 from dotenv import load_dotenv
 
@@ -43,6 +48,38 @@ from services.image_migration_helper import (
     is_cloudinary_url
 )
 
+# Import ERP client (concurrent, adaptively paced page fetcher)
+from services.erp_client import ErpProductsClient, ErpPageError
+from services.mongo_indexes import create_indexes
+from services.mongo_lease import LeaseBusy, lease
+from services.delivery_distance import DistanceService
+from services.delivery_grid import load_delivery_grid
+from services.sync_metrics import SyncMetrics, SYNC_RUNS_COLLECTION, record_sync_run, recent_sync_runs
+
+# Import in-process catalog read model
+from services.catalog_snapshot import CatalogSnapshot, CatalogStore, CATALOG_META_COLLECTION, CATALOG_META_ID
+from services.catalog_facets import FacetCube, ANY, PRICE_BANDS, CATALOG_FACETS_COLLECTION, CATALOG_FACETS_ID
+from services.response_cache import ResponseCache, serve_versioned
+from services.catalog_changes import CATALOG_CHANGES_COLLECTION, collapse_changes
+from services.stock_holds import (
+    StockUnavailable, reserve_stock, commit_hold, release_hold, release_expired_holds, ensure_stock_hold_indexes,
+    mark_hold_invoiced, absorb_committed_holds
+)
+from services.outbox import enqueue, outbox_message
+from services.coupons import (
+    CouponCache, CouponRejected, coupon_discount, normalize_code, redeem_coupon, release_coupon,
+    generate_coupons, bump_coupons_version, ensure_coupon_indexes
+)
+
+# Import text folding/tokenizing shared with the search index
+from services.search_index import tokenize
+
+# Import keyset pagination helpers
+from pagination import find_page, count_cache, encode_cursor, decode_cursor
+
+# Import product name parsing (precompiled patterns, memoized per name)
+from product_parsing import parse_product_name, parse_product_names
+
 # Load environment variables
 load_dotenv()
 
@@ -60,101 +97,152 @@ STORE_LAT = float(os.environ.get('STORE_LAT', '-25.2921064'))
 STORE_LNG = float(os.environ.get('STORE_LNG', '-57.5738759'))
 DELIVERY_PRICE_PER_KM = float(os.environ.get('DELIVERY_PRICE_PER_KM', '2500'))
 DELIVERY_MIN_PRICE = float(os.environ.get('DELIVERY_MIN_PRICE', '20000'))
+DELIVERY_MAX_PRICE = 50000
+DELIVERY_BATCH_MAX_POINTS = 50
+# Delivery distances are cached per cell of this many decimal degrees (3 = ~110 m)
+DELIVERY_DISTANCE_CELL_DECIMALS = int(os.environ.get('DELIVERY_DISTANCE_CELL_DECIMALS', '3'))
+DELIVERY_DISTANCE_TTL_HOURS = float(os.environ.get('DELIVERY_DISTANCE_TTL_HOURS', '168'))
+# Road distance grid built by scripts/build_delivery_grid.py (optional, read at startup)
+DELIVERY_GRID_PATH = os.environ.get(
+    'DELIVERY_GRID_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'delivery_grid.npz')
+)
 SYNC_INTERVAL_SECONDS = 300  # 5 minutes
+# Stock reserved at checkout is held this long waiting for payment (gateway) or
+# for staff to confirm the request (no gateway), then released automatically
+STOCK_HOLD_MINUTES = float(os.environ.get('STOCK_HOLD_MINUTES', '20'))
+STOCK_HOLD_REQUEST_MINUTES = float(os.environ.get('STOCK_HOLD_REQUEST_MINUTES', '1440'))
+STOCK_HOLD_RELEASE_INTERVAL_SECONDS = 60
+# Order statuses that turn a stock hold into a sale / give it back
+ORDER_STATUSES_COMMITTING_STOCK = {"pagado", "confirmed", "preparing", "shipped", "delivered", "facturado"}
+ORDER_STATUSES_RELEASING_STOCK = {"cancelled", "cancelado"}
+# The order is invoiced in the ERP, whose stock then stops counting its units
+ORDER_STATUS_INVOICED = "facturado"
+# Committed holds whose order is never marked invoiced stop holding units after this long
+COMMITTED_HOLD_MAX_DAYS = float(os.environ.get('COMMITTED_HOLD_MAX_DAYS', '7'))
+# 'delta' only writes products whose content hash changed, 'full' rewrites every product
+SYNC_MODE = os.environ.get('ERP_SYNC_MODE', 'delta')
+SYNC_WRITE_BATCH_SIZE = 500  # Operations per bulk_write
+ERP_PAGE_SIZE = int(os.environ.get('ERP_PAGE_SIZE', '500'))
+ERP_MAX_CONCURRENCY = int(os.environ.get('ERP_MAX_CONCURRENCY', '4'))
+# An interrupted sync is resumed from its checkpoint if it started less than this long ago
+SYNC_RESUME_WINDOW_SECONDS = SYNC_INTERVAL_SECONDS * 2
+SYNC_CHECKPOINT_ID = "erp_products"
+# Sync run summaries (timings, ERP latency, diff size) kept in shop_sync_runs
+SYNC_HISTORY_SIZE = int(os.environ.get('SYNC_HISTORY_SIZE', '50'))
 WHATSAPP_COMMERCIAL = os.environ.get('NOTIFICATION_WHATSAPP_ECOMMERCE', '+595973666000')
+# Shared secret the ERP signs stock pushes with (the push endpoint is off without it)
+ERP_WEBHOOK_SECRET = os.environ.get('ERP_WEBHOOK_SECRET', '')
+# Signed pushes older than this are rejected (replay protection)
+ERP_WEBHOOK_MAX_AGE_SECONDS = 300
+ERP_EVENTS_COLLECTION = "shop_erp_events"
+ERP_EVENTS_RETENTION_DAYS = 7
+# How often each worker checks whether its catalog snapshot is outdated
+CATALOG_VERSION_CHECK_SECONDS = float(os.environ.get('CATALOG_VERSION_CHECK_SECONDS', '5'))
+# Serialized storefront responses kept per worker for the current catalog version
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '2048'))
+# How long catalog change log entries are kept; older versions get a reset instead of a delta
+CATALOG_CHANGES_RETENTION_DAYS = float(os.environ.get('CATALOG_CHANGES_RETENTION_DAYS', '7'))
+# Above this many changed products a delta is not worth it, clients reload the listing
+CATALOG_DELTA_MAX_PRODUCTS = int(os.environ.get('CATALOG_DELTA_MAX_PRODUCTS', '1000'))
+# How often each worker checks whether coupon definitions were edited
+COUPON_VERSION_CHECK_SECONDS = float(os.environ.get('COUPON_VERSION_CHECK_SECONDS', '5'))
+# Largest campaign drop of one-off codes generated in one request
+COUPON_BULK_MAX_COUNT = 10000
 
 # Initialize Google Maps client
 gmaps = None
 if GOOGLE_MAPS_API_KEY:
     gmaps = googlemaps.Client(key=GOOGLE_MAPS_API_KEY)
 
+# Store -> destination driving distances, shared by quotes and checkout
+delivery_distances = DistanceService(
+    (STORE_LAT, STORE_LNG),
+    gmaps,
+    grid=load_delivery_grid(DELIVERY_GRID_PATH, (STORE_LAT, STORE_LNG)),
+    cell_decimals=DELIVERY_DISTANCE_CELL_DECIMALS,
+    ttl_seconds=DELIVERY_DISTANCE_TTL_HOURS * 3600
+)
+
+# Coupon definitions by code, shared by /apply-coupon and checkout
+coupon_cache = CouponCache(check_interval=COUPON_VERSION_CHECK_SECONDS)
+
 # Database reference (will be set from server.py)
 db = None
 
 def set_database(database):
     global db
     db = database
+    coupon_cache.db = database
 
 # Gender mapping based on category/brand keywords
 FEMALE_KEYWORDS = ['malva', 'santal', 'ina clothing', 'efimera', 'thula', 'mariela', 'sarelly', 'cristaline', 'bravisima', 'olivia']
 MALE_KEYWORDS = ['bro fitwear', 'lacoste', 'immortal']
 UNISEX_KEYWORDS = ['aguara', 'ds', 'mp suplementos', 'ugg']
 
+# Brand unification mappings - maps display names to actual ERP category patterns
+# Seed for the admin-editable shop_brand_mappings collection, which is what is used at runtime
+BRAND_UNIFICATION = {
+    # AVENUE OUTLET - all outlet brands
+    'AVENUE OUTLET': [
+        'AVENUE', 'AVENUE AK', 'BDA FACTORY', 'FRAME', 'GOOD AMERICAN',
+        'JAZMIN CHEBAR', 'JUICY', 'KOSIUKO', 'LACOSTE', 'MARIA CHER',
+        'MERSEA', 'QUIKSILVER', 'RICARDO ALMEIDA', 'ROTUNDA', 'RUSTY',
+        'TOP DESIGN', 'VOYAGEUR', 'VITAMINA', 'HOWICK', 'EST1985'
+    ],
+    # SUN68 - all SUN variants
+    'SUN68': ['SUN68', 'SUN69', 'SUN70', 'SUN71', 'SUN72'],
+    # BODY SCULPT - variations
+    'BODY SCULPT': ['BODY SCULPT', 'BODYCULPT'],
+    # UNDISTURBED - variations
+    'UNDISTURBED': ['UNDISTURB3D', 'UNDISTURBED'],
+    # MARIA E MAKE UP - variations
+    'MARIA E MAKE UP': ['MARIA E MAKEUP', 'MARIA E MAKE UP'],
+    # AGUARA
+    'AGUARA': ['AGUARA FITWEAR', 'AGUARA'],
+    # DAVID SANDOVAL
+    'DAVID SANDOVAL': ['DS'],
+    # KARLA
+    'KARLA': ['KARLA RUIZ', 'KARLA'],
+}
+BRAND_MAPPINGS_COLLECTION = "shop_brand_mappings"
+
+# ERP category/brand value (upper case) -> unified display brand.
+# Reloaded from shop_brand_mappings on every grouping and catalog snapshot load.
+brand_mappings: Dict[str, str] = {
+    variant.upper(): unified
+    for unified, variants in BRAND_UNIFICATION.items()
+    for variant in variants
+}
+
+def make_brand_key(name: str) -> str:
+    """Canonical brand key: accent-folded lowercase words joined by dashes (AVENUE OUTLET -> avenue-outlet)"""
+    return "-".join(tokenize(name or ''))
+
+def unify_brand(value: str) -> str:
+    """Display brand for an ERP category/brand value (AVENUE AK -> AVENUE OUTLET)"""
+    return brand_mappings.get((value or '').strip().upper(), (value or '').strip())
+
+def resolve_brand(category: Optional[str], brand: Optional[str]) -> str:
+    """Unified brand of a product: a mapped category or brand, else the category (or brand) itself"""
+    for value in (category, brand):
+        mapped = brand_mappings.get((value or '').strip().upper())
+        if mapped:
+            return mapped
+    return (category or brand or '').strip()
+
+def unified_brand_keys() -> set:
+    return {make_brand_key(b) for b in brand_mappings.values()}
+
 # Sync status
 sync_status = {
     "last_sync": None,
     "syncing": False,
-    "product_count": 0
+    "product_count": 0,
+    "last_stats": None
 }
 
 # ==================== HELPER FUNCTIONS ====================
 
-def extract_size_from_name(name: str) -> Optional[str]:
-    """Extract size from product name
-    
-    Handles multiple size conventions:
-    - Standard: XS, S, M, L, XL, XXL, XXXL
-    - Brazilian/Spanish: PP, P, M, G, GG, XG, XXG, XXXG, XP (extra pequeño)
-    - Numeric: 34, 36, 38, 40, 42, etc. (including single digits 8, 10, 12, 14, 16 for kids)
-    - US sizes: US5, US6, US7, etc.
-    - Combined: S/M, M/L, etc.
-    - Dot notation: .M, .G, .XG (used by some brands)
-    """
-    if not name:
-        return None
-    
-    # Normalize name for easier matching
-    name_upper = name.upper()
-    
-    # Comprehensive size patterns (order matters - more specific first)
-    patterns = [
-        # US sizes
-        r'[-\s](US\d{1,2})(?:[-\s]|$)',     # -US8, -US10, US8-, " US8 "
-        
-        # Combined sizes with slash
-        r'[-\s]([XSMLPG]{1,3}/[XSMLPG]{1,3})(?:[-\s]|$)',  # S/M, M/L
-        
-        # Extended alpha sizes with X prefix (XXL, XXXL, XXG, XXXG, XP, XS, XL, etc.)
-        r'[-\s\.](X{1,3}[SLGP])(?:[-\s\.]|$)',  # XS, XXS, XXXS, XL, XXL, XXXL, XG, XXG, XXXG, XP
-        
-        # Brazilian/Spanish double sizes - PP, GG (not ambiguous with color codes)
-        r'[-\s\.](PP)(?:[-\s\.]|$)',              # PP (extra small)
-        
-        # Single letter sizes at specific positions - P, M, G, S, L
-        # Be more specific to avoid matching color codes
-        r'-([PMGSL])-[A-Z]',                # -P-, -M- etc. followed by color name
-        r'[-\s\.]([PMGSL])(?:[-\s\.]|$)',   # P, M, G, S, L (single letter) at boundaries
-        
-        # Numeric sizes (2 digits) - common clothing sizes
-        r'[-\s](\d{2})(?:[-\s]|$)',              # 34, 36, 38, etc.
-        
-        # Numeric sizes for kids (single digits 8-16)
-        r'-([8]|1[0246])(?:-|$)',                # 8, 10, 12, 14, 16 for kids
-        
-        # At end of string patterns
-        r'-(US\d{1,2})$',                        # ends with -US8
-        r'[-\.](X{1,3}[SLGP])$',                 # ends with -XL, -XXL, -XG, -XXG, -XP, .XG
-        r'-(PP)$',                               # ends with -PP
-        r'-([PMGSL])$',                          # ends with -P, -M, -G, -S, -L
-        r'\.([PMGSL])$',                         # ends with .P, .M, .G (dot notation)
-        r'-(\d{2})$',                            # ends with -38
-        
-        # Space separated at end
-        r'\s(X{1,3}[SLGP])$',                    # ends with " XL", " XP"
-        r'\s(PP)$',                              # ends with " PP"
-        r'\s([PMGSL])$',                         # ends with " M"
-        r'\s(\d{2})$',                           # ends with " 38"
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, name_upper)
-        if match:
-            size = match.group(1).upper()
-            return size
-    
-    return None
-
-
 def normalize_size(size: str) -> str:
     """Normalize size to standard format for grouping purposes
     
@@ -195,113 +283,20 @@ def determine_gender(category: str, brand: str) -> str:
     
     return 'unisex'
 
-def extract_base_model(name: str) -> str:
-    """Extract base model name by removing size from product name
-    
-    Removes all size patterns to get the base product model name
-    for grouping variants together.
-    
-    Handles complex patterns like:
-    - Wuarani: 100394-BP- (Blanco Pequeño), 100394-NM- (Negro Mediano)
-    - OKI: REM.PREM.BLA.M (ends with .M for size)
-    - Standard: -P-, -M-, -G-, -XL-, etc.
+def transform_product(p: dict, parsed: Optional[Dict[str, tuple]] = None) -> dict:
+    """Transform ERP product to our format
+
+    `parsed` is an optional name -> (size, base_model) map from parse_product_names,
+    so a page of products is parsed in one pass instead of name by name.
     """
+    name = p.get('Name', '')
     if not name:
-        return name
-    
-    # Pre-normalize: fix inconsistent spacing around dashes
-    base = name
-    base = re.sub(r'\s+', ' ', base)    # multiple spaces to one
-    base = re.sub(r'\s*-\s*', '-', base)  # " - " or "- " or " -" → "-"
-    
-    # Patterns to remove sizes (order matters - more specific first)
-    patterns = [
-        # ===========================================
-        # PRODUCT CODE PATTERNS (Wuarani style)
-        # Format: XXXXX-[COLOR][SIZE]- where COLOR is letter(s) and SIZE is P/M/G/XL/etc
-        # ===========================================
-        # Color codes: N=Negro, B=Blanco, R=Rosa/Rojo, G=Gris, C=Celeste, V=Verde, F=Fucsia, L=Lila, O=Ocre, P=Petroleo/Piel
-        # Size codes: XP, P, M, G, XL, XXL, XG, XXG
-        
-        # Extended sizes with X prefix: NXP, BXL, GXXL, PXL, etc.
-        (r'(\d{5,6}-\d?[NBRGCVFLOAP])(X{1,2}[PLG])(-)', r'\1-'),  # 100394-BXP-, 100100-PXL- → remove size
-        
-        # Single letter sizes: NP, NM, NG, BP, BM, BG, PP, PM, PG etc.
-        (r'(\d{5,6}-\d?[NBRGCVFLOAP])([PMGSL])(-)', r'\1-'),      # 100394-BP-, 100100-PM- → remove size
-        
-        # ===========================================
-        # DOT NOTATION (OKI style: REM.PREM.BLA.M)
-        # ===========================================
-        (r'\.(X{1,2}[SLGP])$', ''),           # .XL, .XG, .XP at end → remove
-        (r'\.([PMGSL])$', ''),                # .P, .M, .G at end → remove
-        (r'\.(X{1,2}[SLGP])-', '-'),          # .XL- → -
-        (r'\.([PMGSL])-', '-'),               # .M- → -
-        
-        # ===========================================
-        # US SIZES
-        # ===========================================
-        (r'-(US\d{1,2})$', ''),           # -US8 at end → remove
-        (r'-(US\d{1,2})-', '-'),          # -US8- → keep one dash
-        (r'\s(US\d{1,2})(?:\s|$)', ' '),  # space US8 → space
-        
-        # ===========================================
-        # COMBINED SIZES WITH SLASH
-        # ===========================================
-        (r'-([XSMLPG]{1,3}/[XSMLPG]{1,3})$', ''),      # -S/M at end → remove
-        (r'-([XSMLPG]{1,3}/[XSMLPG]{1,3})-', '-'),     # -S/M- → -
-        
-        # ===========================================
-        # EXTENDED ALPHA SIZES (XS, XL, XXL, XG, XXG, XP)
-        # ===========================================
-        (r'-(X{1,3}[SLGP])$', ''),         # -XXL, -XXG, -XP at end → remove
-        (r'-(X{1,3}[SLGP])-', '-'),        # -XXL-, -XXG-, -XP- → -
-        (r'\s(X{1,3}[SLGP])$', ''),        # space XXL at end → remove
-        (r'\s(X{1,3}[SLGP])\s', ' '),      # space XXL space → space
-        
-        # ===========================================
-        # DOUBLE LETTER SIZES (PP, GG)
-        # ===========================================
-        (r'-(PP)$', ''),                   # -PP at end → remove
-        (r'-(PP)-', '-'),                  # -PP- → -
-        (r'\s(PP)$', ''),                  # space PP at end → remove
-        (r'\s(PP)\s', ' '),                # space PP space → space
-        # Note: GG is ambiguous (could be Gris Grande) - handle in context
-        
-        # ===========================================
-        # SINGLE LETTER SIZES (P, M, G, S, L)
-        # ===========================================
-        (r'-([PMGSL])$', ''),              # -P, -M, -G, -S, -L at end → remove
-        (r'-([PMGSL])-', '-'),             # -P-, -M- etc → -
-        (r'\s([PMGSL])$', ''),             # space P at end → remove
-        (r'\s([PMGSL])\s', ' '),           # space P space → space (P in middle of name)
-        
-        # ===========================================
-        # NUMERIC SIZES (kids: 8-16, adults: 34-50)
-        # ===========================================
-        (r'-([8]|1[0246])$', ''),          # -8, -10, -12, -14, -16 at end (kids)
-        (r'-([8]|1[0246])-', '-'),         # -8-, -10- etc (kids) → -
-        (r'-(\d{2})$', ''),                # -38 at end → remove
-        (r'-(\d{2})-', '-'),               # -38- → -
-        (r'\s(\d{2})$', ''),               # space 38 at end → remove
-        (r'\s(\d{2})\s', ' '),             # space 38 space → space
-    ]
-    
-    for pattern, replacement in patterns:
-        base = re.sub(pattern, replacement, base, flags=re.IGNORECASE)
-    
-    # Post-normalize and clean up
-    base = re.sub(r'-+', '-', base)    # multiple dashes to one
-    base = re.sub(r'\s+', ' ', base)   # multiple spaces to one
-    base = re.sub(r'-(\d{4})$', '', base)  # remove trailing product codes like -3721, -3723
-    base = base.strip('-').strip()
-    
-    return base
-
-def transform_product(p: dict) -> dict:
-    """Transform ERP product to our format"""
-    product_size = extract_size_from_name(p.get('Name', ''))
+        product_size, base_model = None, name
+    elif parsed is not None and name in parsed:
+        product_size, base_model = parsed[name]
+    else:
+        product_size, base_model = parse_product_name(name)
     product_gender = determine_gender(p.get('category', ''), p.get('brand', ''))
-    base_model = extract_base_model(p.get('Name', ''))
     
     return {
         "product_id": p.get('ID'),
@@ -322,30 +317,215 @@ def transform_product(p: dict) -> dict:
         "updated_at": datetime.now(timezone.utc).isoformat()
     }
 
-async def create_grouped_products():
-    """Create grouped products collection from individual products
-    Preserves custom images when re-syncing
+# Fields transform_product writes, i.e. what the ERP owns on a stored product
+TRANSFORMED_FIELDS = (
+    "product_id", "name", "base_model", "sku", "price", "stock", "discount", "description",
+    "image", "category", "brand", "size", "gender", "featured", "online", "updated_at"
+)
+
+# Fields that change on every transform and must not affect the fingerprint
+HASH_EXCLUDED_FIELDS = ("updated_at", "content_hash", "last_seen_sync")
+
+def compute_product_hash(product: dict) -> str:
+    """Stable content fingerprint of a transformed product (ignores volatile fields)"""
+    payload = {k: v for k, v in product.items() if k not in HASH_EXCLUDED_FIELDS}
+    encoded = json.dumps(payload, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha1(encoded.encode('utf-8')).hexdigest()
+
+def new_sync_stats(mode: str) -> dict:
+    """Empty per-cycle counters for a sync run"""
+    return {
+        "mode": mode,
+        "fetched": 0,
+        "inserted": 0,
+        "changed": 0,
+        "unchanged": 0,
+        "removed": 0,
+        "failed_pages": [],
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "finished_at": None
+    }
+
+async def apply_product_delta(
+    raw_products: list,
+    run_id: str,
+    stats: dict,
+    force: bool = False,
+    changed_models: Optional[set] = None,
+    metrics: Optional[SyncMetrics] = None
+):
+    """Transform a batch of ERP products and write only the ones that changed
+
+    Each transformed product is fingerprinted and compared with the hash stored
+    on the previous sync. New and changed products are upserted; unchanged ones
+    only get their last_seen_sync marker refreshed (one UpdateMany per batch).
+    With force=True every product is rewritten (full sync mode).
+    The old and new base_model of every written product are added to
+    changed_models so grouping can be redone for just those models.
+    Time spent per step is added to `metrics` when given.
     """
-    logger.info("Creating grouped products...")
-    
-    # First, get existing custom images to preserve them
-    existing_custom_images = {}
-    existing_products = await db.shop_products_grouped.find(
-        {"custom_image": {"$exists": True, "$ne": None}},
-        {"_id": 0, "base_model": 1, "custom_image": 1, "image_updated_at": 1}
-    ).to_list(5000)
-    
-    for p in existing_products:
-        if p.get("base_model"):
-            existing_custom_images[p["base_model"]] = {
-                "custom_image": p.get("custom_image"),
-                "image_updated_at": p.get("image_updated_at")
-            }
+    metrics = metrics or SyncMetrics()
+    with metrics.phase("transform"):
+        parsed = parse_product_names(p.get('Name') for p in raw_products if p.get('Name'))
+        transformed = {}
+        for p in raw_products:
+            t = transform_product(p, parsed)
+            if t["product_id"]:
+                transformed[t["product_id"]] = t
+        hashes = {product_id: compute_product_hash(t) for product_id, t in transformed.items()}
+
+    if not transformed:
+        return
+
+    with metrics.phase("lookup"):
+        existing = await db.shop_products.find(
+            {"product_id": {"$in": list(transformed.keys())}},
+            {"_id": 0, "product_id": 1, "content_hash": 1, "base_model": 1}
+        ).to_list(None)
+    existing_hashes = {e["product_id"]: e.get("content_hash") for e in existing}
+    existing_models = {e["product_id"]: e.get("base_model") for e in existing}
+
+    operations = []
+    unchanged_ids = []
+    for product_id, t in transformed.items():
+        content_hash = hashes[product_id]
+
+        if product_id in existing_hashes:
+            if existing_hashes[product_id] == content_hash and not force:
+                unchanged_ids.append(product_id)
+                stats["unchanged"] += 1
+                continue
+            stats["changed"] += 1
+            if changed_models is not None:
+                changed_models.add(existing_models[product_id])
+        else:
+            stats["inserted"] += 1
+        
+        if changed_models is not None:
+            changed_models.add(t["base_model"])
+
+        t["content_hash"] = content_hash
+        t["last_seen_sync"] = run_id
+        operations.append(UpdateOne({"product_id": product_id}, {"$set": t}, upsert=True))
+
+    if unchanged_ids:
+        operations.append(UpdateMany(
+            {"product_id": {"$in": unchanged_ids}},
+            {"$set": {"last_seen_sync": run_id}}
+        ))
+
+    with metrics.phase("write"):
+        for i in range(0, len(operations), SYNC_WRITE_BATCH_SIZE):
+            await db.shop_products.bulk_write(operations[i:i + SYNC_WRITE_BATCH_SIZE], ordered=False)
+
+async def remove_products_missing_from_erp(run_id: str, stats: dict, changed_models: Optional[set] = None):
+    """Delete products that were not returned by the ERP in this sync run"""
+    missing = {"last_seen_sync": {"$ne": run_id}}
+    if changed_models is not None:
+        changed_models.update(await db.shop_products.distinct("base_model", missing))
+    result = await db.shop_products.delete_many(missing)
+    stats["removed"] = result.deleted_count
+
+async def load_resumable_checkpoint(mode: str, total_products: int) -> Optional[dict]:
+    """Return the checkpoint of an interrupted sync that can be resumed, if any
+
+    The ERP pages by offset, so a resume is only attempted while it reports
+    exactly the same product count as when the run started.
+    """
+    checkpoint = await db.shop_sync_checkpoints.find_one({"_id": SYNC_CHECKPOINT_ID})
+    if not checkpoint or checkpoint.get("status") != "running":
+        return None
     
-    logger.info(f"Preserving {len(existing_custom_images)} custom images")
+    if (checkpoint.get("mode") != mode
+            or checkpoint.get("total_products") != total_products
+            or checkpoint.get("per_page") != ERP_PAGE_SIZE):
+        return None
     
-    # Aggregate products by base_model
-    pipeline = [
+    started_at = datetime.fromisoformat(checkpoint["started_at"])
+    if datetime.now(timezone.utc) - started_at > timedelta(seconds=SYNC_RESUME_WINDOW_SECONDS):
+        return None
+    
+    return checkpoint
+
+async def start_checkpoint(run_id: str, mode: str, total_products: int, total_pages: int):
+    """Record the start of a sync run so an interrupted run can be resumed"""
+    await db.shop_sync_checkpoints.replace_one(
+        {"_id": SYNC_CHECKPOINT_ID},
+        {
+            "_id": SYNC_CHECKPOINT_ID,
+            "run_id": run_id,
+            "mode": mode,
+            "status": "running",
+            "total_products": total_products,
+            "total_pages": total_pages,
+            "per_page": ERP_PAGE_SIZE,
+            "completed_pages": [],
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        },
+        upsert=True
+    )
+
+async def mark_page_completed(page: int):
+    """Checkpoint a page once its products are written"""
+    await db.shop_sync_checkpoints.update_one(
+        {"_id": SYNC_CHECKPOINT_ID},
+        {
+            "$addToSet": {"completed_pages": page},
+            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}
+        }
+    )
+
+async def finish_checkpoint():
+    await db.shop_sync_checkpoints.update_one(
+        {"_id": SYNC_CHECKPOINT_ID},
+        {"$set": {"status": "completed", "updated_at": datetime.now(timezone.utc).isoformat()}}
+    )
+
+async def ensure_shop_indexes():
+    """Create the indexes used by the sync and storefront queries (each one on its own)"""
+    await create_indexes(db, [
+        ("shop_products", "product_id", {}),
+        ("shop_products", "sku", {}),
+        ("shop_products", [("base_model", 1), ("stock", 1)], {}),
+        ("shop_products_grouped", "grouped_id", {}),
+        ("shop_products_grouped", "base_model", {}),
+        ("shop_products_grouped", "brand_key", {}),
+        (BRAND_MAPPINGS_COLLECTION, "variant", {"unique": True}),
+        (CATALOG_CHANGES_COLLECTION, "at", {"expireAfterSeconds": int(CATALOG_CHANGES_RETENTION_DAYS * 86400)}),
+        (ERP_EVENTS_COLLECTION, "received_at", {"expireAfterSeconds": ERP_EVENTS_RETENTION_DAYS * 86400}),
+        ("shop_grouped_id_aliases", "legacy_id", {"unique": True}),
+        (SYNC_RUNS_COLLECTION, "started_at", {})
+    ])
+    await ensure_stock_hold_indexes(db)
+    await ensure_coupon_indexes(db)
+
+# Fields on grouped products that are edited by admins and must survive regrouping
+ADMIN_GROUPED_FIELDS = [
+    "custom_image", "image_updated_at", "images", "cloudinary_images", "cloudinary_url",
+    "image_storage", "custom_name", "custom_description", "custom_price", "is_featured"
+]
+# Full rebuilds build into <prefix>_<run>, so concurrent or crashed rebuilds never share one
+GROUPED_STAGING_COLLECTION = "shop_products_grouped_staging"
+# Every writer of shop_products_grouped (rebuilds, regroups, admin edits) holds this
+# lease, across workers, so a full rebuild's rename cannot drop a concurrent write
+CATALOG_LEASE = "catalog_grouped"
+CATALOG_LEASE_SECONDS = 900
+CATALOG_LEASE_WAIT_SECONDS = float(os.environ.get('CATALOG_LEASE_WAIT_SECONDS', '30'))
+# Above this share of changed models a full rebuild is cheaper than per-model upserts
+INCREMENTAL_REGROUP_MAX_RATIO = 0.3
+# Models whose availability changed outside a sync (stock holds, pushes hitting a
+# busy catalog) are regrouped together this long after the first change
+DIRTY_MODELS_REGROUP_DELAY_SECONDS = float(os.environ.get('DIRTY_MODELS_REGROUP_DELAY_SECONDS', '10'))
+dirty_models: set = set()
+dirty_models_task: Optional[asyncio.Task] = None
+
+def build_grouping_pipeline(match: dict) -> list:
+    """Aggregation pipeline that groups in-stock variants by base_model"""
+    return [
+        {"$match": match},
+        # Units held by pending checkouts are not for sale
+        {"$addFields": {"stock": {"$subtract": ["$stock", {"$ifNull": ["$reserved", 0]}]}}},
         {"$match": {"stock": {"$gt": 0}}},
         {"$group": {
             "_id": "$base_model",
@@ -354,8 +534,9 @@ async def create_grouped_products():
             "price": {"$min": "$price"},  # Minimum price
             "max_price": {"$max": "$price"},
             "total_stock": {"$sum": "$stock"},
-            "category": {"$first": "$category"},
-            "brand": {"$first": "$brand"},
+            # $min, not $first: the grouped ID hashes these, so they must not depend on variant order
+            "category": {"$min": "$category"},
+            "brand": {"$min": "$brand"},
             "gender": {"$first": "$gender"},
             "image": {"$first": "$image"},
             "description": {"$first": "$description"},
@@ -390,33 +571,455 @@ async def create_grouped_products():
             "variant_count": {"$size": "$available_sizes"}
         }}
     ]
+
+def make_grouped_id(base_model: str, brand: Optional[str]) -> str:
+    """Stable grouped product ID derived from the model and its brand
+
+    The same model always gets the same ID across syncs and rebuilds, so
+    carts, image records and any cache keyed on the product ID stay valid.
+    Case and spacing of the brand do not matter (variants often disagree).
+    """
+    brand_key = " ".join((brand or '').split()).upper()
+    key = f"{brand_key}|{(base_model or '').strip()}"
+    return f"grp_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]}"
+
+def merge_grouped_state(grouped: list, existing: Dict[str, dict]) -> List[dict]:
+    """Assign stable IDs and carry admin-edited fields over from the current grouped documents
+
+    Returns alias records (legacy_id -> grouped_id) for models whose previous ID
+    differs from the stable one, e.g. the old positional grp_N IDs.
+    """
+    aliases = []
+    for g in grouped:
+        g.pop("_id", None)
+        g["grouped_id"] = make_grouped_id(g.get("base_model"), g.get("brand") or g.get("category"))
+        previous = existing.get(g.get("base_model"))
+        if previous:
+            for field in ADMIN_GROUPED_FIELDS:
+                if field in previous:
+                    g[field] = previous[field]
+            if previous.get("grouped_id") and previous["grouped_id"] != g["grouped_id"]:
+                aliases.append({
+                    "legacy_id": previous["grouped_id"],
+                    "grouped_id": g["grouped_id"],
+                    "base_model": g.get("base_model")
+                })
+    return aliases
+
+async def save_grouped_id_aliases(aliases: List[dict]):
+    """Remember legacy grouped IDs so old carts and links keep resolving"""
+    if not aliases:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db.shop_grouped_id_aliases.bulk_write([
+        UpdateOne(
+            {"legacy_id": a["legacy_id"]},
+            {"$set": {**a, "updated_at": now}},
+            upsert=True
+        )
+        for a in aliases
+    ], ordered=False)
+    logger.info(f"Recorded {len(aliases)} legacy grouped ID aliases")
+
+def size_rank(size: str) -> tuple:
+    """Sort key of a size: numeric sizes first (by value), then alphabetic"""
+    return (0, int(size), "") if size.isdigit() else (1, 0, size)
+
+def sort_available_sizes(available_sizes: list) -> list:
+    """Drop empty sizes and sort them by size_rank"""
+    sizes_sorted = [s for s in (available_sizes or []) if s and s.get("size")]
+    sizes_sorted.sort(key=lambda x: size_rank(x["size"]))
+    return sizes_sorted
+
+def build_storefront_view(p: dict) -> dict:
+    """Ready-to-serve storefront representation of a grouped product
+
+    Stored on the grouped document as `view` at grouping time and whenever an
+    admin edits the product, so the listing and detail endpoints return it as is.
+    """
+    # Use Cloudinary URL if available, then custom_image, then ERP image
+    display_image = p.get("cloudinary_url") or p.get("custom_image") or p.get("image")
+    # Get all images (up to 3) - prefer cloudinary_images
+    all_images = p.get("cloudinary_images") or p.get("images", [])
+    if not all_images or not isinstance(all_images, list):
+        all_images = [display_image] if display_image else []
+    # Filter None values
+    all_images = [img for img in all_images if img]
+    
+    return {
+        "id": p.get("grouped_id"),
+        "name": p.get("custom_name") or p.get("base_model"),  # Use custom name if available
+        "full_name": p.get("name"),
+        "price": p.get("custom_price") or p.get("price"),
+        "max_price": p.get("max_price"),
+        "stock": p.get("total_stock"),
+        "image": display_image,
+        "images": all_images,  # All product images (up to 3)
+        "category": p.get("category"),
+        "brand": p.get("brand"),
+        "gender": p.get("gender"),
+        "discount": p.get("discount", 0),
+        "description": p.get("custom_description") or p.get("description"),
+        "available_sizes": sort_available_sizes(p.get("available_sizes", [])),
+        "sizes_list": sorted((s for s in p.get("sizes_list", []) if s), key=size_rank),
+        "variant_count": p.get("variant_count", 1)
+    }
+
+# Listing queries only read the stored view (plus the keys they sort on)
+STOREFRONT_VIEW_PROJECTION = {"_id": 0, "view": 1, "base_model": 1, "grouped_id": 1}
+
+def apply_storefront_views(grouped: list):
+    for g in grouped:
+        g["view"] = build_storefront_view(g)
+
+async def refresh_storefront_views(query: dict) -> int:
+    """Rebuild the stored view of the grouped products matching query, then bump the catalog
+
+    Admin edits go through edit_grouped_products, which runs both under the
+    catalog lease.
+    """
+    async with catalog_lease():
+        grouped = await db.shop_products_grouped.find(query, {"_id": 0, "variants": 0}).to_list(None)
+        changed = {}
+        for g in grouped:
+            view = build_storefront_view(g)
+            if g.get("grouped_id") and g.get("view") != view:
+                changed[g["grouped_id"]] = view
+        operations = [UpdateOne({"grouped_id": gid}, {"$set": {"view": view}}) for gid, view in changed.items()]
+        for i in range(0, len(operations), SYNC_WRITE_BATCH_SIZE):
+            await db.shop_products_grouped.bulk_write(operations[i:i + SYNC_WRITE_BATCH_SIZE], ordered=False)
+        await bump_catalog_version({"upserted": list(changed), "removed": []})
+    return len(operations)
+
+def diff_grouped(grouped: list, existing: Dict[str, dict]) -> dict:
+    """Catalog changes of a regroup: products whose storefront view changed and products gone"""
+    previous = {d["grouped_id"]: d.get("view") for d in existing.values() if d.get("grouped_id")}
+    new_ids = {g["grouped_id"] for g in grouped}
+    return {
+        "upserted": [g["grouped_id"] for g in grouped if previous.get(g["grouped_id"]) != g["view"]],
+        "removed": [gid for gid in previous if gid not in new_ids]
+    }
+
+def apply_brand_keys(grouped: list):
+    """Set the unified brand name and its indexed brand_key on grouped products"""
+    for g in grouped:
+        g["brand_name"] = resolve_brand(g.get("category"), g.get("brand"))
+        g["brand_key"] = make_brand_key(g["brand_name"])
+
+async def seed_brand_mappings():
+    """Create shop_brand_mappings from BRAND_UNIFICATION the first time"""
+    if await db[BRAND_MAPPINGS_COLLECTION].count_documents({}) > 0:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db[BRAND_MAPPINGS_COLLECTION].insert_many([
+        {"variant": variant.upper(), "brand": unified, "updated_at": now}
+        for unified, variants in BRAND_UNIFICATION.items()
+        for variant in variants
+    ])
+    logger.info("Seeded brand mappings from BRAND_UNIFICATION")
+
+async def load_brand_mappings():
+    """Reload the variant -> unified brand mapping from MongoDB"""
+    global brand_mappings
+    try:
+        docs = await db[BRAND_MAPPINGS_COLLECTION].find({}, {"_id": 0, "variant": 1, "brand": 1}).to_list(None)
+        brand_mappings = {d["variant"].upper(): d["brand"] for d in docs if d.get("variant") and d.get("brand")}
+    except Exception as e:
+        logger.error(f"Error loading brand mappings: {str(e)}")
+
+async def refresh_brand_keys() -> int:
+    """Recompute brand_key on every grouped product after the mapping changed"""
+    async with catalog_lease():
+        await load_brand_mappings()
+        grouped = await db.shop_products_grouped.find(
+            {},
+            {"_id": 0, "grouped_id": 1, "category": 1, "brand": 1, "brand_key": 1, "brand_name": 1}
+        ).to_list(None)
+        operations = []
+        for g in grouped:
+            brand_name = resolve_brand(g.get("category"), g.get("brand"))
+            brand_key = make_brand_key(brand_name)
+            if g.get("brand_key") != brand_key or g.get("brand_name") != brand_name:
+                operations.append(UpdateOne(
+                    {"grouped_id": g["grouped_id"]},
+                    {"$set": {"brand_key": brand_key, "brand_name": brand_name}}
+                ))
+        for i in range(0, len(operations), SYNC_WRITE_BATCH_SIZE):
+            await db.shop_products_grouped.bulk_write(operations[i:i + SYNC_WRITE_BATCH_SIZE], ordered=False)
+        if operations:
+            logger.info(f"Updated brand keys of {len(operations)} grouped products")
+            # brand_key is not part of the storefront view, clients have nothing to update
+            await bump_catalog_version({"upserted": [], "removed": []})
+    return len(operations)
+
+async def find_grouped_product(product_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+    """Find a grouped product by its stable ID, falling back to legacy ID aliases"""
+    projection = projection or {"_id": 0}
+    product = await db.shop_products_grouped.find_one({"grouped_id": product_id}, projection)
+    if product or not product_id or not product_id.startswith("grp_"):
+        return product
+    
+    alias = await db.shop_grouped_id_aliases.find_one({"legacy_id": product_id}, {"_id": 0, "grouped_id": 1})
+    if not alias:
+        return None
+    return await db.shop_products_grouped.find_one({"grouped_id": alias["grouped_id"]}, projection)
+
+def catalog_lease(wait_seconds: float = CATALOG_LEASE_WAIT_SECONDS):
+    """Hold the grouped catalog lease; raises LeaseBusy if a rebuild keeps it past wait_seconds"""
+    return lease(db, CATALOG_LEASE, CATALOG_LEASE_SECONDS, wait_seconds)
+
+def catalog_busy_error(e: LeaseBusy) -> HTTPException:
+    logger.warning(f"Grouped catalog edit rejected: {str(e)}")
+    return HTTPException(status_code=503, detail="El catálogo se está actualizando, intentá de nuevo en unos segundos")
+
+async def edit_grouped_products(operations: list, query: dict):
+    """Apply admin edits to grouped products and refresh the views matching query
+
+    Holds the catalog lease, so a running rebuild cannot swap the collection
+    and drop the edit; answers 503 if the rebuild does not finish in time.
+    """
+    try:
+        async with catalog_lease():
+            result = await db.shop_products_grouped.bulk_write(operations, ordered=False)
+            await refresh_storefront_views(query)
+    except LeaseBusy as e:
+        raise catalog_busy_error(e)
+    return result
+
+async def _load_existing_grouped(query: dict) -> Dict[str, dict]:
+    projection = {"_id": 0, "base_model": 1, "grouped_id": 1, "view": 1}
+    projection.update({field: 1 for field in ADMIN_GROUPED_FIELDS})
+    docs = await db.shop_products_grouped.find(query, projection).to_list(None)
+    return {d["base_model"]: d for d in docs if d.get("base_model") is not None}
+
+async def create_grouped_products(base_models: Optional[set] = None):
+    """Create grouped products collection from individual products
     
-    grouped = await db.shop_products.aggregate(pipeline).to_list(5000)
+    With base_models, only those models are regrouped and upserted in place.
+    Without it, the whole catalog is rebuilt into a staging collection that is
+    swapped in with an atomic rename, so the storefront never sees an empty or
+    partial catalog. Admin-edited fields (images, custom name/price...) are
+    preserved in both cases, and grouped_id is derived from the model so it
+    does not change between rebuilds.
+    """
+    if base_models is not None:
+        return await regroup_base_models(base_models)
+    
+    async with catalog_lease(wait_seconds=CATALOG_LEASE_SECONDS):
+        return await rebuild_grouped_products()
+
+async def rebuild_grouped_products() -> int:
+    """Full rebuild of shop_products_grouped; call with the catalog lease held"""
+    logger.info("Creating grouped products (full rebuild)...")
+    
+    # Staging collections left behind by crashed rebuilds (none can be running, we hold the lease)
+    for name in await db.list_collection_names():
+        if name.startswith(f"{GROUPED_STAGING_COLLECTION}_"):
+            await db[name].drop()
+    
+    existing = await _load_existing_grouped({})
+    logger.info(f"Preserving admin fields for {len(existing)} grouped products")
+    
+    grouped = await db.shop_products.aggregate(
+        build_grouping_pipeline({"stock": {"$gt": 0}})
+    ).to_list(None)
+    
+    if not grouped:
+        logger.warning("No products in stock, clearing grouped products")
+        await db.shop_products_grouped.delete_many({})
+        await bump_catalog_version(diff_grouped([], existing))
+        return 0
+    
+    aliases = merge_grouped_state(grouped, existing)
+    await load_brand_mappings()
+    apply_brand_keys(grouped)
+    apply_storefront_views(grouped)
+    changes = diff_grouped(grouped, existing)
+    
+    # Build the new catalog aside and swap it in atomically
+    staging = db[f"{GROUPED_STAGING_COLLECTION}_{uuid.uuid4().hex[:12]}"]
+    try:
+        await staging.insert_many(grouped)
+        await staging.create_index("grouped_id")
+        await staging.create_index("base_model")
+        await staging.create_index("brand_key")
+        await staging.rename("shop_products_grouped", dropTarget=True)
+    except Exception:
+        await staging.drop()
+        raise
+    await save_grouped_id_aliases(aliases)
+    await bump_catalog_version(changes)
     
-    # Clear and recreate grouped products collection
-    await db.shop_products_grouped.delete_many({})
+    logger.info(f"Created {len(grouped)} grouped products, restored {len([g for g in grouped if g.get('custom_image')])} custom images")
     
-    if grouped:
-        # Add a unique ID to each grouped product and restore custom images
-        for i, g in enumerate(grouped):
-            g["grouped_id"] = f"grp_{i}"
-            g.pop("_id", None)
-            
-            # Restore custom image if it exists
-            base_model = g.get("base_model")
-            if base_model and base_model in existing_custom_images:
-                g["custom_image"] = existing_custom_images[base_model]["custom_image"]
-                g["image_updated_at"] = existing_custom_images[base_model].get("image_updated_at")
+    return len(grouped)
+
+async def regroup_base_models(base_models: set, wait_seconds: float = CATALOG_LEASE_WAIT_SECONDS) -> int:
+    """Regroup only the given base models, upserting or removing their grouped documents"""
+    base_models = [m for m in base_models if m is not None]
+    if not base_models:
+        return await db.shop_products_grouped.count_documents({})
+    
+    logger.info(f"Regrouping {len(base_models)} changed models...")
+    
+    async with catalog_lease(wait_seconds):
+        existing = await _load_existing_grouped({"base_model": {"$in": base_models}})
+        grouped = await db.shop_products.aggregate(
+            build_grouping_pipeline({"stock": {"$gt": 0}, "base_model": {"$in": base_models}})
+        ).to_list(None)
         
-        await db.shop_products_grouped.insert_many(grouped)
-        logger.info(f"Created {len(grouped)} grouped products, restored {len([g for g in grouped if g.get('custom_image')])} custom images")
+        aliases = merge_grouped_state(grouped, existing)
+        await load_brand_mappings()
+        apply_brand_keys(grouped)
+        apply_storefront_views(grouped)
+        
+        operations = [ReplaceOne({"base_model": g["base_model"]}, g, upsert=True) for g in grouped]
+        
+        # Models without stock left drop out of the storefront, like in a full rebuild
+        in_stock = {g["base_model"] for g in grouped}
+        sold_out = [m for m in base_models if m not in in_stock]
+        if sold_out:
+            operations.append(DeleteMany({"base_model": {"$in": sold_out}}))
+        
+        if operations:
+            await db.shop_products_grouped.bulk_write(operations, ordered=False)
+            await bump_catalog_version(diff_grouped(grouped, existing))
+        await save_grouped_id_aliases(aliases)
     
-    return len(grouped)
+    logger.info(f"Regrouped {len(grouped)} models, removed {len(sold_out)} without stock")
+    
+    return await db.shop_products_grouped.count_documents({})
+
+async def regroup_models_soon(base_models: set):
+    """Regroup models now, or in the background once a running rebuild releases the catalog
+
+    For request handlers that already changed shop_products and must not wait
+    for a whole rebuild (ERP pushes).
+    """
+    try:
+        await regroup_base_models(base_models)
+    except LeaseBusy:
+        logger.info(f"Catalog busy, regrouping {len(base_models)} models in the background")
+        mark_models_dirty(base_models)
+
+def mark_models_dirty(base_models):
+    """Queue models for the next background regroup
+
+    Changes that arrive while a regroup is pending share it, so a burst of
+    checkouts costs one regroup and one catalog version bump.
+    """
+    global dirty_models_task
+    dirty_models.update(m for m in base_models if m is not None)
+    if dirty_models and (dirty_models_task is None or dirty_models_task.done()):
+        dirty_models_task = asyncio.create_task(regroup_dirty_models())
+
+async def regroup_dirty_models():
+    while dirty_models:
+        await asyncio.sleep(DIRTY_MODELS_REGROUP_DELAY_SECONDS)
+        models = set(dirty_models)
+        dirty_models.clear()
+        try:
+            await regroup_base_models(models, wait_seconds=CATALOG_LEASE_SECONDS)
+        except Exception as e:
+            logger.error(f"Error regrouping {len(models)} models: {str(e)}")
+            dirty_models.update(models)
+
+# ==================== CATALOG SNAPSHOT ====================
+
+async def read_catalog_version():
+    """Current catalog version and when it was last changed"""
+    meta = await db[CATALOG_META_COLLECTION].find_one({"_id": CATALOG_META_ID})
+    if not meta:
+        return 0, None
+    return meta.get("version", 0), meta.get("updated_at")
+
+async def load_catalog_snapshot(version: int, updated_at: Optional[str]) -> CatalogSnapshot:
+    """Build the in-memory catalog from the in-stock grouped products"""
+    await load_brand_mappings()
+    settings = await db.admin_settings.find_one({"_id": "global"})
+    show_only_with_images = settings.get("show_only_products_with_images", False) if settings else False
+    products = await db.shop_products_grouped.find(
+        {"total_stock": {"$gt": 0}},
+        {"_id": 0, "variants": 0}
+    ).to_list(None)
+    facets = await db[CATALOG_FACETS_COLLECTION].find_one({"_id": CATALOG_FACETS_ID, "version": version})
+    return CatalogSnapshot(
+        version, updated_at, products, grouped_storefront_item,
+        show_only_with_images=show_only_with_images,
+        brand_label=unify_brand,
+        facet_cells=facets["cells"] if facets else None
+    )
+
+catalog_store = CatalogStore(read_catalog_version, load_catalog_snapshot, CATALOG_VERSION_CHECK_SECONDS)
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_ENTRIES)
+
+async def catalog_response(request: Optional[Request], build):
+    """Serve a storefront read with the catalog version's ETag and response cache
+
+    Responses only change with the catalog version, so a matching If-None-Match
+    gets a 304 and repeated queries reuse the serialized body. Direct calls
+    (no request) and requests before the first snapshot is loaded just build.
+    """
+    if request is None:
+        return await build()
+    snapshot = await catalog_store.get()
+    if snapshot is None:
+        return await build()
+    return await serve_versioned(request, response_cache, snapshot.version, build)
+
+async def bump_catalog_version(changes: Optional[Dict[str, List[str]]] = None):
+    """Mark the grouped catalog as changed so every worker reloads its snapshot
+
+    Call after any write to shop_products_grouped or to settings that affect the listing.
+    `changes` ({"upserted": [grouped_id], "removed": [grouped_id]}) goes to the
+    change log behind /catalog/changes; without it clients of the delta API
+    are told to reload the catalog.
+    The facet counts of the new version are materialized here, once, for all workers.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        meta = await db[CATALOG_META_COLLECTION].find_one_and_update(
+            {"_id": CATALOG_META_ID},
+            {"$inc": {"version": 1}, "$set": {"updated_at": now.isoformat()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        await db[CATALOG_CHANGES_COLLECTION].insert_one({
+            "_id": meta["version"],
+            "at": now,
+            "reset": changes is None,
+            "upserted": (changes or {}).get("upserted", []),
+            "removed": (changes or {}).get("removed", [])
+        })
+        await catalog_store.refresh()
+        snapshot = catalog_store.snapshot
+        if snapshot is not None and snapshot.version == meta["version"]:
+            await db[CATALOG_FACETS_COLLECTION].replace_one(
+                {"_id": CATALOG_FACETS_ID},
+                {"version": snapshot.version, "built_at": now.isoformat(), "cells": snapshot.facets.cells},
+                upsert=True
+            )
+    except Exception as e:
+        logger.error(f"Error bumping catalog version: {str(e)}")
+        catalog_store.invalidate()
 
 # ==================== SYNC FUNCTIONS ====================
 
-async def sync_products_from_erp():
-    """Sync ALL products from ERP to MongoDB with pagination"""
+async def sync_products_from_erp(full: bool = False):
+    """Sync ALL products from ERP to MongoDB with pagination
+
+    Pages are streamed: each fetched page is transformed and written before more
+    pages are buffered, so memory stays flat regardless of catalog size. Every
+    written page is checkpointed; a sync interrupted by failed pages or a restart
+    resumes from the missing pages on the next run.
+
+    In delta mode (default) only new or changed products are written, using
+    bulk_write batches. Pass full=True (or set ERP_SYNC_MODE=full) to rewrite
+    every product regardless of its stored content hash.
+
+    Every run, failed ones included, is summarized with per-phase timings and
+    the ERP page latency histogram in shop_sync_runs (see /sync-status).
+    """
     global sync_status
     
     if sync_status["syncing"]:
@@ -424,99 +1027,183 @@ async def sync_products_from_erp():
         return
     
     sync_status["syncing"] = True
-    logger.info("Starting FULL product sync from ERP...")
+    force = full or SYNC_MODE == 'full'
+    stats = new_sync_stats('full' if force else 'delta')
+    stats["status"] = "running"
+    sync_started_at = datetime.now(timezone.utc)
+    metrics = SyncMetrics()
+    erp = None
     
     try:
-        all_products = []
-        page = 1
-        per_page = 500  # Products per page
-        
-        async with httpx.AsyncClient(timeout=180) as client:
-            # First, get total count
-            response = await client.post(
-                f"{ENCOM_API_URL}/products",
-                headers={
-                    "Content-Type": "application/json",
-                    "Authorization": f"Bearer {ENCOM_API_TOKEN}"
-                },
-                json={"limit": 1, "page": 1}
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"ERP API error: {response.status_code}")
+        async with ErpProductsClient(
+            ENCOM_API_URL,
+            ENCOM_API_TOKEN,
+            per_page=ERP_PAGE_SIZE,
+            max_concurrency=ERP_MAX_CONCURRENCY
+        ) as erp:
+            # First page also tells us the total count
+            try:
+                with metrics.phase("fetch"):
+                    first_page = await erp.fetch_page(1)
+            except ErpPageError as e:
+                logger.error(f"ERP API error: {e.reason}")
+                stats["status"] = "failed"
+                stats["error"] = f"ERP page 1: {e.reason}"
                 return
             
-            data = response.json()
-            total_products = data.get('total', 0)
-            total_pages = math.ceil(total_products / per_page)
-            
-            logger.info(f"ERP has {total_products} products in {total_pages} pages")
+            total_products = first_page.get('total', 0)
+            total_pages = math.ceil(total_products / ERP_PAGE_SIZE)
+            first_products = first_page.get('data', [])
+            del first_page
             
-            # Fetch all pages
-            for page in range(1, total_pages + 1):
-                logger.info(f"Fetching page {page}/{total_pages}...")
-                
-                response = await client.post(
-                    f"{ENCOM_API_URL}/products",
-                    headers={
-                        "Content-Type": "application/json",
-                        "Authorization": f"Bearer {ENCOM_API_TOKEN}"
-                    },
-                    json={"limit": per_page, "page": page}
-                )
-                
-                if response.status_code != 200:
-                    logger.error(f"ERP API error on page {page}: {response.status_code}")
-                    continue
-                
-                page_data = response.json()
-                products = page_data.get('data', [])
-                all_products.extend(products)
-                
-                # Small delay to not overwhelm the API
-                await asyncio.sleep(0.5)
-            
-            if not all_products:
+            if not first_products:
                 logger.warning("No products received from ERP")
+                stats["status"] = "empty"
                 return
             
-            logger.info(f"Fetched {len(all_products)} products, saving to MongoDB...")
+            checkpoint = await load_resumable_checkpoint(stats["mode"], total_products)
+            if checkpoint:
+                run_id = checkpoint["run_id"]
+                completed_pages = set(checkpoint.get("completed_pages", []))
+                stats["resumed_pages"] = len(completed_pages)
+                logger.info(f"Resuming sync {run_id}: {len(completed_pages)}/{total_pages} pages already written")
+            else:
+                run_id = f"sync_{uuid.uuid4().hex[:12]}"
+                completed_pages = set()
+                await start_checkpoint(run_id, stats["mode"], total_products, total_pages)
             
-            # Transform and upsert products in batches
-            for i, p in enumerate(all_products):
-                transformed = transform_product(p)
-                await db.shop_products.update_one(
-                    {"product_id": transformed["product_id"]},
-                    {"$set": transformed},
-                    upsert=True
-                )
-                
-                # Log progress every 500 products
-                if (i + 1) % 500 == 0:
-                    logger.info(f"Saved {i + 1}/{len(all_products)} products...")
+            stats["run_id"] = run_id
+            stats["total_pages"] = total_pages
+            changed_models = set()
+            logger.info(f"Starting {stats['mode'].upper()} product sync {run_id}: {total_products} products in {total_pages} pages")
             
-            # Create grouped products
-            grouped_count = await create_grouped_products()
+            # Page 1 is already in hand, write it before fetching the rest
+            await apply_product_delta(first_products, run_id, stats, force=force, changed_models=changed_models, metrics=metrics)
+            with metrics.phase("checkpoint"):
+                await mark_page_completed(1)
+            stats["fetched"] += len(first_products)
+            del first_products
             
-            sync_status["last_sync"] = datetime.now(timezone.utc).isoformat()
-            sync_status["product_count"] = len(all_products)
-            sync_status["grouped_count"] = grouped_count
+            # Stream remaining pages: fetch -> transform -> bulk write -> checkpoint.
+            # "fetch_wait" is the time spent waiting for the next page, i.e. how
+            # far the ERP is behind the writes
+            remaining_pages = [p for p in range(2, total_pages + 1) if p not in completed_pages]
+            waiting_since = time.monotonic()
+            async for page, products in erp.iter_pages(remaining_pages):
+                metrics.add("fetch_wait", time.monotonic() - waiting_since)
+                await apply_product_delta(products, run_id, stats, force=force, changed_models=changed_models, metrics=metrics)
+                with metrics.phase("checkpoint"):
+                    await mark_page_completed(page)
+                stats["fetched"] += len(products)
+                logger.info(f"Synced page {page}/{total_pages}")
+                waiting_since = time.monotonic()
             
-            logger.info(f"Product sync completed: {len(all_products)} products, {grouped_count} grouped")
+            stats["failed_pages"] = sorted(erp.failed_pages)
+        
+        # Only prune products when every page was received, otherwise a
+        # failed page would look like a batch of deleted products. A resumed run
+        # does not prune either: pages written before the interruption were read
+        # at other offsets, so products that moved onto them since were not seen.
+        # The next complete run removes whatever is really gone.
+        if stats["failed_pages"]:
+            logger.warning(f"Skipping removal of missing products, failed pages: {stats['failed_pages']}")
+        elif stats.get("resumed_pages"):
+            logger.info("Skipping removal of missing products after a resumed sync")
+            await finish_checkpoint()
+        else:
+            with metrics.phase("remove"):
+                await remove_products_missing_from_erp(run_id, stats, changed_models)
+                await finish_checkpoint()
+            # Every product was read from the ERP during this run: sales invoiced
+            # before it started are in its stock now and stop holding units
+            absorbed = await absorb_committed_holds(db, sync_started_at, COMMITTED_HOLD_MAX_DAYS)
+            changed_models |= await hold_models(absorbed)
+        
+        # Regroup only what changed; rebuild everything after a full or resumed
+        # sync, or when so much changed that per-model upserts cost more
+        grouped_count = await db.shop_products_grouped.count_documents({})
+        stats["changed_models"] = len(changed_models)
+        needs_full_rebuild = (
+            force
+            or stats.get("resumed_pages")
+            or grouped_count == 0
+            or len(changed_models) > grouped_count * INCREMENTAL_REGROUP_MAX_RATIO
+        )
+        with metrics.phase("regroup"):
+            if needs_full_rebuild:
+                stats["regroup"] = "full"
+                grouped_count = await create_grouped_products()
+            elif changed_models:
+                stats["regroup"] = "incremental"
+                grouped_count = await create_grouped_products(changed_models)
+            else:
+                stats["regroup"] = "skipped"
+        
+        stats["status"] = "partial" if stats["failed_pages"] else "completed"
+        stats["finished_at"] = datetime.now(timezone.utc).isoformat()
+        sync_status["last_sync"] = stats["finished_at"]
+        sync_status["product_count"] = stats["fetched"]
+        sync_status["grouped_count"] = grouped_count
+        
+        logger.info(
+            f"Product sync completed: {stats['fetched']} products "
+            f"(inserted={stats['inserted']}, changed={stats['changed']}, "
+            f"unchanged={stats['unchanged']}, removed={stats['removed']}), {grouped_count} grouped"
+        )
             
     except Exception as e:
         logger.error(f"Error syncing products: {str(e)}")
+        stats["status"] = "failed"
+        stats["error"] = str(e)
     finally:
+        await finish_sync_run(stats, metrics, erp)
         sync_status["syncing"] = False
 
+async def finish_sync_run(stats: dict, metrics: SyncMetrics, erp: Optional[ErpProductsClient]):
+    """Attach timings, ERP figures and the diff size to the run stats and store them"""
+    stats["finished_at"] = stats["finished_at"] or datetime.now(timezone.utc).isoformat()
+    stats["diff_size"] = stats["inserted"] + stats["changed"] + stats["removed"]
+    stats["timings"] = metrics.to_dict()
+    if erp is not None:
+        stats["erp"] = {
+            "retries": erp.retries,
+            "final_concurrency": erp.limiter.limit,
+            "page_latency": erp.page_latencies.to_dict()
+        }
+    sync_status["last_stats"] = stats
+    try:
+        await record_sync_run(db, stats, SYNC_HISTORY_SIZE)
+    except Exception as e:
+        logger.error(f"Error recording sync run: {str(e)}")
+
 async def background_sync_loop():
     """Background task that syncs products periodically"""
     while True:
         await asyncio.sleep(SYNC_INTERVAL_SECONDS)
         await sync_products_from_erp()
 
+async def stock_hold_release_loop():
+    """Background task that gives back the stock of holds nobody paid or confirmed"""
+    while True:
+        await asyncio.sleep(STOCK_HOLD_RELEASE_INTERVAL_SECONDS)
+        try:
+            await mark_hold_models_dirty(await release_expired_holds(db))
+        except Exception as e:
+            logger.error(f"Error releasing expired stock holds: {str(e)}")
+
 async def start_sync_on_startup():
     """Initial sync and start background loop"""
+    await ensure_shop_indexes()
+    await seed_brand_mappings()
+    
+    # Grouped products from before brand keys existed get them now
+    if await db.shop_products_grouped.find_one({"brand_key": {"$exists": False}}, {"_id": 1}):
+        await refresh_brand_keys()
+    
+    # Same for the stored storefront view (also cleared by image migration scripts)
+    if await db.shop_products_grouped.find_one({"view": {"$exists": False}}, {"_id": 1}):
+        await refresh_storefront_views({"view": {"$exists": False}})
+    
     # Check if we have grouped products
     grouped_count = await db.shop_products_grouped.count_documents({})
     
@@ -536,6 +1223,7 @@ async def start_sync_on_startup():
     
     # Start periodic sync
     asyncio.create_task(background_sync_loop())
+    asyncio.create_task(stock_hold_release_loop())
 
 # ==================== MODELS ====================
 
@@ -564,11 +1252,20 @@ class CheckoutData(BaseModel):
     delivery_address: Optional[DeliveryAddress] = None
     payment_method: str = "bancard"
     notes: Optional[str] = None
+    coupon_code: Optional[str] = None
 
 class DeliveryCalculation(BaseModel):
     lat: float
     lng: float
 
+class DeliveryPoint(BaseModel):
+    id: Optional[str] = None
+    lat: float
+    lng: float
+
+class DeliveryBatchCalculation(BaseModel):
+    points: Optional[List[DeliveryPoint]] = None  # Without points, the user's saved addresses are quoted
+
 class InventoryValidationItem(BaseModel):
     product_id: str
     sku: Optional[str] = None
@@ -581,6 +1278,207 @@ class InventoryValidationRequest(BaseModel):
 
 # ==================== INVENTORY VALIDATION ====================
 
+def parse_stock(value) -> int:
+    """ERP stock as an int (it sometimes arrives as a string)"""
+    if isinstance(value, str):
+        try:
+            return int(float(value))
+        except (ValueError, TypeError):
+            return 0
+    return value or 0
+
+async def find_grouped_products(product_ids: List[str], projection: dict) -> Dict[str, dict]:
+    """Grouped products by the requested ID in one $in query
+
+    Legacy positional IDs are resolved through their aliases with a second
+    query, only when some requested IDs were not found.
+    """
+    if not product_ids:
+        return {}
+    found = {
+        p["grouped_id"]: p
+        for p in await db.shop_products_grouped.find(
+            {"grouped_id": {"$in": product_ids}}, {**projection, "grouped_id": 1}
+        ).to_list(None)
+    }
+    missing = [pid for pid in product_ids if pid not in found]
+    if missing:
+        aliases = await db.shop_grouped_id_aliases.find(
+            {"legacy_id": {"$in": missing}}, {"_id": 0, "legacy_id": 1, "grouped_id": 1}
+        ).to_list(None)
+        if aliases:
+            targets = {
+                p["grouped_id"]: p
+                for p in await db.shop_products_grouped.find(
+                    {"grouped_id": {"$in": [a["grouped_id"] for a in aliases]}}, {**projection, "grouped_id": 1}
+                ).to_list(None)
+            }
+            for a in aliases:
+                if a["grouped_id"] in targets:
+                    found[a["legacy_id"]] = targets[a["grouped_id"]]
+    return found
+
+async def resolve_cart_items(items: list) -> List[dict]:
+    """Current product, stock and price of every cart line in constant round-trips
+
+    Grouped IDs (grp_...) are looked up with one $in query on grouped_id and
+    individual variants with one $in query over sku and product_id (both
+    indexed); each line is then matched in memory by SKU first, then by
+    product ID, then by a product ID that is really a SKU. Legacy grouped IDs
+    add two queries (their aliases, then the products they point to), so a
+    cart takes two queries, or four when it holds legacy IDs.
+    """
+    grouped_ids = list({item.product_id for item in items if item.product_id and item.product_id.startswith('grp_')})
+    variant_keys = list({
+        key
+        for item in items if not (item.product_id and item.product_id.startswith('grp_'))
+        for key in (item.sku, item.product_id) if key
+    })
+    
+    grouped = await find_grouped_products(
+        grouped_ids,
+        {"_id": 0, "base_model": 1, "total_stock": 1, "price": 1, "view": 1, "variants": 1}
+    )
+    by_sku: Dict[str, dict] = {}
+    by_product_id: Dict[str, dict] = {}
+    if variant_keys:
+        variants = await db.shop_products.find(
+            {"$or": [{"sku": {"$in": variant_keys}}, {"product_id": {"$in": variant_keys}}]},
+            {"_id": 0, "product_id": 1, "sku": 1, "name": 1, "stock": 1, "existencia": 1, "reserved": 1, "price": 1, "image": 1}
+        ).to_list(None)
+        for v in variants:
+            if v.get("sku"):
+                by_sku.setdefault(v["sku"], v)
+            if v.get("product_id"):
+                by_product_id.setdefault(v["product_id"], v)
+    
+    lines = []
+    for item in items:
+        if item.product_id and item.product_id.startswith('grp_'):
+            product = grouped.get(item.product_id)
+            view = (product or {}).get("view") or {}
+            lines.append({
+                "item": item,
+                "product": product,
+                "is_grouped": True,
+                "stock": parse_stock(product.get("total_stock", 0)) if product else 0,
+                "name": view.get("name") or (product or {}).get("base_model"),
+                "price": view.get("price") or (product or {}).get("price"),
+                "image": view.get("image")
+            })
+        else:
+            product = (
+                (by_sku.get(item.sku) if item.sku else None)
+                or by_product_id.get(item.product_id)
+                or by_sku.get(item.product_id)
+            )
+            lines.append({
+                "item": item,
+                "product": product,
+                "is_grouped": False,
+                # Stock held by open checkouts is not available to this cart
+                "stock": (
+                    parse_stock(product.get('stock', product.get('existencia', 0))) - parse_stock(product.get('reserved'))
+                    if product else 0
+                ),
+                "name": (product or {}).get("name"),
+                "price": (product or {}).get("price"),
+                "image": (product or {}).get("image")
+            })
+    return lines
+
+def hold_variant_id(line: dict) -> Optional[str]:
+    """Variant (shop_products.product_id) a resolved cart line takes its stock from
+
+    Variant lines are that variant. Grouped lines use the variant of the
+    selected size, or the only / best stocked variant when no size was chosen.
+    """
+    product = line["product"]
+    if not product:
+        return None
+    if not line["is_grouped"]:
+        return product.get("product_id")
+    variants = [v for v in product.get("variants") or [] if v.get("product_id")]
+    size = (line["item"].size or "").strip().upper()
+    if size:
+        variants = [v for v in variants if (v.get("size") or "").upper() == size]
+    if not variants:
+        return None
+    return max(variants, key=lambda v: parse_stock(v.get("stock")))["product_id"]
+
+async def hold_checkout_stock(order_id: str, items: list, ttl_minutes: float) -> dict:
+    """Reserve the stock of every cart line for an order (all or nothing)
+
+    Raises HTTPException 409 naming the first line that cannot be served.
+    """
+    lines = await resolve_cart_items(items)
+    hold_lines = []
+    for line in lines:
+        variant_id = hold_variant_id(line)
+        if not variant_id:
+            raise HTTPException(
+                status_code=409,
+                detail=f"{line['item'].name or line['name'] or 'Un producto'} ya no está disponible"
+            )
+        hold_lines.append({"product_id": variant_id, "quantity": line["item"].quantity, "line": line})
+    
+    try:
+        hold = await reserve_stock(
+            db, order_id,
+            [{"product_id": h["product_id"], "quantity": h["quantity"]} for h in hold_lines],
+            ttl_minutes
+        )
+    except StockUnavailable as e:
+        line = next(h["line"] for h in hold_lines if h["product_id"] == e.line["product_id"])
+        name = line["item"].name or line["name"] or "Un producto"
+        size = f" (talle {line['item'].size})" if line["item"].size else ""
+        logger.warning(f"Checkout {order_id} rejected: {str(e)}")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Sin stock suficiente para {name}{size}: quedan {e.available} unidades"
+        )
+    await mark_hold_models_dirty([hold])
+    return hold
+
+async def hold_models(holds: list) -> set:
+    """Base models of the variants in the given holds"""
+    variant_ids = list({line["product_id"] for hold in holds if hold for line in hold["lines"]})
+    if not variant_ids:
+        return set()
+    return set(await db.shop_products.distinct("base_model", {"product_id": {"$in": variant_ids}}))
+
+async def mark_hold_models_dirty(holds: list):
+    """Reserving or releasing units changes what the storefront can show as available
+
+    The grouped products catch up in the next background regroup; checkouts
+    themselves always check stock - reserved on the variant.
+    """
+    mark_models_dirty(await hold_models(holds))
+
+async def release_order_stock(order_id: str, reason: str):
+    """Release the order's stock hold and show the units for sale again"""
+    await mark_hold_models_dirty([await release_hold(db, order_id, reason)])
+
+async def apply_order_status_to_stock(order_id: str, status: Optional[str]):
+    """Commit or release the order's stock hold when its status calls for it
+
+    Committing leaves availability unchanged (the units stay reserved until
+    the ERP reports the sale, see absorb_committed_holds), so no regroup.
+    """
+    if status in ORDER_STATUSES_COMMITTING_STOCK:
+        await commit_hold(db, order_id, status)
+        if status == ORDER_STATUS_INVOICED:
+            await mark_hold_invoiced(db, order_id)
+    elif status in ORDER_STATUSES_RELEASING_STOCK:
+        await release_order_stock(order_id, status)
+        await release_order_coupon(order_id, status)
+
+async def release_order_coupon(order_id: str, reason: str):
+    """Give back the order's coupon use; cached usage counts of every worker are outdated then"""
+    if await release_coupon(db, order_id, reason):
+        await bump_coupons_version(db)
+        coupon_cache.invalidate()
+
 @ecommerce_router.post("/validate-inventory")
 async def validate_inventory_before_checkout(data: InventoryValidationRequest):
     """
@@ -590,7 +1488,11 @@ async def validate_inventory_before_checkout(data: InventoryValidationRequest):
     
     Supports both:
     - Individual products (shop_products) with SKU
-    - Grouped products (shop_products_grouped) with grouped_id (e.g., grp_96)
+    - Grouped products (shop_products_grouped) with grouped_id (e.g., grp_3f9a1c2b7d4e,
+      legacy positional IDs like grp_96 are resolved through their alias)
+    
+    The whole cart is resolved with two queries, four with legacy grouped IDs
+    (see resolve_cart_items).
     """
     logger.info(f"Validating inventory for {len(data.items)} items before checkout...")
     
@@ -599,59 +1501,17 @@ async def validate_inventory_before_checkout(data: InventoryValidationRequest):
         out_of_stock_items = []
         available_items = []
         
-        for item in data.items:
-            product = None
-            stock = 0
-            is_grouped = False
-            
-            # Check if it's a grouped product ID (starts with 'grp_')
-            if item.product_id and item.product_id.startswith('grp_'):
-                is_grouped = True
-                # Search in grouped products collection
-                product = await db.shop_products_grouped.find_one(
-                    {"grouped_id": item.product_id},
-                    {"_id": 0, "grouped_id": 1, "base_model": 1, "total_stock": 1, "price": 1}
-                )
-                if product:
-                    stock = product.get('total_stock', 0)
-                    if isinstance(stock, str):
-                        try:
-                            stock = int(float(stock))
-                        except (ValueError, TypeError):
-                            stock = 0
-            else:
-                # Search by SKU if available (individual product)
-                if item.sku:
-                    product = await db.shop_products.find_one(
-                        {"sku": item.sku},
-                        {"_id": 0, "sku": 1, "name": 1, "stock": 1, "existencia": 1, "price": 1}
-                    )
-                
-                # If not found by SKU, try by product_id in individual products
-                if not product and item.product_id:
-                    product = await db.shop_products.find_one(
-                        {"$or": [
-                            {"product_id": item.product_id},
-                            {"sku": item.product_id}
-                        ]},
-                        {"_id": 0, "sku": 1, "name": 1, "stock": 1, "existencia": 1, "price": 1}
-                    )
-                
-                # Get stock value for individual products
-                if product:
-                    stock = product.get('stock', product.get('existencia', 0))
-                    if isinstance(stock, str):
-                        try:
-                            stock = int(float(stock))
-                        except (ValueError, TypeError):
-                            stock = 0
+        for line in await resolve_cart_items(data.items):
+            item = line["item"]
+            product = line["product"]
+            stock = line["stock"]
             
             # Check if enough stock
             if stock < item.quantity:
                 all_available = False
                 product_name = item.name
                 if product and not product_name:
-                    product_name = product.get('base_model') if is_grouped else product.get('name', 'Producto')
+                    product_name = product.get('base_model') if line["is_grouped"] else product.get('name', 'Producto')
                 
                 out_of_stock_items.append({
                     "product_id": item.product_id,
@@ -690,29 +1550,277 @@ async def validate_inventory_before_checkout(data: InventoryValidationRequest):
             "warning": "inventory_validation_failed"
         }
 
+@ecommerce_router.post("/resolve-cart")
+async def resolve_cart(data: InventoryValidationRequest):
+    """Current price and stock of every cart line in one round-trip
+    
+    Lets the cart refresh prices and flag unavailable lines without a request
+    per product. Lines that no longer exist come back with found=false.
+    """
+    lines = await resolve_cart_items(data.items)
+    return {
+        "lines": [
+            {
+                "product_id": line["item"].product_id,
+                "sku": line["item"].sku,
+                "size": line["item"].size,
+                "quantity": line["item"].quantity,
+                "found": line["product"] is not None,
+                "name": line["name"] or line["item"].name,
+                "price": line["price"],
+                "image": line["image"],
+                "stock": max(0, line["stock"]),
+                "available": line["product"] is not None and line["stock"] >= line["item"].quantity
+            }
+            for line in lines
+        ],
+        "all_available": all(line["product"] is not None and line["stock"] >= line["item"].quantity for line in lines)
+    }
+
 # ==================== SYNC ENDPOINTS ====================
 
+class ErpStockUpdate(BaseModel):
+    sku: Optional[str] = None
+    product_id: Optional[str] = None
+    stock: Optional[float] = None  # New absolute stock
+    stock_delta: Optional[float] = None  # Or a change relative to the current stock
+    price: Optional[float] = None
+
+class ErpStockPush(BaseModel):
+    # Required: retries and replays with the same ID are applied once (stock_delta is not idempotent)
+    event_id: str = Field(min_length=1, max_length=200)
+    updates: List[ErpStockUpdate]
+
+def erp_signature(secret: str, timestamp: str, body: bytes) -> str:
+    """HMAC-SHA256 the ERP sends in X-ERP-Signature: hex(hmac(secret, "<timestamp>.<body>"))"""
+    return hmac.new(secret.encode("utf-8"), timestamp.encode("utf-8") + b"." + body, hashlib.sha256).hexdigest()
+
+async def verify_erp_push(request: Request) -> bytes:
+    """Raw body of a correctly signed, recent ERP push; 401/503 otherwise"""
+    if not ERP_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="ERP push not configured")
+    body = await request.body()
+    timestamp = request.headers.get("X-ERP-Timestamp", "")
+    signature = request.headers.get("X-ERP-Signature", "")
+    try:
+        age = abs(time.time() - float(timestamp))
+    except ValueError:
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    expected = erp_signature(ERP_WEBHOOK_SECRET, timestamp, body)
+    if age > ERP_WEBHOOK_MAX_AGE_SECONDS or not hmac.compare_digest(expected, signature):
+        raise HTTPException(status_code=401, detail="Invalid signature")
+    return body
+
+async def apply_erp_stock_updates(updates: List[ErpStockUpdate]) -> dict:
+    """Apply per-SKU stock/price changes to shop_products and regroup only their models
+
+    Products are matched by SKU (or ERP product ID) with one $in query. The
+    content hash is recomputed, so the next ERP pull sees them as unchanged
+    when it agrees with the push.
+    """
+    keys = list({key for u in updates for key in (u.sku, u.product_id) if key})
+    if not keys:
+        return {"applied": 0, "unknown": [], "regrouped_models": 0}
+    products = await db.shop_products.find(
+        {"$or": [{"sku": {"$in": keys}}, {"product_id": {"$in": keys}}]},
+        {"_id": 0}
+    ).to_list(None)
+    by_sku = {p["sku"]: p for p in products if p.get("sku")}
+    by_product_id = {p["product_id"]: p for p in products if p.get("product_id")}
+    
+    changed: Dict[str, dict] = {}
+    unknown = []
+    for u in updates:
+        product = (by_sku.get(u.sku) if u.sku else None) or by_product_id.get(u.product_id or u.sku)
+        if not product:
+            unknown.append(u.sku or u.product_id)
+            continue
+        product = changed.get(product["product_id"], product)
+        if u.stock is not None:
+            product["stock"] = float(u.stock)
+        if u.stock_delta is not None:
+            product["stock"] = float(product.get("stock") or 0) + u.stock_delta
+        if u.price is not None:
+            product["price"] = float(u.price)
+        changed[product["product_id"]] = product
+    
+    now = datetime.now(timezone.utc).isoformat()
+    operations = []
+    for product_id, product in changed.items():
+        fingerprint = {k: product.get(k) for k in TRANSFORMED_FIELDS}
+        operations.append(UpdateOne(
+            {"product_id": product_id},
+            {"$set": {
+                "stock": product["stock"],
+                "price": product["price"],
+                "content_hash": compute_product_hash(fingerprint),
+                "updated_at": now
+            }}
+        ))
+    if operations:
+        await db.shop_products.bulk_write(operations, ordered=False)
+    
+    models = {p.get("base_model") for p in changed.values()}
+    if models:
+        await regroup_models_soon(models)
+    return {"applied": len(changed), "unknown": unknown, "regrouped_models": len(models)}
+
+@ecommerce_router.post("/erp/stock-updates")
+async def receive_erp_stock_updates(request: Request):
+    """Stock and price pushes from the ERP for single SKUs
+    
+    Signed with ERP_WEBHOOK_SECRET (X-ERP-Timestamp and X-ERP-Signature, see
+    erp_signature). Changes reach the storefront as soon as the affected
+    models are regrouped, without waiting for the next full pull.
+    """
+    body = await verify_erp_push(request)
+    try:
+        push = ErpStockPush.model_validate_json(body)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    try:
+        await db[ERP_EVENTS_COLLECTION].insert_one({
+            "_id": push.event_id,
+            "received_at": datetime.now(timezone.utc),
+            "updates": len(push.updates)
+        })
+    except DuplicateKeyError:
+        return {"duplicate": True, "applied": 0, "unknown": [], "regrouped_models": 0}
+    
+    try:
+        result = await apply_erp_stock_updates(push.updates)
+    except Exception:
+        # Let the ERP retry the event
+        await db[ERP_EVENTS_COLLECTION].delete_one({"_id": push.event_id})
+        raise
+    logger.info(f"ERP push {push.event_id}: {result['applied']} products, {len(result['unknown'])} unknown")
+    return {"duplicate": False, **result}
+
 @ecommerce_router.get("/sync-status")
-async def get_sync_status():
-    """Get product sync status"""
+async def get_sync_status(history: int = 10):
+    """Get product sync status and the newest `history` sync runs
+
+    Each run has its per-phase timings (fetch, fetch_wait, transform, lookup,
+    write, checkpoint, remove, regroup), the ERP page latency histogram,
+    retries and the diff size.
+    """
     count = await db.shop_products.count_documents({})
+    history = max(0, min(history, SYNC_HISTORY_SIZE))
     return {
         "last_sync": sync_status["last_sync"],
         "syncing": sync_status["syncing"],
-        "products_in_db": count
+        "products_in_db": count,
+        "last_stats": sync_status["last_stats"],
+        "history": await recent_sync_runs(db, history) if history else [],
+        "catalog_version": catalog_store.snapshot.version if catalog_store.snapshot else None,
+        "response_cache": response_cache.stats(),
+        "delivery_distances": delivery_distances.stats()
     }
 
 @ecommerce_router.post("/sync")
-async def force_sync():
-    """Force sync products from ERP"""
-    asyncio.create_task(sync_products_from_erp())
-    return {"message": "Sync started in background"}
+async def force_sync(full: bool = False):
+    """Force sync products from ERP (full=true rewrites every product)"""
+    asyncio.create_task(sync_products_from_erp(full=full))
+    return {"message": "Sync started in background", "mode": "full" if full else SYNC_MODE}
 
 # ==================== FILTERS ENDPOINT ====================
 
+def sort_sizes(sizes) -> list:
+    """Numeric sizes first (by value), then alphabetic"""
+    return sorted(sizes, key=size_rank)
+
+def facets_response(cube: FacetCube, brands: Optional[list], gender: str, size: str, band: str) -> dict:
+    """Filter options and counts for the products matching the given filters"""
+    brand_counts = cube.facet("brand", brands, gender=gender, size=size, band=band)
+    size_counts = cube.facet("size", brands, gender=gender, size=size, band=band)
+    gender_counts = cube.facet("gender", brands, gender=gender, size=size, band=band)
+    band_counts = cube.facet("band", brands, gender=gender, size=size, band=band)
+    
+    unified_counts = {}
+    for name, count in brand_counts.items():
+        if name:
+            unified = unify_brand(name)
+            unified_counts[unified] = unified_counts.get(unified, 0) + count
+    
+    return {
+        "categories": sorted(
+            [{"name": name, "count": count} for name, count in brand_counts.items() if name],
+            key=lambda c: -c["count"]
+        ),
+        "brands": sorted(
+            [{"name": name, "count": count} for name, count in unified_counts.items()],
+            key=lambda b: -b["count"]
+        ),
+        "sizes": sort_sizes(size_counts.keys()),
+        "size_counts": size_counts,
+        "genders": [
+            {"value": "mujer", "label": "Mujer", "count": gender_counts.get('mujer', 0)},
+            {"value": "hombre", "label": "Hombre", "count": gender_counts.get('hombre', 0)},
+            {"value": "unisex", "label": "Unisex", "count": gender_counts.get('unisex', 0)}
+        ],
+        "price_bands": [
+            {**band_def, "count": band_counts.get(band_def["key"], 0)}
+            for band_def in PRICE_BANDS
+        ],
+        "total": cube.count_brands(brands, gender=gender, size=size, band=band)
+    }
+
 @ecommerce_router.get("/filters")
-async def get_filters():
-    """Get available filter options from local DB - FAST"""
+async def get_filters(
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    gender: Optional[str] = None,
+    size: Optional[str] = None,
+    price_band: Optional[str] = None,
+    request: Request = None
+):
+    """Get available filter options with grouped product counts
+    
+    Served from the facet counts materialized for the current catalog version.
+    The optional filters return the counts for a filtered listing; each facet
+    ignores its own filter so the alternatives keep their counts.
+    """
+    return await catalog_response(request, lambda: filter_options(category, brand, gender, size, price_band))
+
+async def filter_options(
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    gender: Optional[str] = None,
+    size: Optional[str] = None,
+    price_band: Optional[str] = None
+):
+    cube = None
+    snapshot = await catalog_store.get()
+    if snapshot is not None:
+        cube = snapshot.facets
+    else:
+        facets = await db[CATALOG_FACETS_COLLECTION].find_one({"_id": CATALOG_FACETS_ID})
+        if facets:
+            cube = FacetCube(facets["cells"])
+    
+    if cube is None:
+        return await get_filters_from_db()
+    
+    brands = None
+    brand_filter = brand or category
+    if brand_filter:
+        try:
+            matches = brand_filter_matcher(brand_filter)
+            brands = [b for b in cube.values["brand"] if b and matches(b)]
+        except re.error:
+            brands = []
+    
+    return facets_response(
+        cube,
+        brands,
+        gender=gender or ANY,
+        size=size.upper() if size else ANY,
+        band=price_band or ANY
+    )
+
+async def get_filters_from_db():
+    """Get available filter options from local DB (variant counts, used before facets exist)"""
     try:
         # Get unique categories with count
         categories_pipeline = [
@@ -733,9 +1841,7 @@ async def get_filters():
         all_sizes = [s["_id"] for s in sizes_result if s["_id"]]
         
         # Sort sizes
-        numeric_sizes = sorted([s for s in all_sizes if s.isdigit()], key=int)
-        alpha_sizes = sorted([s for s in all_sizes if not s.isdigit()])
-        sorted_sizes = numeric_sizes + alpha_sizes
+        sorted_sizes = sort_sizes(all_sizes)
         
         # Get gender counts
         gender_pipeline = [
@@ -761,6 +1867,32 @@ async def get_filters():
 
 # ==================== PRODUCTS ENDPOINTS ====================
 
+def grouped_storefront_item(p: dict) -> dict:
+    """Listing representation of a grouped product (its stored view)"""
+    return p.get("view") or build_storefront_view(p)
+
+def brand_filter_matcher(brand_filter: str):
+    """Predicate over raw category/brand values for a brand filter
+
+    Unified brands match their mapped variants, anything else is a
+    case-insensitive pattern (used where no brand_key is available).
+    """
+    brand_key = make_brand_key(brand_filter)
+    if brand_key in unified_brand_keys():
+        return lambda value: make_brand_key(unify_brand(value)) == brand_key
+    pattern = re.compile(brand_filter, re.IGNORECASE)
+    return lambda value: bool(pattern.search(value))
+
+def products_page_response(result: list, total: Optional[int], page: int, limit: int, next_cursor: Optional[str] = None) -> dict:
+    return {
+        "products": result,
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "total_pages": (math.ceil(total / limit) if total > 0 else 1) if total is not None else None,
+        "next_cursor": next_cursor
+    }
+
 @ecommerce_router.get("/products")
 async def get_products(
     page: int = 1,
@@ -771,10 +1903,104 @@ async def get_products(
     size: Optional[str] = None,
     search: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None
+    max_price: Optional[float] = None,
+    price_band: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    request: Request = None
+):
+    """Get GROUPED products - shows unique models with sizes
+    
+    Served from the in-process catalog snapshot; falls back to MongoDB when
+    the snapshot is not available or a filter cannot be evaluated in memory.
+    `search` is accent-insensitive, matches every word (or word prefix) and
+    orders results by relevance.
+    For infinite scroll pass `cursor` (the next_cursor of the previous
+    response) instead of page; it costs the same at any depth.
+    Responses carry the catalog version ETag (304 on If-None-Match).
+    """
+    return await catalog_response(request, lambda: list_products(
+        page, limit, category, brand, gender, size, search, min_price, max_price, price_band, cursor, include_total
+    ))
+
+async def list_products(
+    page: int = 1,
+    limit: int = 20,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    gender: Optional[str] = None,
+    size: Optional[str] = None,
+    search: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    price_band: Optional[str] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
-    """Get GROUPED products from local MongoDB - shows unique models with sizes"""
+    """Listing page of grouped products (snapshot first, MongoDB as fallback)"""
+    band = next((b for b in PRICE_BANDS if b["key"] == price_band), None)
+    if band:
+        # Bands exclude their upper bound, prices are whole Guaraníes
+        min_price = band["min"] or min_price
+        max_price = band["max"] - 1 if band["max"] else max_price
+    
+    snapshot = await catalog_store.get()
+    if snapshot is not None:
+        try:
+            brand_filter = brand or category
+            brand_key = make_brand_key(brand_filter) if brand_filter else None
+            # Known brands are an equality lookup on brand_key, anything else a pattern
+            use_key = brand_key in snapshot.by_brand_key
+            positions = snapshot.filter(
+                brand_key=brand_key if use_key else None,
+                brand_match=brand_filter_matcher(brand_filter) if brand_filter and not use_key else None,
+                gender=gender,
+                size=size,
+                search=search,
+                min_price=min_price,
+                max_price=max_price
+            )
+            limit = max(1, limit)
+            start = snapshot.start_after(positions, decode_cursor(cursor)) if cursor else max(0, (page - 1) * limit)
+            next_cursor = snapshot.cursor_at(positions, start + limit, ranked=bool(search))
+            response = products_page_response(
+                snapshot.window(positions, start, limit),
+                len(positions),
+                page,
+                limit,
+                encode_cursor(next_cursor) if next_cursor else None
+            )
+            # What clients pass to /catalog/changes to keep this listing fresh
+            response["catalog_version"] = snapshot.version
+            return response
+        except re.error:
+            pass  # Brand pattern Python cannot compile, let MongoDB evaluate it
+    
+    return await get_products_from_db(
+        page, limit, category, brand, gender, size, search, min_price, max_price, cursor, include_total
+    )
+
+async def get_products_from_db(
+    page: int = 1,
+    limit: int = 20,
+    category: Optional[str] = None,
+    brand: Optional[str] = None,
+    gender: Optional[str] = None,
+    size: Optional[str] = None,
+    search: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True
+):
+    """Get GROUPED products straight from local MongoDB"""
     try:
+        skip = (page - 1) * limit
+        if cursor and "offset" in decode_cursor(cursor):
+            # Search cursor handed out by the snapshot, continue by position
+            skip = max(0, int(decode_cursor(cursor)["offset"]))
+            cursor = None
+        
         # Get admin settings for show_only_products_with_images
         settings = await db.admin_settings.find_one({"_id": "global"})
         show_only_with_images = settings.get("show_only_products_with_images", False) if settings else False
@@ -810,51 +2036,20 @@ async def get_products(
         # Support both 'category' and 'brand' parameters - search in both fields
         brand_filter = brand or category
         if brand_filter:
-            # Brand unification mappings - maps display names to actual ERP category patterns
-            BRAND_UNIFICATION = {
-                # AVENUE OUTLET - all outlet brands
-                'AVENUE OUTLET': [
-                    'AVENUE', 'AVENUE AK', 'BDA FACTORY', 'FRAME', 'GOOD AMERICAN',
-                    'JAZMIN CHEBAR', 'JUICY', 'KOSIUKO', 'LACOSTE', 'MARIA CHER',
-                    'MERSEA', 'QUIKSILVER', 'RICARDO ALMEIDA', 'ROTUNDA', 'RUSTY',
-                    'TOP DESIGN', 'VOYAGEUR', 'VITAMINA', 'HOWICK', 'EST1985'
-                ],
-                # SUN68 - all SUN variants
-                'SUN68': ['SUN68', 'SUN69', 'SUN70', 'SUN71', 'SUN72'],
-                # BODY SCULPT - variations
-                'BODY SCULPT': ['BODY SCULPT', 'BODYCULPT'],
-                # UNDISTURBED - variations
-                'UNDISTURBED': ['UNDISTURB3D', 'UNDISTURBED'],
-                # MARIA E MAKE UP - variations
-                'MARIA E MAKE UP': ['MARIA E MAKEUP', 'MARIA E MAKE UP'],
-                # AGUARA
-                'AGUARA': ['AGUARA FITWEAR', 'AGUARA'],
-                # DAVID SANDOVAL
-                'DAVID SANDOVAL': ['DS'],
-                # KARLA
-                'KARLA': ['KARLA RUIZ', 'KARLA'],
-            }
-            
-            # Check if this brand has a unification mapping
-            brand_upper = brand_filter.upper()
-            brand_or_conditions = []
-            if brand_upper in BRAND_UNIFICATION:
-                # Build $or query for all variants
-                variants = BRAND_UNIFICATION[brand_upper]
-                for variant in variants:
-                    brand_or_conditions.append({"category": {"$regex": f"^{variant}$", "$options": "i"}})
-                    brand_or_conditions.append({"brand": {"$regex": f"^{variant}$", "$options": "i"}})
+            brand_key = make_brand_key(brand_filter)
+            if brand_key in unified_brand_keys():
+                # Unified brands (see shop_brand_mappings): indexed equality on brand_key
+                query["brand_key"] = brand_key
             else:
                 # Standard search in both category and brand fields
                 brand_or_conditions = [
                     {"category": {"$regex": brand_filter, "$options": "i"}},
                     {"brand": {"$regex": brand_filter, "$options": "i"}}
                 ]
-            
-            # Add brand filter to $and conditions to combine with search
-            if "$and" not in query:
-                query["$and"] = []
-            query["$and"].append({"$or": brand_or_conditions})
+                # Add brand filter to $and conditions to combine with search
+                if "$and" not in query:
+                    query["$and"] = []
+                query["$and"].append({"$or": brand_or_conditions})
         
         if gender:
             query["gender"] = gender
@@ -873,122 +2068,52 @@ async def get_products(
                 query["price"] = {"$lte": max_price}
         
         # Get total count from grouped collection
-        total = await db.shop_products_grouped.count_documents(query)
-        
-        # Get paginated grouped products
-        skip = (page - 1) * limit
-        products = await db.shop_products_grouped.find(
-            query,
-            {"_id": 0}
-        ).sort("base_model", 1).skip(skip).limit(limit).to_list(limit)
+        total = await count_cache.count(db.shop_products_grouped, query) if include_total else None
         
-        # Transform for frontend
-        result = []
-        for p in products:
-            # Sort available sizes (handle None values)
-            available_sizes = p.get("available_sizes", [])
-            sizes_sorted = []
-            for s in available_sizes:
-                size_val = s.get("size") if s else None
-                if size_val:
-                    sizes_sorted.append(s)
-            
-            # Sort: numeric first, then alphabetic
-            sizes_sorted.sort(key=lambda x: (
-                0 if (x.get("size") or "").isdigit() else 1,
-                int(x.get("size") or "0") if (x.get("size") or "").isdigit() else (x.get("size") or "")
-            ))
-            
-            # Filter None from sizes_list
-            sizes_list = [s for s in p.get("sizes_list", []) if s]
-            
-            # Use Cloudinary URL if available, then custom_image, then ERP image
-            display_image = p.get("cloudinary_url") or p.get("custom_image") or p.get("image")
-            # Get all images (up to 3) - prefer cloudinary_images
-            all_images = p.get("cloudinary_images") or p.get("images", [])
-            if not all_images or not isinstance(all_images, list):
-                all_images = [display_image] if display_image else []
-            # Filter None values
-            all_images = [img for img in all_images if img]
-            
-            result.append({
-                "id": p.get("grouped_id"),
-                "name": p.get("custom_name") or p.get("base_model"),  # Use custom name if available
-                "full_name": p.get("name"),
-                "price": p.get("custom_price") or p.get("price"),
-                "max_price": p.get("max_price"),
-                "stock": p.get("total_stock"),
-                "image": display_image,
-                "images": all_images,  # All product images (up to 3)
-                "category": p.get("category"),
-                "brand": p.get("brand"),
-                "gender": p.get("gender"),
-                "discount": p.get("discount", 0),
-                "description": p.get("custom_description") or p.get("description"),
-                "available_sizes": sizes_sorted,
-                "sizes_list": sizes_list,
-                "variant_count": p.get("variant_count", 1)
-            })
+        # Get paginated grouped products, keyset on (base_model, grouped_id) like the snapshot
+        products, next_cursor = await find_page(
+            db.shop_products_grouped, query, "base_model", 1, limit,
+            cursor=cursor, skip=skip, projection=STOREFRONT_VIEW_PROJECTION, tiebreaker="grouped_id"
+        )
         
-        return {
-            "products": result,
-            "total": total,
-            "page": page,
-            "limit": limit,
-            "total_pages": math.ceil(total / limit) if total > 0 else 1
-        }
+        result = [grouped_storefront_item(p) for p in products]
+        return products_page_response(result, total, page, limit, next_cursor)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting products: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Completions returned by /suggest when the client does not ask for a number
+SUGGEST_DEFAULT_LIMIT = 8
+SUGGEST_MAX_LIMIT = 20
+
+@ecommerce_router.get("/suggest")
+async def suggest_products(q: str = "", limit: int = SUGGEST_DEFAULT_LIMIT):
+    """Search-as-you-type completions (brands, categories and products)
+    
+    Answered from the in-memory prefix index of the catalog snapshot; never
+    queries MongoDB, so it is safe to call on every keystroke.
+    """
+    limit = max(1, min(limit, SUGGEST_MAX_LIMIT))
+    snapshot = await catalog_store.get()
+    if snapshot is None or not q.strip():
+        return {"query": q, "suggestions": []}
+    return {"query": q, "suggestions": snapshot.suggest_index.suggest(q, limit)}
+
 @ecommerce_router.get("/products/{product_id}")
-async def get_product(product_id: str):
+async def get_product(product_id: str, request: Request = None):
     """Get single grouped product with all variants"""
+    return await catalog_response(request, lambda: product_detail(product_id))
+
+async def product_detail(product_id: str):
     try:
-        # First try grouped products
-        product = await db.shop_products_grouped.find_one(
-            {"grouped_id": product_id},
-            {"_id": 0}
-        )
+        # First try grouped products (stable ID or legacy alias)
+        product = await find_grouped_product(product_id)
         
         if product:
-            available_sizes = product.get("available_sizes", [])
-            sizes_sorted = []
-            for s in available_sizes:
-                size_val = s.get("size") if s else None
-                if size_val:
-                    sizes_sorted.append(s)
-            sizes_sorted.sort(key=lambda x: (
-                0 if (x.get("size") or "").isdigit() else 1,
-                int(x.get("size") or "0") if (x.get("size") or "").isdigit() else (x.get("size") or "")
-            ))
-            
-            # Use Cloudinary URL if available, then custom_image, then ERP image
-            display_image = product.get("cloudinary_url") or product.get("custom_image") or product.get("image")
-            # Get all images (up to 3) - prefer cloudinary_images
-            all_images = product.get("cloudinary_images") or product.get("images", [])
-            if not all_images or not isinstance(all_images, list):
-                all_images = [display_image] if display_image else []
-            all_images = [img for img in all_images if img]
-            
-            return {
-                "id": product.get("grouped_id"),
-                "name": product.get("custom_name") or product.get("base_model"),
-                "full_name": product.get("name"),
-                "price": product.get("custom_price") or product.get("price"),
-                "max_price": product.get("max_price"),
-                "stock": product.get("total_stock"),
-                "image": display_image,
-                "images": all_images,  # All product images (up to 3)
-                "category": product.get("category"),
-                "brand": product.get("brand"),
-                "gender": product.get("gender"),
-                "discount": product.get("discount", 0),
-                "description": product.get("custom_description") or product.get("description"),
-                "available_sizes": sizes_sorted,
-                "variants": product.get("variants", [])
-            }
+            return {**grouped_storefront_item(product), "variants": product.get("variants", [])}
         
         # Fallback to individual product
         product = await db.shop_products.find_one(
@@ -1008,25 +2133,27 @@ async def get_product(product_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @ecommerce_router.get("/featured")
-async def get_featured_products():
+async def get_featured_products(request: Request = None):
     """Get featured grouped products"""
+    return await catalog_response(request, featured_products)
+
+async def featured_products():
     try:
         products = await db.shop_products_grouped.find(
             {"total_stock": {"$gt": 0}},
-            {"_id": 0}
+            {"_id": 0, "variants": 0}
         ).limit(8).to_list(8)
         
         result = []
         for p in products:
-            # Use Cloudinary URL if available, then custom_image, then ERP image
-            display_image = p.get("cloudinary_url") or p.get("custom_image") or p.get("image")
+            view = grouped_storefront_item(p)
             result.append({
-                "id": p.get("grouped_id"),
-                "name": p.get("base_model"),
-                "price": p.get("price"),
-                "image": display_image,
-                "discount": p.get("discount", 0),
-                "sizes_list": p.get("sizes_list", [])
+                "id": view["id"],
+                "name": view["name"],
+                "price": view["price"],
+                "image": view["image"],
+                "discount": view["discount"],
+                "sizes_list": view["sizes_list"]
             })
         
         return result
@@ -1034,6 +2161,53 @@ async def get_featured_products():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@ecommerce_router.get("/catalog/changes")
+async def get_catalog_changes(since: int, request: Request = None):
+    """Grouped products added, changed or removed since a catalog version
+    
+    `since` is the catalog_version of a previous listing response. Returns the
+    storefront items to upsert and the IDs to drop, plus the version to ask
+    from next time. reset=true means the delta is not available (too old, too
+    large, or a display setting changed) and the listing must be reloaded.
+    """
+    return await catalog_response(request, lambda: catalog_changes_since(since))
+
+async def catalog_changes_since(since: int) -> dict:
+    snapshot = await catalog_store.get()
+    version = snapshot.version if snapshot is not None else (await read_catalog_version())[0]
+    if since >= version:
+        # Nothing new (or the client saw a newer version on another worker)
+        return {"since": since, "version": max(since, version), "reset": False, "upserted": [], "removed": []}
+    
+    entries = await db[CATALOG_CHANGES_COLLECTION].find(
+        {"_id": {"$gt": since, "$lte": version}},
+        {"at": 0}
+    ).to_list(None)
+    delta = collapse_changes(entries, since, version, CATALOG_DELTA_MAX_PRODUCTS)
+    if delta is None:
+        return {"since": since, "version": version, "reset": True, "upserted": [], "removed": []}
+    upserted_ids, removed = delta
+    
+    upserted = []
+    if snapshot is not None:
+        visible = set(snapshot.visible_positions()) if snapshot.show_only_with_images else None
+        for grouped_id in upserted_ids:
+            i = snapshot.by_id.get(grouped_id)
+            if i is not None and (visible is None or i in visible):
+                upserted.append(snapshot.items[i])
+            else:
+                removed.append(grouped_id)
+    else:
+        products = await db.shop_products_grouped.find(
+            {"grouped_id": {"$in": upserted_ids}, "total_stock": {"$gt": 0}},
+            STOREFRONT_VIEW_PROJECTION
+        ).to_list(None)
+        upserted = [grouped_storefront_item(p) for p in products]
+        found = {item["id"] for item in upserted}
+        removed += [gid for gid in upserted_ids if gid not in found]
+    
+    return {"since": since, "version": version, "reset": False, "upserted": upserted, "removed": removed}
+
 # ==================== DIAGNOSTIC ENDPOINT ====================
 
 @ecommerce_router.get("/debug/products-status")
@@ -1175,24 +2349,56 @@ async def calculate_delivery(data: DeliveryCalculation):
             detail="Lo sentimos, solo realizamos entregas dentro de Paraguay."
         )
     
-    if not gmaps:
-        distance_km = haversine_distance(STORE_LAT, STORE_LNG, data.lat, data.lng)
+    distance_km, _ = await delivery_distances.distance_km(data.lat, data.lng)
+    return delivery_quote(distance_km)
+
+@ecommerce_router.post("/calculate-delivery/batch")
+async def calculate_delivery_batch(data: DeliveryBatchCalculation, request: Request):
+    """Delivery cost of several destinations in one call
+    
+    Quotes the given points, or every saved address of the logged-in user
+    that has a location. Each quote comes back with the point's id (the
+    address id for saved addresses) and available=false with a reason when
+    it cannot be delivered to.
+    """
+    if data.points is None:
+        from server import get_current_user
+        user = await get_current_user(request)
+        if not user:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        user_data = await db.users.find_one(
+            {"user_id": user["user_id"]},
+            {"_id": 0, "shipping_addresses": 1}
+        ) or {}
+        points = [
+            {"id": a.get("id"), "lat": a.get("lat"), "lng": a.get("lng")}
+            for a in user_data.get("shipping_addresses", [])
+        ]
     else:
-        try:
-            result = gmaps.distance_matrix(
-                origins=[(STORE_LAT, STORE_LNG)],
-                destinations=[(data.lat, data.lng)],
-                mode="driving"
-            )
-            
-            if result['rows'][0]['elements'][0]['status'] == 'OK':
-                distance_meters = result['rows'][0]['elements'][0]['distance']['value']
-                distance_km = distance_meters / 1000
-            else:
-                distance_km = haversine_distance(STORE_LAT, STORE_LNG, data.lat, data.lng)
-        except Exception:
-            distance_km = haversine_distance(STORE_LAT, STORE_LNG, data.lat, data.lng)
+        points = [p.model_dump() for p in data.points]
+    
+    if len(points) > DELIVERY_BATCH_MAX_POINTS:
+        raise HTTPException(status_code=400, detail=f"Máximo {DELIVERY_BATCH_MAX_POINTS} direcciones por consulta")
+    
+    quotes = []
+    deliverable = []
+    for point in points:
+        quote = {"id": point["id"], "lat": point["lat"], "lng": point["lng"], "available": False}
+        if point["lat"] is None or point["lng"] is None:
+            quote["reason"] = "no_location"
+        elif not is_within_paraguay(point["lat"], point["lng"]):
+            quote["reason"] = "outside_paraguay"
+        else:
+            deliverable.append(quote)
+        quotes.append(quote)
     
+    distances = await delivery_distances.distance_km_many([(q["lat"], q["lng"]) for q in deliverable])
+    for quote, (distance_km, _) in zip(deliverable, distances):
+        quote.update(available=True, **delivery_quote(distance_km))
+    return {"quotes": quotes}
+
+def delivery_quote(distance_km: float) -> dict:
+    """Delivery price for a driving distance"""
     # Round distance to nearest whole km (standard rounding)
     # e.g., 10.2 km -> 10 km, 10.5 km -> 11 km (Python rounds 10.5 to 10, use manual rounding)
     rounded_distance_km = round(distance_km)
@@ -1204,7 +2410,7 @@ async def calculate_delivery(data: DeliveryCalculation):
     delivery_cost = max(delivery_cost, DELIVERY_MIN_PRICE)
     
     # Apply maximum delivery cost of 50,000 Gs
-    delivery_cost = min(delivery_cost, 50000)
+    delivery_cost = min(delivery_cost, DELIVERY_MAX_PRICE)
     
     return {
         "distance_km": round(distance_km, 2),
@@ -1212,22 +2418,9 @@ async def calculate_delivery(data: DeliveryCalculation):
         "delivery_cost": int(delivery_cost),
         "price_per_km": int(DELIVERY_PRICE_PER_KM),
         "min_price": int(DELIVERY_MIN_PRICE),
-        "max_price": 50000
+        "max_price": DELIVERY_MAX_PRICE
     }
 
-def haversine_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points using Haversine formula"""
-    R = 6371
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    delta_lat = math.radians(lat2 - lat1)
-    delta_lon = math.radians(lon2 - lon1)
-    
-    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    
-    return R * c
-
 # ==================== CHECKOUT & ORDERS ====================
 
 async def get_admin_settings_for_checkout():
@@ -1241,8 +2434,6 @@ async def get_admin_settings_for_checkout():
 @ecommerce_router.post("/checkout")
 async def create_checkout(data: CheckoutData, request: Request):
     """Create order - handles both payment gateway and request mode"""
-    from server import notify_new_order, send_whatsapp_notification
-    
     # Rate limiting - 5 checkouts per minute per IP
     rate_key = get_rate_limit_key(request, "checkout")
     is_allowed, _ = check_rate_limit(rate_key, max_requests=5, window_seconds=60)
@@ -1264,7 +2455,19 @@ async def create_checkout(data: CheckoutData, request: Request):
         ))
         delivery_cost = delivery_result['delivery_cost']
     
-    total = subtotal + delivery_cost
+    # The coupon is priced here from its definition; the client's discount is not trusted
+    coupon_code = normalize_code(data.coupon_code) if data.coupon_code else None
+    discount = 0
+    if coupon_code:
+        coupon = await coupon_cache.get(coupon_code)
+        if not coupon:
+            raise HTTPException(status_code=404, detail="Cupón no válido")
+        try:
+            discount = coupon_discount(coupon, subtotal)
+        except CouponRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    total = subtotal - discount + delivery_cost
     
     order_id = f"ORD-{uuid.uuid4().hex[:8].upper()}"
     
@@ -1273,6 +2476,24 @@ async def create_checkout(data: CheckoutData, request: Request):
     # If gateway enabled: status = "pending" (will be "pagado" after payment)
     initial_status = "solicitud" if not payment_enabled else "pending"
     
+    # Reserve stock before the order exists; a failed line rejects the checkout
+    hold = await hold_checkout_stock(
+        order_id, data.items, STOCK_HOLD_MINUTES if payment_enabled else STOCK_HOLD_REQUEST_MINUTES
+    )
+    
+    # Take a coupon use in the same update that checks max_uses (concurrent checkouts can't exceed it)
+    if coupon_code:
+        try:
+            redeemed = await redeem_coupon(db, coupon_code, order_id, discount)
+        except CouponRejected as e:
+            await release_order_stock(order_id, "coupon_rejected")
+            coupon_cache.discard(coupon_code)
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        except Exception:
+            await release_order_stock(order_id, "coupon_error")
+            raise
+        coupon_cache.put(redeemed)
+    
     order_doc = {
         "order_id": order_id,
         "items": [item.model_dump() for item in data.items],
@@ -1283,16 +2504,17 @@ async def create_checkout(data: CheckoutData, request: Request):
         "delivery_address": data.delivery_address.model_dump() if data.delivery_address else None,
         "delivery_cost": delivery_cost,
         "subtotal": subtotal,
+        "coupon_code": coupon_code,
+        "discount": discount,
         "total": total,
         "payment_method": data.payment_method,
         "payment_status": "pending",
         "order_status": initial_status,
         "notes": data.notes,
+        "stock_hold": {"hold_id": hold["hold_id"], "expires_at": hold["expires_at"].isoformat()},
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.orders.insert_one(order_doc)
-    
     # Build items list for notification
     items_text = "\n".join([
         f"• {item.name or 'Producto'}" + 
@@ -1317,10 +2539,9 @@ async def create_checkout(data: CheckoutData, request: Request):
     else:
         delivery_info = "🏪 *Retiro en tienda*"
     
-    # Send notifications
-    await notify_new_order(order_doc)
+    coupon_info = f"\n🎟️ *Cupón {coupon_code}:* -{discount:,.0f} Gs" if coupon_code else ""
     
-    # Send WhatsApp to admin
+    # WhatsApp to the commercial number
     whatsapp_message = f"""🛒 *NUEVA SOLICITUD DE COMPRA*
 
 📦 *Pedido:* {order_id}
@@ -1333,28 +2554,29 @@ async def create_checkout(data: CheckoutData, request: Request):
 
 {delivery_info}
 
-💰 *Subtotal:* {subtotal:,.0f} Gs
+💰 *Subtotal:* {subtotal:,.0f} Gs{coupon_info}
 💰 *TOTAL:* {total:,.0f} Gs
 
 📝 *Notas:* {data.notes or 'Sin notas'}
 
 {location_link}"""
 
-    await send_whatsapp_notification(whatsapp_commercial, whatsapp_message)
-    
-    # Import email service and send order confirmation email
-    try:
-        from email_service import send_order_confirmation
-        await send_order_confirmation(db, order_doc)
-    except Exception as e:
-        logger.error(f"Failed to send order confirmation email: {e}")
-    
-    # Send WhatsApp notification to admin
+    # Notifications are written ahead of the order and sent by the outbox dispatcher,
+    # so a slow or failing provider never delays or breaks the checkout
+    # (messages of an order that is never created are discarded by the dispatcher)
+    source = ("orders", "order_id", order_id)
     try:
-        from whatsapp_service import notify_new_order
-        await notify_new_order(order_doc)
-    except Exception as e:
-        logger.error(f"Failed to send WhatsApp notification: {e}")
+        await enqueue(db, [
+            outbox_message("whatsapp", {"to": whatsapp_commercial, "message": whatsapp_message}, source=source),
+            outbox_message("order_confirmation_email", source=source),
+            outbox_message("order_admin_whatsapp", source=source)
+        ])
+        await db.orders.insert_one(order_doc)
+    except Exception:
+        await release_order_stock(order_id, "order_not_created")
+        if coupon_code:
+            await release_order_coupon(order_id, "order_not_created")
+        raise
     
     # Return response based on payment gateway setting
     if not payment_enabled:
@@ -1396,14 +2618,32 @@ class CouponCreate(BaseModel):
     is_active: bool = True
     description: Optional[str] = None
 
+class CouponBatchCreate(BaseModel):
+    count: int
+    prefix: str = ""
+    code_length: int = 8
+    discount_type: str  # 'percentage' or 'fixed'
+    discount_value: float
+    min_purchase: Optional[float] = None
+    max_uses: Optional[int] = 1  # One-off codes by default
+    expires_at: Optional[str] = None
+    is_active: bool = True
+    description: Optional[str] = None
+
 class CouponApply(BaseModel):
     code: str
     subtotal: float
 
+async def coupons_changed():
+    """Drop cached coupon definitions in every worker after an admin edit"""
+    await bump_coupons_version(db)
+    coupon_cache.invalidate()
+
 @ecommerce_router.get("/coupons")
-async def get_all_coupons():
-    """Get all coupons (admin)"""
-    coupons = await db.shop_coupons.find({}, {"_id": 0}).to_list(1000)
+async def get_all_coupons(batch_id: Optional[str] = None):
+    """Get all coupons (admin); codes generated in bulk are only listed per batch"""
+    query = {"batch_id": batch_id} if batch_id else {"batch_id": {"$exists": False}}
+    coupons = await db.shop_coupons.find(query, {"_id": 0}).to_list(COUPON_BULK_MAX_COUNT if batch_id else 1000)
     return coupons
 
 @ecommerce_router.post("/coupons")
@@ -1428,9 +2668,37 @@ async def create_coupon(coupon: CouponCreate):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.shop_coupons.insert_one(coupon_data)
+    try:
+        await db.shop_coupons.insert_one(coupon_data)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Ya existe un cupón con ese código")
+    await coupons_changed()
     return {"success": True, "coupon": {k: v for k, v in coupon_data.items() if k != "_id"}}
 
+@ecommerce_router.post("/coupons/bulk")
+async def create_coupon_batch(batch: CouponBatchCreate, request: Request):
+    """Generate a batch of coupons with random unique codes for a campaign (admin)"""
+    await require_admin(request)
+    if not 1 <= batch.count <= COUPON_BULK_MAX_COUNT:
+        raise HTTPException(status_code=400, detail=f"La cantidad debe estar entre 1 y {COUPON_BULK_MAX_COUNT}")
+    if not 6 <= batch.code_length <= 16:
+        raise HTTPException(status_code=400, detail="El largo del código debe estar entre 6 y 16")
+    if batch.discount_type not in ("percentage", "fixed"):
+        raise HTTPException(status_code=400, detail="Tipo de descuento inválido")
+    
+    template = {
+        "discount_type": batch.discount_type,
+        "discount_value": batch.discount_value,
+        "min_purchase": batch.min_purchase,
+        "max_uses": batch.max_uses,
+        "expires_at": batch.expires_at,
+        "is_active": batch.is_active,
+        "description": batch.description
+    }
+    batch_id, codes = await generate_coupons(db, template, batch.count, batch.prefix, batch.code_length)
+    await coupons_changed()
+    return {"success": True, "batch_id": batch_id, "count": len(codes), "codes": codes}
+
 @ecommerce_router.put("/coupons/{coupon_id}")
 async def update_coupon(coupon_id: str, coupon: CouponCreate):
     """Update an existing coupon (admin)"""
@@ -1457,6 +2725,7 @@ async def update_coupon(coupon_id: str, coupon: CouponCreate):
     }
     
     await db.shop_coupons.update_one({"id": coupon_id}, {"$set": update_data})
+    await coupons_changed()
     return {"success": True, "message": "Cupón actualizado"}
 
 @ecommerce_router.delete("/coupons/{coupon_id}")
@@ -1465,6 +2734,7 @@ async def delete_coupon(coupon_id: str):
     result = await db.shop_coupons.delete_one({"id": coupon_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Cupón no encontrado")
+    await coupons_changed()
     return {"success": True, "message": "Cupón eliminado"}
 
 @ecommerce_router.post("/apply-coupon")
@@ -1476,43 +2746,17 @@ async def apply_coupon(data: CouponApply, request: Request):
     if not is_allowed:
         raise RateLimitExceeded(retry_after=60)
     
-    code = data.code.upper().strip()
     subtotal = data.subtotal
     
-    coupon = await db.shop_coupons.find_one({"code": code}, {"_id": 0})
+    coupon = await coupon_cache.get(data.code)
     
     if not coupon:
         raise HTTPException(status_code=404, detail="Cupón no válido")
     
-    if not coupon.get("is_active", True):
-        raise HTTPException(status_code=400, detail="Este cupón ya no está activo")
-    
-    # Check expiration
-    if coupon.get("expires_at"):
-        expires = datetime.fromisoformat(coupon["expires_at"].replace("Z", "+00:00"))
-        if datetime.now(timezone.utc) > expires:
-            raise HTTPException(status_code=400, detail="Este cupón ha expirado")
-    
-    # Check max uses
-    if coupon.get("max_uses") and coupon.get("current_uses", 0) >= coupon["max_uses"]:
-        raise HTTPException(status_code=400, detail="Este cupón ha alcanzado el límite de usos")
-    
-    # Check minimum purchase
-    if coupon.get("min_purchase") and subtotal < coupon["min_purchase"]:
-        min_purchase = coupon["min_purchase"]
-        raise HTTPException(
-            status_code=400, 
-            detail=f"El pedido mínimo para este cupón es de {int(min_purchase):,} Gs".replace(",", ".")
-        )
-    
-    # Calculate discount
-    if coupon["discount_type"] == "percentage":
-        discount_amount = subtotal * (coupon["discount_value"] / 100)
-    else:
-        discount_amount = coupon["discount_value"]
-    
-    # Ensure discount doesn't exceed subtotal
-    discount_amount = min(discount_amount, subtotal)
+    try:
+        discount_amount = coupon_discount(coupon, subtotal)
+    except CouponRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     
     return {
         "valid": True,
@@ -1528,12 +2772,7 @@ async def apply_coupon(data: CouponApply, request: Request):
 
 @ecommerce_router.post("/use-coupon/{code}")
 async def increment_coupon_use(code: str):
-    """Increment coupon usage count (called after successful order)"""
-    code = code.upper().strip()
-    await db.shop_coupons.update_one(
-        {"code": code},
-        {"$inc": {"current_uses": 1}}
-    )
+    """Kept for clients built before redemption moved into /checkout; uses are counted there"""
     return {"success": True}
 
 @ecommerce_router.post("/checkout/confirm-payment/{order_id}")
@@ -1558,6 +2797,7 @@ async def confirm_order_payment(order_id: str, request: Request):
             "paid_at": datetime.now(timezone.utc).isoformat()
         }}
     )
+    await commit_hold(db, order_id, "paid")
     
     # Build items text
     items_text = "\n".join([
@@ -1632,14 +2872,18 @@ async def get_order(order_id: str):
     return order
 
 @ecommerce_router.get("/store-location")
-async def get_store_location():
-    """Get store location for map"""
-    return {
-        "lat": STORE_LAT,
-        "lng": STORE_LNG,
-        "address": "Paseo Los Árboles, Av. San Martín, Asunción",
-        "name": "Avenue Store"
-    }
+async def get_store_location(request: Request = None):
+    """Get store location for map (ETag of the configured location, 304 on If-None-Match)"""
+    async def location():
+        return {
+            "lat": STORE_LAT,
+            "lng": STORE_LNG,
+            "address": "Paseo Los Árboles, Av. San Martín, Asunción",
+            "name": "Avenue Store"
+        }
+    if request is None:
+        return await location()
+    return await serve_versioned(request, None, f"{STORE_LAT},{STORE_LNG}", location)
 
 
 # ==================== ADMIN: ORDER MANAGEMENT ====================
@@ -1660,9 +2904,16 @@ async def get_admin_orders(
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     page: int = 1,
-    limit: int = 20
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
-    """Get all orders with filters for admin"""
+    """Get all orders with filters for admin
+    
+    Pages with page/limit, or with `cursor` (the next_cursor of the previous
+    response), which costs the same at any depth. include_total=false skips
+    the count; counts are cached for a few seconds.
+    """
     query = {}
     
     if status:
@@ -1677,17 +2928,19 @@ async def get_admin_orders(
         else:
             query["created_at"] = {"$lte": date_to}
     
-    skip = (page - 1) * limit
-    
-    orders = await db.orders.find(query, {"_id": 0}).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
-    total = await db.orders.count_documents(query)
+    orders, next_cursor = await find_page(
+        db.orders, query, "created_at", -1, limit,
+        cursor=cursor, skip=(page - 1) * limit, projection={"_id": 0}
+    )
+    total = await count_cache.count(db.orders, query) if include_total else None
     
     return {
         "orders": orders,
         "total": total,
         "page": page,
         "limit": limit,
-        "total_pages": math.ceil(total / limit) if total > 0 else 1
+        "total_pages": (math.ceil(total / limit) if total > 0 else 1) if total is not None else None,
+        "next_cursor": next_cursor
     }
 
 @ecommerce_router.put("/admin/orders/{order_id}/status")
@@ -1715,6 +2968,7 @@ async def update_order_status(order_id: str, data: OrderStatusUpdate):
             {"order_id": order_id},
             {"$set": {"payment_status": "cancelled"}}
         )
+    await apply_order_status_to_stock(order_id, data.status)
     
     return {"message": "Order status updated", "order_id": order_id, "new_status": data.status}
 
@@ -2165,9 +3419,9 @@ async def upload_product_image(
         "image_storage": image_result.get("storage", "unknown")
     }
     
-    await db.shop_products_grouped.update_one(
-        {"grouped_id": product_id},
-        {"$set": update_data}
+    await edit_grouped_products(
+        [UpdateOne({"grouped_id": product_id}, {"$set": update_data})],
+        {"grouped_id": product_id}
     )
     
     return {
@@ -2210,9 +3464,9 @@ async def delete_product_image(product_id: str, image_index: int):
         "image_updated_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.shop_products_grouped.update_one(
-        {"grouped_id": product_id},
-        {"$set": update_data}
+    await edit_grouped_products(
+        [UpdateOne({"grouped_id": product_id}, {"$set": update_data})],
+        {"grouped_id": product_id}
     )
     
     return {"message": "Image deleted", "all_images": images}
@@ -2244,9 +3498,9 @@ async def update_product_details(product_id: str, updates: dict):
     
     update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
     
-    result = await db.shop_products_grouped.update_one(
-        {"grouped_id": product_id},
-        {"$set": update_data}
+    result = await edit_grouped_products(
+        [UpdateOne({"grouped_id": product_id}, {"$set": update_data})],
+        {"grouped_id": product_id}
     )
     
     if result.matched_count == 0:
@@ -2264,6 +3518,7 @@ async def bulk_upload_images(files: List[UploadFile] = File(...)):
     matched = []
     not_matched = []
     errors = []
+    edits = []
     
     for file in files:
         try:
@@ -2286,15 +3541,16 @@ async def bulk_upload_images(files: List[UploadFile] = File(...)):
                 # Process and save image
                 image_url = await process_and_save_image(content, file.filename, product['grouped_id'])
                 
-                # Update database
-                await db.shop_products_grouped.update_one(
+                # Written together once every file is processed
+                edits.append(UpdateOne(
                     {"grouped_id": product['grouped_id']},
                     {"$set": {"custom_image": image_url, "image_updated_at": datetime.now(timezone.utc).isoformat()}}
-                )
+                ))
                 
                 matched.append({
                     "filename": file.filename,
                     "product": product['base_model'],
+                    "grouped_id": product['grouped_id'],
                     "image_url": image_url
                 })
             else:
@@ -2304,6 +3560,9 @@ async def bulk_upload_images(files: List[UploadFile] = File(...)):
             logger.error(f"Error processing {file.filename}: {str(e)}")
             errors.append(f"{file.filename}: {str(e)}")
     
+    if edits:
+        await edit_grouped_products(edits, {"grouped_id": {"$in": [m["grouped_id"] for m in matched]}})
+    
     return {
         "matched": len(matched),
         "not_matched": len(not_matched),
@@ -2333,9 +3592,9 @@ async def delete_all_product_images(product_id: str):
             logger.error(f"Error deleting file: {str(e)}")
     
     # Remove from database
-    await db.shop_products_grouped.update_one(
-        {"grouped_id": product_id},
-        {"$unset": {"custom_image": "", "image_updated_at": ""}}
+    await edit_grouped_products(
+        [UpdateOne({"grouped_id": product_id}, {"$unset": {"custom_image": "", "image_updated_at": ""}})],
+        {"grouped_id": product_id}
     )
     
     return {"message": "Image deleted successfully"}
@@ -2485,6 +3744,79 @@ async def get_brands_categories():
         "total": len(brands)
     }
 
+# ==================== BRAND MAPPINGS ====================
+
+class BrandMappingUpdate(BaseModel):
+    variants: List[str]
+
+async def require_admin(request: Request):
+    from server import require_admin as admin
+    return await admin(request)
+
+@ecommerce_router.get("/admin/brand-mappings")
+async def get_brand_mappings(request: Request):
+    """Unified brands and the ERP category/brand values mapped to each one"""
+    await require_admin(request)
+    docs = await db[BRAND_MAPPINGS_COLLECTION].find({}, {"_id": 0}).sort("variant", 1).to_list(None)
+    
+    brands = {}
+    for d in docs:
+        entry = brands.setdefault(d["brand"], {
+            "brand": d["brand"],
+            "brand_key": make_brand_key(d["brand"]),
+            "variants": []
+        })
+        entry["variants"].append(d["variant"])
+    
+    return {"brands": sorted(brands.values(), key=lambda b: b["brand"]), "total": len(brands)}
+
+@ecommerce_router.put("/admin/brand-mappings/{brand}")
+async def update_brand_mapping(brand: str, data: BrandMappingUpdate, request: Request):
+    """Set the ERP values unified under a brand (replaces its previous variants)
+    
+    A variant belongs to one brand only; listing it here moves it from any
+    other brand. Grouped products get their brand_key recomputed right away.
+    """
+    await require_admin(request)
+    brand = brand.strip().upper()
+    variants = sorted({v.strip().upper() for v in data.variants if v and v.strip()})
+    if not brand or not make_brand_key(brand):
+        raise HTTPException(status_code=400, detail="Marca inválida")
+    if not variants:
+        raise HTTPException(status_code=400, detail="Debe indicar al menos una variante")
+    
+    now = datetime.now(timezone.utc).isoformat()
+    operations = [DeleteMany({"brand": brand, "variant": {"$nin": variants}})]
+    operations += [
+        UpdateOne({"variant": v}, {"$set": {"variant": v, "brand": brand, "updated_at": now}}, upsert=True)
+        for v in variants
+    ]
+    try:
+        # Under the lease, so a running rebuild cannot key products with the old mapping
+        async with catalog_lease():
+            await db[BRAND_MAPPINGS_COLLECTION].bulk_write(operations, ordered=True)
+            updated = await refresh_brand_keys()
+    except LeaseBusy as e:
+        raise catalog_busy_error(e)
+    
+    logger.info(f"Brand mapping {brand} set to {variants}, {updated} grouped products updated")
+    return {"brand": brand, "brand_key": make_brand_key(brand), "variants": variants, "products_updated": updated}
+
+@ecommerce_router.delete("/admin/brand-mappings/{brand}")
+async def delete_brand_mapping(brand: str, request: Request):
+    """Stop unifying a brand; its products go back to their own ERP category"""
+    await require_admin(request)
+    brand = brand.strip().upper()
+    try:
+        async with catalog_lease():
+            result = await db[BRAND_MAPPINGS_COLLECTION].delete_many({"brand": brand})
+            if result.deleted_count == 0:
+                raise HTTPException(status_code=404, detail="Marca no encontrada")
+            updated = await refresh_brand_keys()
+    except LeaseBusy as e:
+        raise catalog_busy_error(e)
+    return {"message": "Mapeo de marca eliminado", "brand": brand, "products_updated": updated}
+
 @ecommerce_router.get("/admin/products-with-images")
 async def get_products_with_images():
     """Get all products that have images assigned"""
@@ -2791,16 +4123,16 @@ async def assign_images_to_product(assignment: ImageAssignment):
     images_array = assigned_images + [None] * (3 - len(assigned_images))
     cloudinary_array = cloudinary_images + [None] * (3 - len(cloudinary_images))
     
-    update_result = await db.shop_products_grouped.update_one(
-        {"grouped_id": assignment.product_id},
-        {"$set": {
+    update_result = await edit_grouped_products(
+        [UpdateOne({"grouped_id": assignment.product_id}, {"$set": {
             "images": images_array[:3],
             "cloudinary_images": cloudinary_array[:3],
             "custom_image": assigned_images[0] if assigned_images else None,
             "cloudinary_url": cloudinary_images[0] if cloudinary_images and cloudinary_images[0] else None,
             "image_updated_at": datetime.now(timezone.utc).isoformat(),
             "image_storage": "cloudinary" if cloudinary_images and cloudinary_images[0] else "gridfs"
-        }}
+        }})],
+        {"grouped_id": assignment.product_id}
     )
     
     if update_result.modified_count == 0:
@@ -2870,13 +4202,13 @@ async def unlink_images_from_product(product_id: str):
                     logger.warning(f"Could not delete image file {filepath}: {e}")
     
     # Update product to remove images
-    await db.shop_products_grouped.update_one(
-        {"grouped_id": product_id},
-        {"$set": {
+    await edit_grouped_products(
+        [UpdateOne({"grouped_id": product_id}, {"$set": {
             "images": [None, None, None],
             "custom_image": None,
             "image_updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        }})],
+        {"grouped_id": product_id}
     )
     
     return {
@@ -2899,13 +4231,13 @@ async def reset_all_product_images():
     })
     
     # Clear all product images
-    result = await db.shop_products_grouped.update_many(
-        {},
-        {"$set": {
+    result = await edit_grouped_products(
+        [UpdateMany({}, {"$set": {
             "images": [None, None, None],
             "custom_image": None,
             "image_updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        }})],
+        {}
     )
     
     # Delete all image data from MongoDB
@@ -2978,15 +4310,15 @@ async def delete_product_custom_image(product_id: str):
                     logger.warning(f"Could not delete image file {filepath}: {e}")
     
     # Update product to remove images
-    await db.shop_products_grouped.update_one(
-        {"grouped_id": product_id},
-        {"$set": {
+    await edit_grouped_products(
+        [UpdateOne({"grouped_id": product_id}, {"$set": {
             "images": [None, None, None],
             "cloudinary_images": [None, None, None],
             "custom_image": None,
             "cloudinary_url": None,
             "image_updated_at": datetime.now(timezone.utc).isoformat()
-        }}
+        }})],
+        {"grouped_id": product_id}
     )
     
     return {
@@ -7,7 +7,7 @@ import resend
 import os
 import logging
 from datetime import datetime, timezone
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Collection
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from pathlib import Path
 from dotenv import load_dotenv
@@ -759,14 +759,17 @@ async def send_email(
     return result
 
 
-async def send_order_confirmation(db: AsyncIOMotorDatabase, order: Dict[str, Any]) -> Dict[str, Any]:
-    """Send order confirmation to customer and notification to admin"""
+async def send_order_confirmation(db: AsyncIOMotorDatabase, order: Dict[str, Any], skip: Collection[str] = ()) -> Dict[str, Any]:
+    """Send order confirmation to customer and notification to admin
+
+    Recipients in `skip` ("customer", "admin") are not sent to.
+    """
     import asyncio
     results = []
     
     # Send to customer
     customer_email = order.get('customer_email')
-    if customer_email:
+    if customer_email and 'customer' not in skip:
         subject, html, _ = order_confirmation_email(order)
         result = await send_email(
             db, customer_email, subject, html,
@@ -776,18 +779,19 @@ async def send_order_confirmation(db: AsyncIOMotorDatabase, order: Dict[str, Any
         )
         results.append(('customer', result))
     
-    # Small delay to avoid rate limiting
-    await asyncio.sleep(0.6)
+    if 'admin' not in skip:
+        # Small delay to avoid rate limiting
+        await asyncio.sleep(0.6)
     
-    # Send to admin
-    admin_subject, admin_html, _ = admin_new_order_email(order)
-    admin_result = await send_email(
-        db, ADMIN_EMAIL, admin_subject, admin_html,
-        sender_type='ecommerce',
-        entity_type='order',
-        entity_id=order.get('order_id')
-    )
-    results.append(('admin', admin_result))
+        # Send to admin
+        admin_subject, admin_html, _ = admin_new_order_email(order)
+        admin_result = await send_email(
+            db, ADMIN_EMAIL, admin_subject, admin_html,
+            sender_type='ecommerce',
+            entity_type='order',
+            entity_id=order.get('order_id')
+        )
+        results.append(('admin', admin_result))
     
     return {'results': results}
 
@@ -1177,14 +1181,17 @@ def admin_booking_request_email(reservation: Dict[str, Any]) -> tuple[str, str,
     return subject, html, preview
 
 
-async def send_booking_request_notification(db: AsyncIOMotorDatabase, reservation: Dict[str, Any]) -> Dict[str, Any]:
-    """Send booking request notification to customer and admin when a new request is created"""
+async def send_booking_request_notification(db: AsyncIOMotorDatabase, reservation: Dict[str, Any], skip: Collection[str] = ()) -> Dict[str, Any]:
+    """Send booking request notification to customer and admin when a new request is created
+
+    Recipients in `skip` ("customer", "admin") are not sent to.
+    """
     import asyncio
     results = []
     
     # Send to customer
     customer_email = reservation.get('customer_email') or reservation.get('email')
-    if customer_email:
+    if customer_email and 'customer' not in skip:
         subject, html, _ = booking_request_received_email(reservation)
         result = await send_email(
             db, customer_email, subject, html,
@@ -1194,17 +1201,18 @@ async def send_booking_request_notification(db: AsyncIOMotorDatabase, reservatio
         )
         results.append(('customer', result))
     
-    # Small delay to avoid rate limiting
-    await asyncio.sleep(0.6)
+    if 'admin' not in skip:
+        # Small delay to avoid rate limiting
+        await asyncio.sleep(0.6)
     
-    # Send to admin
-    admin_subject, admin_html, _ = admin_booking_request_email(reservation)
-    admin_result = await send_email(
-        db, ADMIN_EMAIL, admin_subject, admin_html,
-        sender_type='studio',
-        entity_type='reservation',
-        entity_id=reservation.get('reservation_id')
-    )
-    results.append(('admin', admin_result))
+        # Send to admin
+        admin_subject, admin_html, _ = admin_booking_request_email(reservation)
+        admin_result = await send_email(
+            db, ADMIN_EMAIL, admin_subject, admin_html,
+            sender_type='studio',
+            entity_type='reservation',
+            entity_id=reservation.get('reservation_id')
+        )
+        results.append(('admin', admin_result))
     
     return {'results': results}
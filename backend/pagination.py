@@ -0,0 +1,119 @@
+# Keyset (cursor) pagination helpers
+# Pages through sorted MongoDB queries by (sort key, tiebreaker) instead of skip,
+# so page 50 costs the same as page 1; totals are optional and briefly cached
+
+import base64
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import json_util
+from fastapi import HTTPException
+
+COUNT_CACHE_TTL_SECONDS = float(os.environ.get('COUNT_CACHE_TTL_SECONDS', '15'))
+COUNT_CACHE_MAX_ENTRIES = 1024
+
+def encode_cursor(payload: Dict[str, Any]) -> str:
+    """Opaque, URL-safe cursor (keeps BSON types such as ObjectId and datetime)"""
+    raw = json_util.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Inverse of encode_cursor; 400 on anything that is not one of our cursors"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json_util.loads(raw.decode('utf-8'))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(payload, dict):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return payload
+
+def keyset_filter(sort_field: str, direction: int, after: list, tiebreaker: str = "_id") -> dict:
+    """Documents strictly after the (sort value, tiebreaker) pair in the given direction"""
+    value, last_id = after
+    op = "$lt" if direction < 0 else "$gt"
+    return {"$or": [
+        {sort_field: {op: value}},
+        {sort_field: value, tiebreaker: {op: last_id}}
+    ]}
+
+async def find_page(
+    collection,
+    query: dict,
+    sort_field: str,
+    direction: int = -1,
+    limit: Optional[int] = 20,
+    cursor: Optional[str] = None,
+    skip: int = 0,
+    projection: Optional[dict] = None,
+    tiebreaker: str = "_id"
+) -> Tuple[List[dict], Optional[str]]:
+    """One page of a sorted query and the cursor of the next page (None on the last page)
+
+    With a cursor the page starts right after the cursor's document (skip is
+    ignored); without one it starts at `skip`, so page/limit APIs keep working
+    and can hand out a cursor to continue with. A limit of 0 or None means no
+    limit, like in MongoDB: every remaining document, and no next cursor.
+    """
+    if limit is not None and limit < 0:
+        raise HTTPException(status_code=400, detail="limit inválido")
+    if cursor:
+        after = decode_cursor(cursor).get("after")
+        if not isinstance(after, list) or len(after) != 2:
+            raise HTTPException(status_code=400, detail="Cursor inválido")
+        condition = keyset_filter(sort_field, direction, after, tiebreaker)
+        query = {"$and": [query, condition]} if query else condition
+        skip = 0
+
+    # The cursor fields have to be read even when the caller's projection leaves them out
+    projection = dict(projection or {})
+    inclusion = any(value not in (0, False) for key, value in projection.items() if key != "_id")
+    hidden = set()
+    for field in {sort_field, tiebreaker}:
+        if projection.get(field, 1) in (0, False):
+            projection.pop(field)
+            hidden.add(field)
+        elif inclusion and field not in projection:
+            projection[field] = 1
+            hidden.add(field)
+
+    find = collection.find(query, projection or None).sort([(sort_field, direction), (tiebreaker, direction)])
+    if skip:
+        find = find.skip(skip)
+    if limit:
+        docs = await find.limit(limit + 1).to_list(limit + 1)
+    else:
+        docs = await find.to_list(None)
+
+    next_cursor = None
+    if limit and len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_cursor({"after": [last.get(sort_field), last.get(tiebreaker)]})
+    for d in docs:
+        for field in hidden:
+            d.pop(field, None)
+    return docs, next_cursor
+
+class CountCache:
+    """count_documents results cached per (collection, query) for a few seconds"""
+
+    def __init__(self, ttl: float = COUNT_CACHE_TTL_SECONDS, max_entries: int = COUNT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, str], Tuple[float, int]] = {}
+
+    async def count(self, collection, query: dict) -> int:
+        key = (collection.name, json_util.dumps(query, sort_keys=True))
+        now = time.monotonic()
+        cached = self._entries.get(key)
+        if cached and now - cached[0] < self.ttl:
+            return cached[1]
+        total = await collection.count_documents(query)
+        if len(self._entries) >= self.max_entries:
+            self._entries.clear()
+        self._entries[key] = (now, total)
+        return total
+
+count_cache = CountCache()
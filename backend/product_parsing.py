@@ -0,0 +1,220 @@
+# Product name parsing for the ERP sync
+# Extracts sizes and base models from ERP product names with precompiled
+# patterns and a bounded LRU cache (names barely change between syncs)
+
+import os
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+PARSE_CACHE_SIZE = int(os.environ.get('PRODUCT_PARSE_CACHE_SIZE', '50000'))
+
+# ==================== SIZE PATTERNS ====================
+
+# Comprehensive size patterns (order matters - more specific first).
+# Matched against the upper-cased name; the first pattern that matches wins.
+SIZE_PATTERNS = [
+    # US sizes
+    r'[-\s](US\d{1,2})(?:[-\s]|$)',     # -US8, -US10, US8-, " US8 "
+
+    # Combined sizes with slash
+    r'[-\s]([XSMLPG]{1,3}/[XSMLPG]{1,3})(?:[-\s]|$)',  # S/M, M/L
+
+    # Extended alpha sizes with X prefix (XXL, XXXL, XXG, XXXG, XP, XS, XL, etc.)
+    r'[-\s\.](X{1,3}[SLGP])(?:[-\s\.]|$)',  # XS, XXS, XXXS, XL, XXL, XXXL, XG, XXG, XXXG, XP
+
+    # Brazilian/Spanish double sizes - PP, GG (not ambiguous with color codes)
+    r'[-\s\.](PP)(?:[-\s\.]|$)',              # PP (extra small)
+
+    # Single letter sizes at specific positions - P, M, G, S, L
+    # Be more specific to avoid matching color codes
+    r'-([PMGSL])-[A-Z]',                # -P-, -M- etc. followed by color name
+    r'[-\s\.]([PMGSL])(?:[-\s\.]|$)',   # P, M, G, S, L (single letter) at boundaries
+
+    # Numeric sizes (2 digits) - common clothing sizes
+    r'[-\s](\d{2})(?:[-\s]|$)',              # 34, 36, 38, etc.
+
+    # Numeric sizes for kids (single digits 8-16)
+    r'-([8]|1[0246])(?:-|$)',                # 8, 10, 12, 14, 16 for kids
+
+    # At end of string patterns
+    r'-(US\d{1,2})$',                        # ends with -US8
+    r'[-\.](X{1,3}[SLGP])$',                 # ends with -XL, -XXL, -XG, -XXG, -XP, .XG
+    r'-(PP)$',                               # ends with -PP
+    r'-([PMGSL])$',                          # ends with -P, -M, -G, -S, -L
+    r'\.([PMGSL])$',                         # ends with .P, .M, .G (dot notation)
+    r'-(\d{2})$',                            # ends with -38
+
+    # Space separated at end
+    r'\s(X{1,3}[SLGP])$',                    # ends with " XL", " XP"
+    r'\s(PP)$',                              # ends with " PP"
+    r'\s([PMGSL])$',                         # ends with " M"
+    r'\s(\d{2})$',                           # ends with " 38"
+]
+
+# ==================== BASE MODEL PATTERNS ====================
+
+# Patterns to remove sizes (order matters - more specific first).
+# Applied one after another, case-insensitive.
+BASE_MODEL_PATTERNS = [
+    # ===========================================
+    # PRODUCT CODE PATTERNS (Wuarani style)
+    # Format: XXXXX-[COLOR][SIZE]- where COLOR is letter(s) and SIZE is P/M/G/XL/etc
+    # ===========================================
+    # Color codes: N=Negro, B=Blanco, R=Rosa/Rojo, G=Gris, C=Celeste, V=Verde, F=Fucsia, L=Lila, O=Ocre, P=Petroleo/Piel
+    # Size codes: XP, P, M, G, XL, XXL, XG, XXG
+
+    # Extended sizes with X prefix: NXP, BXL, GXXL, PXL, etc.
+    (r'(\d{5,6}-\d?[NBRGCVFLOAP])(X{1,2}[PLG])(-)', r'\1-'),  # 100394-BXP-, 100100-PXL- → remove size
+
+    # Single letter sizes: NP, NM, NG, BP, BM, BG, PP, PM, PG etc.
+    (r'(\d{5,6}-\d?[NBRGCVFLOAP])([PMGSL])(-)', r'\1-'),      # 100394-BP-, 100100-PM- → remove size
+
+    # ===========================================
+    # DOT NOTATION (OKI style: REM.PREM.BLA.M)
+    # ===========================================
+    (r'\.(X{1,2}[SLGP])$', ''),           # .XL, .XG, .XP at end → remove
+    (r'\.([PMGSL])$', ''),                # .P, .M, .G at end → remove
+    (r'\.(X{1,2}[SLGP])-', '-'),          # .XL- → -
+    (r'\.([PMGSL])-', '-'),               # .M- → -
+
+    # ===========================================
+    # US SIZES
+    # ===========================================
+    (r'-(US\d{1,2})$', ''),           # -US8 at end → remove
+    (r'-(US\d{1,2})-', '-'),          # -US8- → keep one dash
+    (r'\s(US\d{1,2})(?:\s|$)', ' '),  # space US8 → space
+
+    # ===========================================
+    # COMBINED SIZES WITH SLASH
+    # ===========================================
+    (r'-([XSMLPG]{1,3}/[XSMLPG]{1,3})$', ''),      # -S/M at end → remove
+    (r'-([XSMLPG]{1,3}/[XSMLPG]{1,3})-', '-'),     # -S/M- → -
+
+    # ===========================================
+    # EXTENDED ALPHA SIZES (XS, XL, XXL, XG, XXG, XP)
+    # ===========================================
+    (r'-(X{1,3}[SLGP])$', ''),         # -XXL, -XXG, -XP at end → remove
+    (r'-(X{1,3}[SLGP])-', '-'),        # -XXL-, -XXG-, -XP- → -
+    (r'\s(X{1,3}[SLGP])$', ''),        # space XXL at end → remove
+    (r'\s(X{1,3}[SLGP])\s', ' '),      # space XXL space → space
+
+    # ===========================================
+    # DOUBLE LETTER SIZES (PP, GG)
+    # ===========================================
+    (r'-(PP)$', ''),                   # -PP at end → remove
+    (r'-(PP)-', '-'),                  # -PP- → -
+    (r'\s(PP)$', ''),                  # space PP at end → remove
+    (r'\s(PP)\s', ' '),                # space PP space → space
+    # Note: GG is ambiguous (could be Gris Grande) - handle in context
+
+    # ===========================================
+    # SINGLE LETTER SIZES (P, M, G, S, L)
+    # ===========================================
+    (r'-([PMGSL])$', ''),              # -P, -M, -G, -S, -L at end → remove
+    (r'-([PMGSL])-', '-'),             # -P-, -M- etc → -
+    (r'\s([PMGSL])$', ''),             # space P at end → remove
+    (r'\s([PMGSL])\s', ' '),           # space P space → space (P in middle of name)
+
+    # ===========================================
+    # NUMERIC SIZES (kids: 8-16, adults: 34-50)
+    # ===========================================
+    (r'-([8]|1[0246])$', ''),          # -8, -10, -12, -14, -16 at end (kids)
+    (r'-([8]|1[0246])-', '-'),         # -8-, -10- etc (kids) → -
+    (r'-(\d{2})$', ''),                # -38 at end → remove
+    (r'-(\d{2})-', '-'),               # -38- → -
+    (r'\s(\d{2})$', ''),               # space 38 at end → remove
+    (r'\s(\d{2})\s', ' '),             # space 38 space → space
+]
+
+# ==================== COMPILED PATTERNS ====================
+
+_SIZE_RES = [re.compile(p) for p in SIZE_PATTERNS]
+_BASE_MODEL_RES = [(re.compile(p, re.IGNORECASE), r) for p, r in BASE_MODEL_PATTERNS]
+
+# One combined alternation per table, used as a prefilter: when it finds
+# nothing, none of the ordered patterns can match and they are all skipped.
+# The ordered patterns still decide the result, so output is unchanged.
+_ANY_SIZE_RE = re.compile('|'.join(f'(?:{p})' for p in SIZE_PATTERNS))
+_ANY_BASE_MODEL_RE = re.compile('|'.join(f'(?:{p})' for p, _ in BASE_MODEL_PATTERNS), re.IGNORECASE)
+
+_MULTI_SPACE_RE = re.compile(r'\s+')
+_DASH_SPACING_RE = re.compile(r'\s*-\s*')
+_MULTI_DASH_RE = re.compile(r'-+')
+_TRAILING_CODE_RE = re.compile(r'-(\d{4})$')
+
+# ==================== PARSING ====================
+
+def _extract_size(name: str) -> Optional[str]:
+    if not name:
+        return None
+
+    name_upper = name.upper()
+    if not _ANY_SIZE_RE.search(name_upper):
+        return None
+
+    for pattern in _SIZE_RES:
+        match = pattern.search(name_upper)
+        if match:
+            return match.group(1).upper()
+
+    return None
+
+def _extract_base_model(name: str) -> str:
+    if not name:
+        return name
+
+    # Pre-normalize: fix inconsistent spacing around dashes
+    base = _MULTI_SPACE_RE.sub(' ', name)    # multiple spaces to one
+    base = _DASH_SPACING_RE.sub('-', base)   # " - " or "- " or " -" → "-"
+
+    if _ANY_BASE_MODEL_RE.search(base):
+        for pattern, replacement in _BASE_MODEL_RES:
+            base = pattern.sub(replacement, base)
+
+    # Post-normalize and clean up
+    base = _MULTI_DASH_RE.sub('-', base)      # multiple dashes to one
+    base = _MULTI_SPACE_RE.sub(' ', base)     # multiple spaces to one
+    base = _TRAILING_CODE_RE.sub('', base)    # remove trailing product codes like -3721, -3723
+    base = base.strip('-').strip()
+
+    return base
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_product_name(name: str) -> Tuple[Optional[str], str]:
+    """Return (size, base_model) for an ERP product name (memoized)"""
+    return _extract_size(name), _extract_base_model(name)
+
+def parse_product_names(names: Iterable[str]) -> Dict[str, Tuple[Optional[str], str]]:
+    """Parse a whole page of names at once, each distinct name only once"""
+    return {name: parse_product_name(name) for name in set(names)}
+
+def extract_size_from_name(name: str) -> Optional[str]:
+    """Extract size from product name
+
+    Handles multiple size conventions:
+    - Standard: XS, S, M, L, XL, XXL, XXXL
+    - Brazilian/Spanish: PP, P, M, G, GG, XG, XXG, XXXG, XP (extra pequeño)
+    - Numeric: 34, 36, 38, 40, 42, etc. (including single digits 8, 10, 12, 14, 16 for kids)
+    - US sizes: US5, US6, US7, etc.
+    - Combined: S/M, M/L, etc.
+    - Dot notation: .M, .G, .XG (used by some brands)
+    """
+    return parse_product_name(name)[0] if name else None
+
+def extract_base_model(name: str) -> str:
+    """Extract base model name by removing size from product name
+
+    Removes all size patterns to get the base product model name
+    for grouping variants together.
+
+    Handles complex patterns like:
+    - Wuarani: 100394-BP- (Blanco Pequeño), 100394-NM- (Negro Mediano)
+    - OKI: REM.PREM.BLA.M (ends with .M for size)
+    - Standard: -P-, -M-, -G-, -XL-, etc.
+    """
+    return parse_product_name(name)[1] if name else name
+
+def parse_cache_info():
+    """LRU statistics (hits, misses, maxsize, currsize) for diagnostics"""
+    return parse_product_name.cache_info()
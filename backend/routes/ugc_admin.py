@@ -14,6 +14,7 @@ import logging
 from models.ugc_models import (
     CampaignStatus, ApplicationStatus, DeliverableStatus, CreatorLevel
 )
+from pagination import find_page, count_cache
 
 logger = logging.getLogger(__name__)
 
@@ -122,7 +123,9 @@ async def get_all_creators(
     limit: int = 100,
     level: Optional[CreatorLevel] = None,
     city: Optional[str] = None,
-    is_active: Optional[bool] = None
+    is_active: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     """Get all creators with filters and enriched data (social accounts, metrics, reviews)"""
     await require_admin(request)
@@ -136,10 +139,9 @@ async def get_all_creators(
     if is_active is not None:
         query["is_active"] = is_active
     
-    creators = await db.ugc_creators.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    creators, next_cursor = await find_page(
+        db.ugc_creators, query, "created_at", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
     
     # Get user names for creators
     user_ids = [c.get("user_id") for c in creators if c.get("user_id")]
@@ -246,9 +248,9 @@ async def get_all_creators(
         creator["avg_rating"] = round(sum(r.get("rating", 0) for r in ratings) / len(ratings), 1) if ratings else 0
         creator["total_reviews"] = len(ratings)
     
-    total = await db.ugc_creators.count_documents(query)
+    total = await count_cache.count(db.ugc_creators, query) if include_total else None
     
-    return {"creators": creators, "total": total}
+    return {"creators": creators, "total": total, "next_cursor": next_cursor}
 
 
 @router.get("/creators/export", response_class=StreamingResponse)
@@ -670,7 +672,9 @@ async def get_all_brands(
     request: Request,
     skip: int = 0,
     limit: int = 50,
-    is_active: Optional[bool] = None
+    is_active: Optional[bool] = None,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     """Get all brands"""
     await require_admin(request)
@@ -680,10 +684,9 @@ async def get_all_brands(
     if is_active is not None:
         query["is_active"] = is_active
     
-    brands = await db.ugc_brands.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    brands, next_cursor = await find_page(
+        db.ugc_brands, query, "created_at", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
     
     # Enrich with package info
     for brand in brands:
@@ -703,9 +706,9 @@ async def get_all_brands(
         )
         brand["active_package"] = active_pkg
     
-    total = await db.ugc_brands.count_documents(query)
+    total = await count_cache.count(db.ugc_brands, query) if include_total else None
     
-    return {"brands": brands, "total": total}
+    return {"brands": brands, "total": total, "next_cursor": next_cursor}
 
 @router.put("/brands/{brand_id}/verify", response_model=dict)
 async def verify_brand(
@@ -752,7 +755,9 @@ async def get_all_packages(
     request: Request,
     status: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     """Get all packages"""
     await require_admin(request)
@@ -762,10 +767,9 @@ async def get_all_packages(
     if status:
         query["status"] = status
     
-    packages = await db.ugc_packages.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    packages, next_cursor = await find_page(
+        db.ugc_packages, query, "created_at", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
     
     # Enrich with brand info
     for pkg in packages:
@@ -777,9 +781,9 @@ async def get_all_packages(
             brand["company_name"] = brand.get("brand_name")
         pkg["brand"] = brand
     
-    total = await db.ugc_packages.count_documents(query)
+    total = await count_cache.count(db.ugc_packages, query) if include_total else None
     
-    return {"packages": packages, "total": total}
+    return {"packages": packages, "total": total, "next_cursor": next_cursor}
 
 @router.put("/packages/{package_id}/activate", response_model=dict)
 async def admin_activate_package(
@@ -826,7 +830,9 @@ async def get_all_campaigns(
     has_late_deliveries: Optional[bool] = None,
     search: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     """Get all campaigns with enriched stats for admin dashboard"""
     await require_admin(request)
@@ -842,10 +848,9 @@ async def get_all_campaigns(
             {"name": {"$regex": search, "$options": "i"}},
         ]
     
-    campaigns = await db.ugc_campaigns.find(
-        query,
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    campaigns, next_cursor = await find_page(
+        db.ugc_campaigns, query, "created_at", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
     
     now = datetime.now(timezone.utc)
     three_days_later = now + timedelta(days=3)
@@ -1002,7 +1007,7 @@ async def get_all_campaigns(
         
         filtered_campaigns.append(campaign)
     
-    total = await db.ugc_campaigns.count_documents(query)
+    total = await count_cache.count(db.ugc_campaigns, query) if include_total else None
     
     # Get unique brands for filter dropdown
     all_brands = await db.ugc_brands.find(
@@ -1017,6 +1022,7 @@ async def get_all_campaigns(
     return {
         "campaigns": filtered_campaigns, 
         "total": total,
+        "next_cursor": next_cursor,
         "brands_for_filter": all_brands
     }
 
@@ -1809,16 +1815,17 @@ async def admin_toggle_campaign_visibility(
 async def get_all_reviews(
     request: Request,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     """Get all reviews for moderation"""
     await require_admin(request)
     db = await get_db()
     
-    reviews = await db.ugc_reviews.find(
-        {},
-        {"_id": 0}
-    ).sort("created_at", -1).skip(skip).limit(limit).to_list(limit)
+    reviews, next_cursor = await find_page(
+        db.ugc_reviews, {}, "created_at", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
     
     # Enrich
     for review in reviews:
@@ -1833,9 +1840,9 @@ async def get_all_reviews(
         review["creator"] = creator
         review["brand"] = brand
     
-    total = await db.ugc_reviews.count_documents({})
+    total = await count_cache.count(db.ugc_reviews, {}) if include_total else None
     
-    return {"reviews": reviews, "total": total}
+    return {"reviews": reviews, "total": total, "next_cursor": next_cursor}
 
 @router.delete("/reviews/{review_id}", response_model=dict)
 async def delete_review(
@@ -1889,18 +1896,18 @@ async def delete_review(
 async def get_audit_logs(
     request: Request,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    cursor: Optional[str] = None
 ):
     """Get audit logs"""
     await require_admin(request)
     db = await get_db()
     
-    logs = await db.ugc_audit_logs.find(
-        {},
-        {"_id": 0}
-    ).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
+    logs, next_cursor = await find_page(
+        db.ugc_audit_logs, {}, "timestamp", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
     
-    return {"logs": logs}
+    return {"logs": logs, "next_cursor": next_cursor}
 
 # ==================== DETAILED STATS ====================
 
@@ -2166,7 +2173,9 @@ async def get_all_deliverables(
     request: Request,
     status: Optional[str] = None,
     skip: int = 0,
-    limit: int = 50
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
     """Get all deliverables with optional status filter"""
     await require_admin(request)
@@ -2179,10 +2188,9 @@ async def get_all_deliverables(
         else:
             query["status"] = status
     
-    deliverables = await db.ugc_deliverables.find(
-        query,
-        {"_id": 0}
-    ).sort("updated_at", -1).skip(skip).limit(limit).to_list(limit)
+    deliverables, next_cursor = await find_page(
+        db.ugc_deliverables, query, "updated_at", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
     
     # Get all application_ids to fetch related data in bulk
     app_ids = list(set(d.get("application_id") for d in deliverables if d.get("application_id")))
@@ -2236,9 +2244,9 @@ async def get_all_deliverables(
         if "deliverable_id" in del_item and "id" not in del_item:
             del_item["id"] = del_item["deliverable_id"]
     
-    total = await db.ugc_deliverables.count_documents(query)
+    total = await count_cache.count(db.ugc_deliverables, query) if include_total else None
     
-    return {"deliverables": deliverables, "total": total}
+    return {"deliverables": deliverables, "total": total, "next_cursor": next_cursor}
 
 @router.put("/deliverables/{deliverable_id}/review", response_model=dict)
 async def admin_review_deliverable(
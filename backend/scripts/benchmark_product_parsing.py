@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: product name parsing
+================================
+Measures size/base model extraction over the golden corpus of real ERP names
+(tests/data/product_names_golden.json), repeated to a catalog-sized workload.
+
+- uncached: compiled patterns, no memoization (first sync after a restart)
+- cold:     memoized parser with an empty cache
+- warm:     memoized parser on a later sync (names already seen)
+
+Run manually: python scripts/benchmark_product_parsing.py [--repeat 10]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from product_parsing import _extract_size, _extract_base_model, parse_product_name, parse_product_names
+
+GOLDEN_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'tests', 'data', 'product_names_golden.json'
+)
+
+
+def timed(label, fn, count):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {elapsed * 1000:9.1f} ms  {count / elapsed:12,.0f} names/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark product name parsing")
+    parser.add_argument('--repeat', type=int, default=10, help="Times the corpus is repeated")
+    args = parser.parse_args()
+
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        names = [row["name"] for row in json.load(f)]
+    workload = names * args.repeat
+    print(f"{len(names)} distinct names, {len(workload)} parses per run\n")
+
+    def uncached():
+        for name in workload:
+            _extract_size(name)
+            _extract_base_model(name)
+
+    def cached():
+        # Same shape as the sync: one batch per ERP page of 500 products
+        for i in range(0, len(workload), 500):
+            parse_product_names(workload[i:i + 500])
+
+    timed("uncached", uncached, len(workload))
+    parse_product_name.cache_clear()
+    timed("cold", cached, len(workload))
+    timed("warm", cached, len(workload))
+    print(f"\n{parse_product_name.cache_info()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ERP product sync
+===========================
+Runs sync_products_from_erp and create_grouped_products against the local ERP
+simulator (scripts/erp_simulator.py) at several catalog sizes and reports, per
+scenario, wall time, Python memory peak (tracemalloc), MongoDB commands and
+the sync's own phase timings.
+
+Scenarios per catalog size:
+- initial:   empty database, every product inserted
+- unchanged: second delta sync, nothing changed in the ERP
+- churn:     --churn share of the products changed stock/price
+- full:      full sync (every product rewritten, full regroup)
+- regroup:   create_grouped_products() full rebuild alone
+
+Needs a MongoDB (MONGO_URL); the benchmark database (--db-name) is dropped
+before every catalog size, so never point it at real data.
+
+    python scripts/benchmark_sync.py --scales 1 10 100 --latency 0.05
+    python scripts/benchmark_sync.py --scales 10 --failure-rate 0.02 --json sync_benchmark.json
+
+By default the simulator runs in-process, so its allocations count towards
+the memory peak; pass --erp-url to use a simulator started separately
+(its --products must match the catalog size).
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from dotenv import load_dotenv
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+import ecommerce
+from erp_simulator import SyntheticCatalog, create_app, load_names
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Counts MongoDB commands by name and their server time"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.commands = Counter()
+        self.failures = 0
+        self.duration_ms = 0.0
+
+    def started(self, event):
+        self.commands[event.command_name] += 1
+
+    def succeeded(self, event):
+        self.duration_ms += event.duration_micros / 1000
+
+    def failed(self, event):
+        self.failures += 1
+        self.duration_ms += event.duration_micros / 1000
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def start_simulator(app):
+    import uvicorn
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    return server, task, f"http://127.0.0.1:{port}"
+
+
+async def measure(name: str, counter: CommandCounter, coro_fn) -> dict:
+    counter.reset()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    await coro_fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    result = {
+        "scenario": name,
+        "seconds": round(elapsed, 3),
+        "peak_mb": round(peak / 1024 / 1024, 1),
+        "mongo_commands": sum(counter.commands.values()),
+        "mongo_ms": round(counter.duration_ms, 1),
+        "mongo_by_command": dict(counter.commands.most_common())
+    }
+    if name != "regroup":
+        stats = ecommerce.sync_status["last_stats"] or {}
+        result["sync"] = {
+            key: stats.get(key)
+            for key in ("status", "fetched", "inserted", "changed", "removed", "diff_size", "regroup", "timings", "erp")
+        }
+    return result
+
+
+async def run_scale(products: int, args, client) -> list:
+    db = client[args.db_name]
+    await client.drop_database(args.db_name)
+    ecommerce.set_database(db)
+    ecommerce.catalog_store.invalidate()
+    await ecommerce.ensure_shop_indexes()
+    await ecommerce.seed_brand_mappings()
+
+    catalog = SyntheticCatalog(products, seed=args.seed, names=args.names)
+    server = task = None
+    if args.erp_url:
+        ecommerce.ENCOM_API_URL = args.erp_url
+    else:
+        app = create_app(
+            catalog,
+            latency=args.latency,
+            jitter=args.jitter,
+            failure_rate=args.failure_rate,
+            throttle_rate=args.throttle_rate,
+            seed=args.seed
+        )
+        server, task, ecommerce.ENCOM_API_URL = await start_simulator(app)
+
+    results = []
+    try:
+        results.append(await measure("initial", args.counter, ecommerce.sync_products_from_erp))
+        results.append(await measure("unchanged", args.counter, ecommerce.sync_products_from_erp))
+        if args.erp_url:
+            print("  churn skipped: the catalog of an external simulator cannot be changed from here")
+        else:
+            catalog.churn(args.churn, seed=args.seed)
+            results.append(await measure("churn", args.counter, ecommerce.sync_products_from_erp))
+        results.append(await measure("full", args.counter, lambda: ecommerce.sync_products_from_erp(full=True)))
+        results.append(await measure("regroup", args.counter, ecommerce.create_grouped_products))
+    finally:
+        if server:
+            server.should_exit = True
+            await task
+    return results
+
+
+def print_results(products: int, results: list):
+    print(f"\n{products:,} products")
+    print(f"{'scenario':<10} {'seconds':>9} {'peak MB':>9} {'mongo cmds':>11} {'mongo ms':>10}  slowest phases")
+    for r in results:
+        phases = ((r.get("sync") or {}).get("timings") or {}).get("phases", {})
+        slowest = sorted(phases.items(), key=lambda item: -item[1]["seconds"])[:3]
+        slowest = ", ".join(f"{name} {p['seconds']:.2f}s" for name, p in slowest)
+        print(
+            f"{r['scenario']:<10} {r['seconds']:9.2f} {r['peak_mb']:9.1f} "
+            f"{r['mongo_commands']:11,} {r['mongo_ms']:10.0f}  {slowest}"
+        )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ERP product sync against the ERP simulator")
+    parser.add_argument('--base-size', type=int, help="Catalog size at scale 1 (default: golden corpus size)")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10], help="Catalog size multipliers")
+    parser.add_argument('--churn', type=float, default=0.01, help="Share of products changed before the churn sync")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--erp-url', help="Use a simulator started separately instead of an in-process one")
+    parser.add_argument('--mongo-url', default=os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    parser.add_argument('--db-name', default='erp_sync_benchmark', help="Benchmark database (dropped!)")
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    if args.db_name == os.environ.get('DB_NAME'):
+        sys.exit(f"--db-name {args.db_name} is the application database; it would be dropped")
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    logging.basicConfig(level=logging.WARNING)
+    args.names = load_names()
+    base_size = args.base_size or len(args.names)
+    args.counter = CommandCounter()
+    client = AsyncIOMotorClient(args.mongo_url, event_listeners=[args.counter])
+    ecommerce.ENCOM_API_TOKEN = ecommerce.ENCOM_API_TOKEN or "benchmark"
+
+    tracemalloc.start()
+    report = {}
+    try:
+        for scale in args.scales:
+            products = int(base_size * scale)
+            results = await run_scale(products, args, client)
+            print_results(products, results)
+            report[products] = results
+    finally:
+        tracemalloc.stop()
+        await client.drop_database(args.db_name)
+        client.close()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, default=str)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Build the delivery distance grid
+================================
+Queries Google Maps driving distances from the store (STORE_LAT/STORE_LNG) to
+every node of a regular grid over the service area and saves them as a
+compressed NumPy array (services/delivery_grid.py). Quotes inside the grid
+are interpolated from it instead of calling Google.
+
+Nodes outside Paraguay or beyond --radius-km are not queried; quotes there
+fall back to a live lookup. Each node is one Distance Matrix element, so
+check --dry-run before a full build:
+
+    python scripts/build_delivery_grid.py --dry-run
+    python scripts/build_delivery_grid.py --radius-km 25 --step 0.005
+
+Run it again to refresh the grid (new roads, moved store); workers read the
+file at startup. Needs GOOGLE_MAPS_API_KEY.
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from ecommerce import STORE_LAT, STORE_LNG, DELIVERY_GRID_PATH, is_within_paraguay
+from services.delivery_distance import MAX_DESTINATIONS_PER_REQUEST, haversine_distance
+from services.delivery_grid import DeliveryGrid
+
+KM_PER_DEGREE = 111.32
+
+
+def grid_nodes(radius_km: float, step: float):
+    """Grid origin, shape and the (row, col, lat, lng) of the nodes to query"""
+    lat_span = radius_km / KM_PER_DEGREE
+    lng_span = radius_km / (KM_PER_DEGREE * math.cos(math.radians(STORE_LAT)))
+    lat0 = STORE_LAT - lat_span
+    lng0 = STORE_LNG - lng_span
+    rows = int(math.ceil(2 * lat_span / step)) + 1
+    cols = int(math.ceil(2 * lng_span / step)) + 1
+
+    nodes = []
+    for i in range(rows):
+        lat = lat0 + i * step
+        for j in range(cols):
+            lng = lng0 + j * step
+            if not is_within_paraguay(lat, lng):
+                continue
+            # Keep one ring of nodes past the radius so points near it can be interpolated
+            if haversine_distance(STORE_LAT, STORE_LNG, lat, lng) > radius_km + step * KM_PER_DEGREE * 1.5:
+                continue
+            nodes.append((i, j, lat, lng))
+    return lat0, lng0, (rows, cols), nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the delivery road-distance grid")
+    parser.add_argument('--radius-km', type=float, default=25, help="Service area radius around the store")
+    parser.add_argument('--step', type=float, default=0.005, help="Grid spacing in degrees (0.005 = ~550 m)")
+    parser.add_argument('--qps', type=float, default=10, help="Distance Matrix requests per second")
+    parser.add_argument('--output', default=DELIVERY_GRID_PATH)
+    parser.add_argument('--dry-run', action='store_true', help="Only print the grid size and element count")
+    args = parser.parse_args()
+
+    lat0, lng0, shape, nodes = grid_nodes(args.radius_km, args.step)
+    print(f"Grid {shape[0]}x{shape[1]} around {STORE_LAT},{STORE_LNG}: {len(nodes)} nodes to query")
+    if args.dry_run:
+        return
+
+    api_key = os.environ.get('GOOGLE_MAPS_API_KEY', '')
+    if not api_key:
+        sys.exit("GOOGLE_MAPS_API_KEY is not set")
+
+    import googlemaps
+    gmaps = googlemaps.Client(key=api_key, queries_per_second=args.qps)
+
+    distances = np.full(shape, np.nan, dtype=np.float32)
+    started = time.perf_counter()
+    failed = 0
+    for start in range(0, len(nodes), MAX_DESTINATIONS_PER_REQUEST):
+        batch = nodes[start:start + MAX_DESTINATIONS_PER_REQUEST]
+        try:
+            result = gmaps.distance_matrix(
+                origins=[(STORE_LAT, STORE_LNG)],
+                destinations=[(lat, lng) for _, _, lat, lng in batch],
+                mode="driving"
+            )
+        except Exception as e:
+            failed += len(batch)
+            print(f"  batch at node {start} failed: {e}", file=sys.stderr)
+            continue
+        for (i, j, _, _), element in zip(batch, result['rows'][0]['elements']):
+            if element.get('status') == 'OK':
+                distances[i, j] = element['distance']['value'] / 1000
+        done = start + len(batch)
+        if done % (MAX_DESTINATIONS_PER_REQUEST * 40) == 0 or done == len(nodes):
+            print(f"  {done}/{len(nodes)} nodes ({time.perf_counter() - started:.0f}s)")
+
+    grid = DeliveryGrid((STORE_LAT, STORE_LNG), lat0, lng0, args.step, distances)
+    grid.save(args.output)
+    stats = grid.stats()
+    print(f"Saved {args.output}: {stats['routable_nodes']} routable nodes, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
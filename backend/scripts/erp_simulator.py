@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+ERP stand-in: Encom products API
+================================
+Serves a synthetic catalog on POST /products ({"limit", "page"} ->
+{"total", "data"}) like ENCOM_API_URL, so the product sync can be run and
+measured without touching the real ERP.
+
+Product names come from the golden corpus of real ERP names
+(tests/data/product_names_golden.json). Catalogs larger than the corpus repeat
+it with a line prefix ("L001 <name>"), which keeps the size and base model
+patterns of real names while adding new models. Rows are generated per page,
+so a 300k product catalog costs no memory until it is served.
+
+    python scripts/erp_simulator.py --products 300000 --port 8100 --latency 0.3 --failure-rate 0.02
+    ENCOM_API_URL=http://localhost:8100 ENCOM_API_TOKEN=sim uvicorn server:app ...
+
+scripts/benchmark_sync.py runs it in-process.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+GOLDEN_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'tests', 'data', 'product_names_golden.json'
+)
+
+BRANDS = ["Avenue", "Aguara", "Bro Fitwear", "Efimera", "Malva", "Santal", "Immortal", "Thula", "DS", "Olivia"]
+CATEGORIES = ["Remeras", "Pantalones", "Shorts", "Calzas", "Buzos", "Camperas", "Accesorios", "Vestidos"]
+
+
+def load_names() -> list:
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        return [row["name"].strip() for row in json.load(f)]
+
+
+class SyntheticCatalog:
+    """
+    Deterministic catalog of `size` products; row i is always the same unless changed
+
+    churn() changes stock and price of a share of the products, the way the
+    ERP does between two syncs.
+    """
+
+    def __init__(self, size: int, seed: int = 0, names: Optional[list] = None):
+        self.size = size
+        self.seed = seed
+        self.names = names or load_names()
+        self.overrides: Dict[int, dict] = {}
+
+    def row(self, i: int) -> dict:
+        rng = random.Random(self.seed * 1_000_003 + i)
+        copy, index = divmod(i, len(self.names))
+        name = self.names[index] if copy == 0 else f"L{copy:03d} {self.names[index]}"
+        row = {
+            "ID": f"SIM{i:07d}",
+            "Name": name,
+            "sku": f"SKU{i:07d}",
+            "price": rng.randrange(50, 600) * 1000,
+            # About a fifth of the variants are sold out, like the real catalog
+            "stock": 0 if rng.random() < 0.2 else rng.randint(1, 25),
+            "discount": 0,
+            "description": "",
+            "img_url": f"https://erp.example/img/{index}.jpg",
+            "category": CATEGORIES[index % len(CATEGORIES)],
+            "brand": BRANDS[index % len(BRANDS)],
+            "featured": rng.random() < 0.01,
+            "online": True
+        }
+        row.update(self.overrides.get(i, {}))
+        return row
+
+    def page(self, page: int, limit: int) -> list:
+        start = max(0, (page - 1) * limit)
+        return [self.row(i) for i in range(start, min(self.size, start + limit))]
+
+    def churn(self, fraction: float, seed: Optional[int] = None) -> int:
+        """Change stock/price of `fraction` of the products; returns how many changed"""
+        rng = random.Random(seed)
+        changed = rng.sample(range(self.size), int(self.size * fraction))
+        for i in changed:
+            self.overrides[i] = {"stock": rng.randint(0, 25), "price": rng.randrange(50, 600) * 1000}
+        return len(changed)
+
+
+def create_app(
+    catalog: SyntheticCatalog,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    failure_rate: float = 0.0,
+    throttle_rate: float = 0.0,
+    seed: Optional[int] = None
+) -> FastAPI:
+    """ASGI app serving `catalog` with optional latency, 503s and 429s"""
+    app = FastAPI(title="ERP simulator")
+    rng = random.Random(seed)
+    app.state.catalog = catalog
+    app.state.stats = {"requests": 0, "failures": 0, "throttled": 0}
+
+    @app.post("/products")
+    async def products(request: Request):
+        body = await request.json()
+        app.state.stats["requests"] += 1
+        if latency or jitter:
+            await asyncio.sleep(latency + rng.uniform(0, jitter))
+
+        roll = rng.random()
+        if roll < failure_rate:
+            app.state.stats["failures"] += 1
+            return JSONResponse({"error": "simulated failure"}, status_code=503)
+        if roll < failure_rate + throttle_rate:
+            app.state.stats["throttled"] += 1
+            return JSONResponse({"error": "simulated throttling"}, status_code=429, headers={"Retry-After": "1"})
+
+        limit = int(body.get("limit", 500))
+        page = int(body.get("page", 1))
+        return {"total": catalog.size, "data": catalog.page(page, limit)}
+
+    @app.get("/stats")
+    async def stats():
+        return {**app.state.stats, "total": catalog.size, "changed": len(catalog.overrides)}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic Encom products API")
+    parser.add_argument('--products', type=int, default=30000, help="Catalog size")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    args = parser.parse_args()
+
+    import uvicorn
+
+    app = create_app(
+        SyntheticCatalog(args.products, seed=args.seed),
+        latency=args.latency,
+        jitter=args.jitter,
+        failure_rate=args.failure_rate,
+        throttle_rate=args.throttle_rate,
+        seed=args.seed
+    )
+    print(f"Serving {args.products} products on http://{args.host}:{args.port}/products", file=sys.stderr)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+ERP stand-in: stock pushes
+==========================
+Sends signed per-SKU stock/price updates to /api/shop/erp/stock-updates the
+same way the ERP does, to try the push ingestion locally or in tests.
+
+Pick SKUs explicitly or let the script sample them from the local database:
+
+    python scripts/erp_stock_pusher.py --sku 88097903S0287 --stock 3
+    python scripts/erp_stock_pusher.py --random 20 --delta -1
+    python scripts/erp_stock_pusher.py --random 5 --price 150000 --repeat 10 --interval 2
+
+Needs ERP_WEBHOOK_SECRET (same value as the backend) and REACT_APP_BACKEND_URL
+or --url. --random reads SKUs from MONGO_URL / DB_NAME.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+
+import httpx
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env'))
+
+from ecommerce import erp_signature
+
+
+async def sample_skus(count: int) -> list:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[os.environ.get('DB_NAME', 'test_database')]
+    docs = await db.shop_products.aggregate([
+        {"$match": {"sku": {"$nin": [None, ""]}}},
+        {"$sample": {"size": count}},
+        {"$project": {"_id": 0, "sku": 1}}
+    ]).to_list(count)
+    client.close()
+    return [d["sku"] for d in docs]
+
+
+def build_updates(skus: list, args) -> list:
+    updates = []
+    for sku in skus:
+        update = {"sku": sku}
+        if args.stock is not None:
+            update["stock"] = args.stock
+        elif args.delta is not None:
+            update["stock_delta"] = args.delta
+        else:
+            update["stock"] = random.randint(0, 10)
+        if args.price is not None:
+            update["price"] = args.price
+        updates.append(update)
+    return updates
+
+
+async def push(client: httpx.AsyncClient, url: str, secret: str, updates: list) -> httpx.Response:
+    body = json.dumps({"event_id": f"sim-{uuid.uuid4().hex}", "updates": updates}).encode('utf-8')
+    timestamp = str(int(time.time()))
+    return await client.post(url, content=body, headers={
+        "Content-Type": "application/json",
+        "X-ERP-Timestamp": timestamp,
+        "X-ERP-Signature": erp_signature(secret, timestamp, body)
+    })
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Send signed ERP stock pushes to the backend")
+    parser.add_argument('--url', default=os.environ.get('REACT_APP_BACKEND_URL', 'http://localhost:8001'))
+    parser.add_argument('--secret', default=os.environ.get('ERP_WEBHOOK_SECRET', ''))
+    parser.add_argument('--sku', action='append', default=[], help="SKU to update (repeatable)")
+    parser.add_argument('--random', type=int, default=0, help="Also update this many SKUs sampled from the database")
+    parser.add_argument('--stock', type=float, help="New absolute stock (default: random 0-10)")
+    parser.add_argument('--delta', type=float, help="Stock change instead of an absolute value")
+    parser.add_argument('--price', type=float, help="New price")
+    parser.add_argument('--repeat', type=int, default=1, help="Number of pushes")
+    parser.add_argument('--interval', type=float, default=1.0, help="Seconds between pushes")
+    args = parser.parse_args()
+
+    if not args.secret:
+        sys.exit("ERP_WEBHOOK_SECRET is not set")
+    url = f"{args.url.rstrip('/')}/api/shop/erp/stock-updates"
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        for i in range(args.repeat):
+            skus = list(args.sku) + (await sample_skus(args.random) if args.random else [])
+            if not skus:
+                sys.exit("No SKUs: pass --sku or --random")
+            started = time.perf_counter()
+            response = await push(client, url, args.secret, build_updates(skus, args))
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"[{i + 1}/{args.repeat}] {response.status_code} in {elapsed:.0f} ms: {response.text}")
+            if i + 1 < args.repeat:
+                await asyncio.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
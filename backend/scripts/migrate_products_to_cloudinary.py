@@ -170,9 +170,10 @@ async def migrate_product_images():
                     "original_image_url": custom_image  # Backup original URL
                 }
                 
+                # Unsetting the storefront view makes the backend rebuild it on startup
                 await db.shop_products_grouped.update_one(
                     {"grouped_id": product_id},
-                    {"$set": update_data}
+                    {"$set": update_data, "$unset": {"view": ""}}
                 )
                 
                 migrated += 1
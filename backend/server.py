@@ -10,7 +10,7 @@ import json
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from typing import Collection, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
 import bcrypt
@@ -31,6 +31,11 @@ from security import (
     LoginAttemptResult, validate_password_strength, get_security_headers,
     MFASetupResponse, MFAVerifyRequest
 )
+from pagination import find_page, count_cache
+from services.outbox import (
+    OutboxDispatcher, PermanentFailure, SendProgress, enqueue, outbox_message, register_handler,
+    ensure_outbox_indexes, retry_message, outbox_summary
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -362,8 +367,14 @@ def can_manage_users(role: str) -> bool:
     """Check if role can manage user roles"""
     return role in ["superadmin"]
 
-async def send_confirmation_email(reservation: dict):
-    """Send confirmation email for a reservation to both customer and admin"""
+async def send_confirmation_email(reservation: dict, skip: Collection[str] = ()):
+    """Send confirmation email for a reservation to both customer and admin
+
+    Returns {"results": [(target, {"success": ...}), ...]} like email_service;
+    targets in `skip` are not sent to.
+    """
+    results = []
+    target = 'customer'
     try:
         # Email content for customer
         html_content = f"""
@@ -421,8 +432,10 @@ async def send_confirmation_email(reservation: dict):
             "html": html_content
         }
         
-        await asyncio.to_thread(resend.Emails.send, params)
-        logger.info(f"Confirmation email sent to customer: {reservation['email']}")
+        if 'customer' not in skip:
+            await asyncio.to_thread(resend.Emails.send, params)
+            logger.info(f"Confirmation email sent to customer: {reservation['email']}")
+            results.append(('customer', {"success": True}))
         
         # 2. Send confirmation to admin (studio)
         admin_html = f"""
@@ -485,11 +498,17 @@ async def send_confirmation_email(reservation: dict):
             "html": admin_html
         }
         
-        await asyncio.to_thread(resend.Emails.send, admin_params)
-        logger.info(f"Confirmation email sent to admin: {ADMIN_EMAIL_STUDIO}")
+        target = 'admin'
+        if 'admin' not in skip:
+            await asyncio.to_thread(resend.Emails.send, admin_params)
+            logger.info(f"Confirmation email sent to admin: {ADMIN_EMAIL_STUDIO}")
+            results.append(('admin', {"success": True}))
         
     except Exception as e:
         logger.error(f"Failed to send confirmation email: {str(e)}")
+        results.append((target, {"success": False, "error": str(e)}))
+    
+    return {"results": results}
 
 # ==================== NOTIFICATION FUNCTIONS ====================
 
@@ -543,22 +562,33 @@ async def send_admin_email_notification(subject: str, html_content: str, sender_
         logger.error(f"Failed to send admin email notification to {admin_email}: {str(e)}")
         return False
 
-async def notify_new_reservation(reservation: dict):
-    """Send notifications for new studio reservation"""
+async def notify_new_reservation(reservation: dict, skip: Collection[str] = ()):
+    """Send notifications for new studio reservation
+
+    Returns {"results": [("whatsapp", ...), ("admin", ...)]} like email_service;
+    targets in `skip` are not sent to.
+    """
+    results = []
     # Use new WhatsApp service
-    try:
-        from whatsapp_service import notify_new_booking
-        await notify_new_booking({
-            "reservation_id": reservation.get('reservation_id'),
-            "customer_name": reservation.get('name'),
-            "customer_phone": reservation.get('phone', 'N/A'),
-            "date": reservation.get('date'),
-            "start_time": reservation.get('start_time'),
-            "duration_hours": reservation.get('duration_hours'),
-            "total_price": reservation.get('price', 0)
-        })
-    except Exception as e:
-        logger.error(f"Failed to send WhatsApp notification: {e}")
+    if 'whatsapp' not in skip:
+        try:
+            from whatsapp_service import notify_new_booking
+            whatsapp_result = await notify_new_booking({
+                "reservation_id": reservation.get('reservation_id'),
+                "customer_name": reservation.get('name'),
+                "customer_phone": reservation.get('phone', 'N/A'),
+                "date": reservation.get('date'),
+                "start_time": reservation.get('start_time'),
+                "duration_hours": reservation.get('duration_hours'),
+                "total_price": reservation.get('price', 0)
+            })
+        except Exception as e:
+            logger.error(f"Failed to send WhatsApp notification: {e}")
+            whatsapp_result = {"success": False, "error": str(e)}
+        results.append(('whatsapp', whatsapp_result))
+    
+    if 'admin' in skip:
+        return {"results": results}
     
     # Email notification
     email_html = f"""
@@ -577,7 +607,9 @@ async def notify_new_reservation(reservation: dict):
         </div>
     </div>
     """
-    await send_admin_email_notification(f"🎬 Nueva Reserva - {reservation['name']} - {reservation['date']}", email_html, sender_type='studio')
+    email_sent = await send_admin_email_notification(f"🎬 Nueva Reserva - {reservation['name']} - {reservation['date']}", email_html, sender_type='studio')
+    results.append(('admin', {"success": email_sent} if email_sent else {"success": False, "error": "Admin email send failed"}))
+    return {"results": results}
 
 async def notify_new_ugc_application(application: dict):
     """Send notifications for new UGC application"""
@@ -1354,6 +1386,14 @@ async def add_user_address(request: Request):
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
+    # Optional map location, used to quote delivery for saved addresses
+    try:
+        lat = float(address_data["lat"])
+        lng = float(address_data["lng"])
+        address["lat"], address["lng"] = lat, lng
+    except (KeyError, TypeError, ValueError):
+        pass
+    
     # If this is set as default, unset other defaults
     if address["is_default"]:
         await db.users.update_one(
@@ -1525,21 +1565,17 @@ async def create_reservation(reservation_data: ReservationCreate, request: Reque
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    await db.reservations.insert_one(reservation_doc)
-    
+    # Notifications are written ahead of the reservation and sent by the outbox dispatcher
+    source = ("reservations", "reservation_id", reservation_id)
     if is_admin:
         # Admin creates confirmed reservation - send confirmation
-        await send_confirmation_email(reservation_doc)
-        await notify_new_reservation(reservation_doc)
+        kinds = ["reservation_confirmation_email", "reservation_admin_notification"]
     else:
-        # Regular user creates request - send notification to admin and customer
-        await notify_reservation_request(reservation_doc)
-        # Send email notification to both customer and admin
-        try:
-            from email_service import send_booking_request_notification
-            await send_booking_request_notification(db, reservation_doc)
-        except Exception as e:
-            logger.error(f"Failed to send booking request emails: {e}")
+        # Regular user creates request - notify admin, email customer and admin
+        kinds = ["reservation_request_whatsapp", "reservation_request_email"]
+    await enqueue(db, [outbox_message(kind, source=source) for kind in kinds])
+    
+    await db.reservations.insert_one(reservation_doc)
     
     # Remove MongoDB _id before returning
     reservation_doc.pop("_id", None)
@@ -1549,12 +1585,12 @@ async def create_reservation(reservation_data: ReservationCreate, request: Reque
         "message": "Reserva confirmada" if is_admin else "Solicitud de reserva enviada. Te contactaremos para confirmar."
     }
 
-async def notify_reservation_request(reservation: dict):
-    """Send WhatsApp notification for new reservation REQUEST to admin"""
+async def notify_reservation_request(reservation: dict) -> dict:
+    """Send WhatsApp notification for new reservation REQUEST to admin; returns the send result"""
     # Use new WhatsApp service
     try:
         from whatsapp_service import notify_new_booking
-        await notify_new_booking({
+        return await notify_new_booking({
             "reservation_id": reservation.get('reservation_id'),
             "customer_name": reservation.get('name'),
             "customer_phone": reservation.get('phone', 'N/A'),
@@ -1565,6 +1601,7 @@ async def notify_reservation_request(reservation: dict):
         })
     except Exception as e:
         logger.error(f"Failed to send WhatsApp notification: {e}")
+        return {"success": False, "error": str(e)}
 
 @api_router.put("/admin/reservations/{reservation_id}/confirm")
 async def admin_confirm_reservation(reservation_id: str, request: Request):
@@ -2030,6 +2067,10 @@ async def update_admin_settings(settings_update: AdminSettings, request: Request
             {"$set": update_data},
             upsert=True
         )
+        if "show_only_products_with_images" in update_data:
+            # The storefront catalog snapshot depends on this setting
+            from ecommerce import bump_catalog_version
+            await bump_catalog_version()
     
     return await get_admin_settings(request)
 
@@ -2087,21 +2128,26 @@ async def admin_update_order(order_id: str, updates: dict, request: Request):
             {"order_id": order_id},
             {"$set": update_data}
         )
+    if new_status and new_status != old_status:
+        from ecommerce import apply_order_status_to_stock
+        await apply_order_status_to_stock(order_id, new_status)
     
     updated = await db.orders.find_one({"order_id": order_id}, {"_id": 0})
     
     # Send WhatsApp notification to customer when order is marked as "facturado"
     if new_status == "facturado" and old_status != "facturado":
-        await send_order_invoiced_notification(updated)
+        await enqueue(db, [outbox_message("order_invoiced_whatsapp", source=("orders", "order_id", order_id))])
     
     return updated
 
-async def send_order_invoiced_notification(order: dict):
-    """Send WhatsApp notification to customer when order is invoiced"""
+async def send_order_invoiced_notification(order: dict) -> dict:
+    """Send WhatsApp notification to customer when order is invoiced; returns the send result"""
     customer_phone = order.get('customer_phone', '')
     if not customer_phone:
         logger.warning(f"No customer phone for order {order.get('order_id')}")
-        return
+        return {"success": False, "error": "No customer phone"}
+    if not twilio_client:
+        return {"success": False, "error": "Twilio not configured"}
     
     items_text = "\n".join([
         f"• {item.get('name', 'Producto')}" + 
@@ -2144,11 +2190,81 @@ Tu pedido ha sido facturado y confirmado.
 _Avenue - Donde las marcas brillan_
 WhatsApp: +595 973 666 000"""
 
-    try:
-        await send_whatsapp_notification(customer_phone, message)
-        logger.info(f"Invoiced notification sent to {customer_phone} for order {order.get('order_id')}")
-    except Exception as e:
-        logger.error(f"Failed to send invoiced notification to {customer_phone}: {e}")
+    if not await send_whatsapp_notification(customer_phone, message):
+        return {"success": False, "error": "WhatsApp send failed"}
+    logger.info(f"Invoiced notification sent to {customer_phone} for order {order.get('order_id')}")
+    return {"success": True}
+
+# ==================== NOTIFICATION OUTBOX ====================
+
+OUTBOX_CONCURRENCY = int(os.environ.get('OUTBOX_CONCURRENCY', '4'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+
+outbox_dispatcher = OutboxDispatcher(db, concurrency=OUTBOX_CONCURRENCY, max_attempts=OUTBOX_MAX_ATTEMPTS)
+
+# Send errors that retrying cannot fix
+PERMANENT_SEND_ERRORS = {"Twilio not configured", "No customer phone"}
+
+def check_whatsapp_result(result: dict):
+    """Raise for a failed WhatsApp send so the outbox retries it"""
+    if result.get("success"):
+        return
+    if result.get("error") in PERMANENT_SEND_ERRORS:
+        raise PermanentFailure(result["error"])
+    raise RuntimeError(result.get("error") or "WhatsApp send failed")
+
+async def outbox_whatsapp(payload: dict, _source: Optional[dict], _progress: SendProgress):
+    if not twilio_client:
+        raise PermanentFailure("Twilio not configured")
+    if not await send_whatsapp_notification(payload["to"], payload["message"]):
+        raise RuntimeError("WhatsApp send failed")
+
+async def outbox_order_confirmation_email(_payload: dict, order: dict, progress: SendProgress):
+    from email_service import send_order_confirmation
+    await progress.record(await send_order_confirmation(db, order, skip=progress.sent))
+
+async def outbox_order_admin_whatsapp(_payload: dict, order: dict, _progress: SendProgress):
+    from whatsapp_service import notify_new_order
+    check_whatsapp_result(await notify_new_order(order))
+
+async def outbox_order_invoiced_whatsapp(_payload: dict, order: dict, _progress: SendProgress):
+    check_whatsapp_result(await send_order_invoiced_notification(order))
+
+async def outbox_reservation_confirmation_email(_payload: dict, reservation: dict, progress: SendProgress):
+    await progress.record(await send_confirmation_email(reservation, skip=progress.sent))
+
+async def outbox_reservation_admin_notification(_payload: dict, reservation: dict, progress: SendProgress):
+    await progress.record(await notify_new_reservation(reservation, skip=progress.sent), PERMANENT_SEND_ERRORS)
+
+async def outbox_reservation_request_whatsapp(_payload: dict, reservation: dict, _progress: SendProgress):
+    check_whatsapp_result(await notify_reservation_request(reservation))
+
+async def outbox_reservation_request_email(_payload: dict, reservation: dict, progress: SendProgress):
+    from email_service import send_booking_request_notification
+    await progress.record(await send_booking_request_notification(db, reservation, skip=progress.sent))
+
+register_handler("whatsapp", outbox_whatsapp)
+register_handler("order_confirmation_email", outbox_order_confirmation_email)
+register_handler("order_admin_whatsapp", outbox_order_admin_whatsapp)
+register_handler("order_invoiced_whatsapp", outbox_order_invoiced_whatsapp)
+register_handler("reservation_confirmation_email", outbox_reservation_confirmation_email)
+register_handler("reservation_admin_notification", outbox_reservation_admin_notification)
+register_handler("reservation_request_whatsapp", outbox_reservation_request_whatsapp)
+register_handler("reservation_request_email", outbox_reservation_request_email)
+
+@api_router.get("/admin/notifications/outbox")
+async def admin_get_outbox(request: Request, failures: int = 20):
+    """Outbox message counts per status and the latest failed messages (admin only)"""
+    await require_admin(request)
+    return await outbox_summary(db, min(max(failures, 0), 200))
+
+@api_router.post("/admin/notifications/outbox/{message_id}/retry")
+async def admin_retry_outbox_message(message_id: str, request: Request):
+    """Send a failed or discarded notification again (admin only)"""
+    await require_admin(request)
+    if not await retry_message(db, message_id):
+        raise HTTPException(status_code=404, detail="No failed message with that ID")
+    return {"success": True}
 
 # ==================== BRAND INQUIRIES ROUTES ====================
 
@@ -2540,9 +2656,15 @@ async def get_audit_logs(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     limit: int = 100,
-    skip: int = 0
+    skip: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = True
 ):
-    """Get audit logs (admin only)"""
+    """Get audit logs (admin only)
+    
+    Pass the previous response's next_cursor to page without skip;
+    include_total=false skips the count.
+    """
     await require_admin(request)
     
     # Build query
@@ -2561,14 +2683,17 @@ async def get_audit_logs(
             query["timestamp"] = {"$lte": end_date}
     
     # Get logs
-    logs = await db.audit_logs.find(query, {"_id": 0}).sort("timestamp", -1).skip(skip).limit(limit).to_list(limit)
-    total = await db.audit_logs.count_documents(query)
+    logs, next_cursor = await find_page(
+        db.audit_logs, query, "timestamp", -1, limit, cursor=cursor, skip=skip, projection={"_id": 0}
+    )
+    total = await count_cache.count(db.audit_logs, query) if include_total else None
     
     return {
         "logs": logs,
         "total": total,
         "limit": limit,
-        "skip": skip
+        "skip": skip,
+        "next_cursor": next_cursor
     }
 
 @api_router.get("/admin/audit-logs/actions")
@@ -3979,6 +4104,10 @@ async def startup_event():
     logger.info("Starting e-commerce product sync...")
     await start_sync_on_startup()
     
+    # Notifications of orders and reservations are sent from the outbox
+    await ensure_outbox_indexes(db)
+    asyncio.create_task(outbox_dispatcher.run())
+    
     # Run contract jobs immediately on startup
     logger.info("Running UGC contract jobs...")
     try:
@@ -4019,5 +4148,6 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    outbox_dispatcher.stop()
     scheduler.shutdown()
     client.close()
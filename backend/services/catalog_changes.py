@@ -0,0 +1,44 @@
+"""
+Catalog Changes - per-version change log of the grouped catalog
+Every catalog version bump records which grouped products were added or
+changed and which were removed, so clients holding a version can catch up
+with a delta instead of downloading the listing again
+"""
+from typing import Iterable, List, Optional, Tuple
+
+# One document per catalog version:
+# {"_id": version, "at": datetime, "reset": bool, "upserted": [grouped_id], "removed": [grouped_id]}
+# reset=True marks a version whose changes are unknown (e.g. a display setting changed)
+CATALOG_CHANGES_COLLECTION = "shop_catalog_changes"
+
+
+def collapse_changes(
+    entries: Iterable[dict],
+    since: int,
+    version: int,
+    max_products: int
+) -> Optional[Tuple[List[str], List[str]]]:
+    """Net (upserted, removed) grouped IDs between `since` (exclusive) and `version`
+
+    `entries` are the change log documents of that range. Returns None when
+    the delta cannot be computed and the client has to reload the catalog:
+    a version is missing (expired from the log or never recorded), a version
+    is a reset, or more than `max_products` products changed.
+    """
+    state = {}
+    expected = since + 1
+    for entry in sorted(entries, key=lambda e: e["_id"]):
+        if entry["_id"] != expected or entry.get("reset"):
+            return None
+        expected += 1
+        for grouped_id in entry.get("upserted") or []:
+            state[grouped_id] = True
+        for grouped_id in entry.get("removed") or []:
+            state[grouped_id] = False
+        if len(state) > max_products:
+            return None
+    if expected != version + 1:
+        return None
+    upserted = [gid for gid, present in state.items() if present]
+    removed = [gid for gid, present in state.items() if not present]
+    return upserted, removed
@@ -0,0 +1,113 @@
+"""
+Catalog Facets - materialized facet counts for the storefront catalog
+Counts grouped products per (brand, gender, size, price band) once per catalog
+version, so filter options and their counts are lookups instead of aggregations
+"""
+from itertools import product as cartesian
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CATALOG_FACETS_COLLECTION = "shop_catalog_facets"
+CATALOG_FACETS_ID = "current"
+
+# Wildcard value: the count does not filter on that dimension
+ANY = "*"
+
+DIMENSIONS = ("brand", "gender", "size", "band")
+
+# Price bands in Guaraníes over the grouped product price (its cheapest variant);
+# min is inclusive, max exclusive, None means unbounded
+PRICE_BANDS = [
+    {"key": "0-150k", "label": "Hasta 150.000 Gs", "min": None, "max": 150000},
+    {"key": "150k-300k", "label": "150.000 - 300.000 Gs", "min": 150000, "max": 300000},
+    {"key": "300k-500k", "label": "300.000 - 500.000 Gs", "min": 300000, "max": 500000},
+    {"key": "500k-1m", "label": "500.000 - 1.000.000 Gs", "min": 500000, "max": 1000000},
+    {"key": "1m+", "label": "Más de 1.000.000 Gs", "min": 1000000, "max": None},
+]
+PRICE_BAND_KEYS = [band["key"] for band in PRICE_BANDS]
+
+
+def price_band(price) -> str:
+    """Band key of a price ('' when the product has no price)"""
+    if not isinstance(price, (int, float)):
+        return ""
+    for band in PRICE_BANDS:
+        if (band["min"] is None or price >= band["min"]) and (band["max"] is None or price < band["max"]):
+            return band["key"]
+    return ""
+
+
+def build_facet_cells(products: Iterable[dict], brand_of: Callable[[dict], str]) -> List[dict]:
+    """Base cells: products per (brand, gender, band) for every size and for size '*'
+
+    A product has one brand, gender and band but several sizes, so it is
+    counted once per size it is available in plus once under size '*'.
+    Rollups over brand, gender and band are plain sums of these cells.
+    """
+    counts: Dict[Tuple[str, str, str, str], int] = {}
+    for p in products:
+        brand = brand_of(p) or ""
+        gender = p.get("gender") or ""
+        band = price_band(p.get("price"))
+        for size in {s for s in (p.get("sizes_list") or []) if s} | {ANY}:
+            key = (brand, gender, size, band)
+            counts[key] = counts.get(key, 0) + 1
+    return [
+        {"brand": b, "gender": g, "size": s, "band": p, "count": n}
+        for (b, g, s, p), n in counts.items()
+    ]
+
+
+class FacetCube:
+    """
+    Every rollup of the base cells, keyed by (brand, gender, size, band) with '*'
+    for "any", so the number of products for any combination of filters is a
+    single dictionary lookup
+    """
+
+    def __init__(self, cells: List[dict]):
+        self.cells = cells
+        self.counts: Dict[Tuple[str, str, str, str], int] = {}
+        self.values: Dict[str, set] = {dim: set() for dim in DIMENSIONS}
+
+        for cell in cells:
+            brand, gender, size, band = (cell[dim] for dim in DIMENSIONS)
+            for dim, value in zip(DIMENSIONS, (brand, gender, size, band)):
+                if value != ANY:
+                    self.values[dim].add(value)
+            # size is already rolled up in the cells ('*' row), the rest is done here
+            for key in cartesian((brand, ANY), (gender, ANY), (size,), (band, ANY)):
+                self.counts[key] = self.counts.get(key, 0) + cell["count"]
+
+    def count(self, brand: str = ANY, gender: str = ANY, size: str = ANY, band: str = ANY) -> int:
+        return self.counts.get((brand, gender, size, band), 0)
+
+    def count_brands(self, brands: Optional[Iterable[str]], gender: str = ANY, size: str = ANY, band: str = ANY) -> int:
+        """Count over several brand values (None = any brand)"""
+        if brands is None:
+            return self.count(ANY, gender, size, band)
+        return sum(self.count(b, gender, size, band) for b in brands)
+
+    def facet(
+        self,
+        dimension: str,
+        brands: Optional[Iterable[str]] = None,
+        gender: str = ANY,
+        size: str = ANY,
+        band: str = ANY
+    ) -> Dict[str, int]:
+        """Counts per value of one dimension under the filters on the other dimensions
+
+        The dimension's own filter is ignored, so the counts show what
+        choosing another value of it would return.
+        """
+        filters = {"gender": gender, "size": size, "band": band}
+        brands = list(brands) if brands is not None else None
+        result = {}
+        for value in self.values[dimension]:
+            if dimension == "brand":
+                n = self.count(value, gender, size, band)
+            else:
+                n = self.count_brands(brands, **{**filters, dimension: value})
+            if n:
+                result[value] = n
+        return result
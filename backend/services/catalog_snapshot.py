@@ -0,0 +1,291 @@
+"""
+Catalog Snapshot - in-process read model of the storefront catalog
+Holds the in-stock grouped products of one catalog version in memory, with
+filter indexes, so listing and filter queries are answered without MongoDB
+"""
+import asyncio
+import bisect
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from services.search_index import SearchIndex, SuggestIndex, fold_text
+from services.catalog_facets import FacetCube, build_facet_cells
+
+logger = logging.getLogger(__name__)
+
+# One document ({"_id": "catalog", "version": int, "updated_at": iso}) whose
+# version is bumped every time the grouped catalog or its display settings change
+CATALOG_META_COLLECTION = "shop_catalog_meta"
+CATALOG_META_ID = "catalog"
+
+# Fields the storefront search looks at and how much a hit in each one counts
+SEARCH_FIELD_WEIGHTS = {
+    "base_model": 3.0,
+    "custom_name": 3.0,
+    "brand": 2.0,
+    "category": 2.0,
+    "description": 1.0,
+    "custom_description": 1.0
+}
+
+
+def facet_brand(p: dict) -> str:
+    """Brand dimension of the facets: the ERP category, or the brand when it has none"""
+    return (p.get("category") or p.get("brand") or "").strip()
+
+
+def _has_image(p: dict) -> bool:
+    custom_image = p.get("custom_image")
+    if isinstance(custom_image, str) and custom_image:
+        return True
+    images = p.get("images")
+    return bool(isinstance(images, list) and images and isinstance(images[0], str) and images[0])
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of one catalog version
+
+    `products` are the raw grouped documents and `items` their storefront
+    representation, both sorted like the MongoDB listing (base_model ascending).
+    Filters resolve to sets of positions in that order.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        updated_at: Optional[str],
+        products: List[dict],
+        to_item: Callable[[dict], dict],
+        show_only_with_images: bool = False,
+        brand_label: Optional[Callable[[str], str]] = None,
+        facet_cells: Optional[List[dict]] = None
+    ):
+        products = sorted(products, key=lambda p: (p.get("base_model") or "", p.get("grouped_id") or ""))
+        self.version = version
+        self.updated_at = updated_at
+        self.show_only_with_images = show_only_with_images
+        self.products = products
+        self.items = [to_item(p) for p in products]
+        # Listing order key of every position, what listing cursors point at
+        self.sort_keys = [(p.get("base_model") or "", p.get("grouped_id") or "") for p in products]
+        self.by_id: Dict[str, int] = {}
+        self.by_brand: Dict[str, Set[int]] = {}
+        self.by_brand_key: Dict[str, Set[int]] = {}
+        self.by_gender: Dict[str, Set[int]] = {}
+        self.by_size: Dict[str, Set[int]] = {}
+        self.with_image: Set[int] = set()
+        priced = []
+
+        for i, p in enumerate(products):
+            if p.get("grouped_id"):
+                self.by_id[p["grouped_id"]] = i
+            # category and brand share one index, the brand filter matches either
+            for value in (p.get("category"), p.get("brand")):
+                if isinstance(value, str) and value:
+                    self.by_brand.setdefault(value, set()).add(i)
+            if p.get("brand_key"):
+                self.by_brand_key.setdefault(p["brand_key"], set()).add(i)
+            if p.get("gender") is not None:
+                self.by_gender.setdefault(p["gender"], set()).add(i)
+            for s in p.get("sizes_list") or []:
+                if s:
+                    self.by_size.setdefault(s, set()).add(i)
+            if _has_image(p):
+                self.with_image.add(i)
+            if isinstance(p.get("price"), (int, float)):
+                priced.append((p["price"], i))
+
+        priced.sort()
+        self.prices = [price for price, _ in priced]
+        self.price_positions = [i for _, i in priced]
+        self.search_index = SearchIndex(enumerate(products), SEARCH_FIELD_WEIGHTS)
+        self.suggest_index = SuggestIndex(self._build_suggestions(brand_label or (lambda value: value)))
+        # Materialized cells of this version are reused when available
+        if facet_cells is None:
+            facet_cells = build_facet_cells((self.products[i] for i in self.visible_positions()), facet_brand)
+        self.facets = FacetCube(facet_cells)
+
+    def __len__(self):
+        return len(self.products)
+
+    def visible_positions(self) -> Iterable[int]:
+        """Products the listing can show without any filter"""
+        return sorted(self.with_image) if self.show_only_with_images else range(len(self.products))
+
+    def _build_suggestions(self, brand_label: Callable[[str], str]) -> List[dict]:
+        """Autocomplete entries for the visible catalog: brands, categories and products"""
+        visible = self.visible_positions()
+        brand_counts: Dict[str, int] = {}
+        category_counts: Dict[str, int] = {}
+        products = []
+
+        for i in visible:
+            p = self.products[i]
+            brand = p.get("brand_name") or p.get("brand") or p.get("category")
+            if brand:
+                label = p.get("brand_name") or brand_label(brand)
+                brand_counts[label] = brand_counts.get(label, 0) + 1
+            if p.get("category"):
+                label = brand_label(p["category"])
+                category_counts[label] = category_counts.get(label, 0) + 1
+            item = self.items[i]
+            if item.get("name"):
+                products.append({
+                    "type": "product",
+                    "label": item["name"],
+                    "value": item["name"],
+                    "id": item.get("id"),
+                    "image": item.get("image")
+                })
+
+        # Categories are usually the brand itself, only suggest the ones that are not
+        brand_keys = {fold_text(b) for b in brand_counts}
+        return (
+            [{"type": "brand", "label": b, "value": b, "count": c} for b, c in brand_counts.items()]
+            + [
+                {"type": "category", "label": c, "value": c, "count": n}
+                for c, n in category_counts.items() if fold_text(c) not in brand_keys
+            ]
+            + products
+        )
+
+    def price_range(self, min_price: Optional[float], max_price: Optional[float]) -> Set[int]:
+        start = bisect.bisect_left(self.prices, min_price) if min_price else 0
+        end = bisect.bisect_right(self.prices, max_price) if max_price else len(self.prices)
+        return set(self.price_positions[start:end])
+
+    def filter(
+        self,
+        brand_match: Optional[Callable[[str], bool]] = None,
+        brand_key: Optional[str] = None,
+        gender: Optional[str] = None,
+        size: Optional[str] = None,
+        search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None
+    ) -> List[int]:
+        """Positions of the products matching every given filter
+
+        In listing order, or by relevance (best first) when searching.
+        """
+        candidates: Optional[Set[int]] = None
+
+        def narrow(positions: Iterable[int]):
+            nonlocal candidates
+            positions = positions if isinstance(positions, set) else set(positions)
+            candidates = positions if candidates is None else candidates & positions
+
+        if self.show_only_with_images:
+            narrow(self.with_image)
+        if brand_key:
+            narrow(self.by_brand_key.get(brand_key, set()))
+        if brand_match:
+            matched = set()
+            for value, positions in self.by_brand.items():
+                if brand_match(value):
+                    matched |= positions
+            narrow(matched)
+        if gender:
+            narrow(self.by_gender.get(gender, set()))
+        if size:
+            narrow(self.by_size.get(size.upper(), set()))
+        if min_price or max_price:
+            narrow(self.price_range(min_price, max_price))
+        if search:
+            scores = self.search_index.search(search)
+            if candidates is not None:
+                scores = {i: score for i, score in scores.items() if i in candidates}
+            return sorted(scores, key=lambda i: (-scores[i], i))
+
+        if candidates is None:
+            return list(range(len(self.products)))
+        return sorted(candidates)
+
+    def window(self, positions: List[int], start: int, limit: int) -> List[dict]:
+        return [self.items[i] for i in positions[start:start + limit]]
+
+    def start_after(self, positions: List[int], cursor: dict) -> int:
+        """Index in `positions` where the page after `cursor` starts
+
+        Listing cursors hold the (base_model, grouped_id) of the last item seen,
+        so they stay correct when the catalog changes between pages. Relevance
+        ordered results (search) use a plain offset.
+        """
+        if "offset" in cursor:
+            return max(0, int(cursor["offset"]))
+        after = cursor.get("after")
+        if not isinstance(after, list) or len(after) != 2:
+            return 0
+        key = (after[0] or "", after[1] or "")
+        return bisect.bisect_right(positions, key, key=lambda i: self.sort_keys[i])
+
+    def cursor_at(self, positions: List[int], end: int, ranked: bool) -> Optional[dict]:
+        """Cursor of the page that starts at `end`, None when there is none"""
+        if end >= len(positions):
+            return None
+        if ranked:
+            return {"offset": end}
+        return {"after": list(self.sort_keys[positions[end - 1]])}
+
+    def get(self, grouped_id: str) -> Optional[dict]:
+        i = self.by_id.get(grouped_id)
+        return self.products[i] if i is not None else None
+
+
+class CatalogStore:
+    """
+    Per-process holder of the current CatalogSnapshot
+
+    Every worker keeps its own copy. The catalog version in MongoDB is checked
+    at most every `check_interval` seconds; when it moved, a new snapshot is
+    built in the background while requests keep using the previous one, so
+    listing latency does not depend on the database. Only the very first
+    request of a process waits for the initial load.
+    """
+
+    def __init__(
+        self,
+        read_version: Callable[[], Awaitable[Tuple[int, Optional[str]]]],
+        load: Callable[[int, Optional[str]], Awaitable[CatalogSnapshot]],
+        check_interval: float = 5.0
+    ):
+        self.read_version = read_version
+        self.load = load
+        self.check_interval = check_interval
+        self.snapshot: Optional[CatalogSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get(self) -> Optional[CatalogSnapshot]:
+        """Current snapshot, or None when it could not be loaded (callers fall back to MongoDB)"""
+        stale = time.monotonic() - self._checked_at > self.check_interval
+        if self.snapshot is None:
+            if stale:
+                await self.refresh()
+        elif stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.refresh())
+        return self.snapshot
+
+    async def refresh(self, force: bool = False):
+        """Reload the snapshot if the catalog version changed (or always with force=True)"""
+        async with self._lock:
+            try:
+                version, updated_at = await self.read_version()
+                if force or self.snapshot is None or self.snapshot.version != version:
+                    started = time.monotonic()
+                    self.snapshot = await self.load(version, updated_at)
+                    logger.info(
+                        f"Catalog snapshot v{version} loaded: {len(self.snapshot)} products "
+                        f"in {(time.monotonic() - started) * 1000:.0f} ms"
+                    )
+            except Exception as e:
+                logger.error(f"Error loading catalog snapshot: {str(e)}")
+            finally:
+                self._checked_at = time.monotonic()
+
+    def invalidate(self):
+        """Make the next request check the catalog version"""
+        self._checked_at = 0.0
@@ -0,0 +1,264 @@
+"""
+Coupons - cached coupon definitions and atomic redemption at checkout
+Definitions are read from an in-process cache that every worker drops when an
+admin edit bumps the coupons version; a redemption is one conditional $inc on
+current_uses, so concurrent checkouts can never go past max_uses
+"""
+import logging
+import secrets
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError
+
+from services.mongo_indexes import create_indexes
+
+logger = logging.getLogger(__name__)
+
+COUPONS_COLLECTION = "shop_coupons"
+COUPON_REDEMPTIONS_COLLECTION = "shop_coupon_redemptions"
+COUPON_META_COLLECTION = "shop_coupon_meta"
+COUPON_META_ID = "coupons"
+
+# Redemption lifecycle: redeemed at order creation -> released if the order is cancelled
+REDEMPTION_REDEEMED = "redeemed"
+REDEMPTION_RELEASED = "released"
+
+# Generated codes avoid characters that are easy to misread (0/O, 1/I/L)
+CODE_ALPHABET = "ABCDEFGHJKMNPQRSTUVWXYZ23456789"
+
+
+class CouponRejected(Exception):
+    """The coupon cannot be used for this order; `detail` is shown to the customer"""
+
+    def __init__(self, detail: str, status_code: int = 400):
+        self.detail = detail
+        self.status_code = status_code
+        super().__init__(detail)
+
+
+def normalize_code(code: str) -> str:
+    return (code or "").upper().strip()
+
+
+def coupon_discount(coupon: dict, subtotal: float, now: Optional[datetime] = None) -> float:
+    """Discount of `coupon` on `subtotal`; raises CouponRejected when it does not apply
+
+    Usage is checked against the coupon's current_uses, which may be a cached
+    value; redeem_coupon() is the authoritative check.
+    """
+    if not coupon.get("is_active", True):
+        raise CouponRejected("Este cupón ya no está activo")
+
+    if coupon.get("expires_at"):
+        expires = datetime.fromisoformat(coupon["expires_at"].replace("Z", "+00:00"))
+        if expires.tzinfo is None:
+            expires = expires.replace(tzinfo=timezone.utc)
+        if (now or datetime.now(timezone.utc)) > expires:
+            raise CouponRejected("Este cupón ha expirado")
+
+    if coupon.get("max_uses") and coupon.get("current_uses", 0) >= coupon["max_uses"]:
+        raise CouponRejected("Este cupón ha alcanzado el límite de usos")
+
+    if coupon.get("min_purchase") and subtotal < coupon["min_purchase"]:
+        min_purchase = coupon["min_purchase"]
+        raise CouponRejected(f"El pedido mínimo para este cupón es de {int(min_purchase):,} Gs".replace(",", "."))
+
+    if coupon["discount_type"] == "percentage":
+        discount_amount = subtotal * (coupon["discount_value"] / 100)
+    else:
+        discount_amount = coupon["discount_value"]
+
+    # Ensure discount doesn't exceed subtotal
+    return min(discount_amount, subtotal)
+
+
+class CouponCache:
+    """
+    Per-process cache of coupon definitions by code, least recently used
+    evicted first
+
+    The coupons version in MongoDB is checked at most every `check_interval`
+    seconds; when an edit moved it, every cached definition is dropped. Unknown
+    codes are not cached, so coupons inserted directly (welcome coupons) are
+    found on their first use.
+    """
+
+    def __init__(self, db=None, check_interval: float = 5.0, max_entries: int = 20000):
+        self.db = db
+        self.check_interval = check_interval
+        self.max_entries = max_entries
+        self.version: Optional[int] = None
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    async def _check_version(self):
+        if time.monotonic() - self._checked_at <= self.check_interval:
+            return
+        meta = await self.db[COUPON_META_COLLECTION].find_one({"_id": COUPON_META_ID})
+        version = (meta or {}).get("version", 0)
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+        self._checked_at = time.monotonic()
+
+    async def get(self, code: str) -> Optional[dict]:
+        code = normalize_code(code)
+        await self._check_version()
+        coupon = self._entries.get(code)
+        if coupon is not None:
+            self._entries.move_to_end(code)
+            self.hits += 1
+            return coupon
+
+        self.misses += 1
+        coupon = await self.db[COUPONS_COLLECTION].find_one({"code": code}, {"_id": 0})
+        if coupon is not None:
+            self.put(coupon)
+        return coupon
+
+    def put(self, coupon: dict):
+        self._entries[coupon["code"]] = coupon
+        self._entries.move_to_end(coupon["code"])
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, code: str):
+        self._entries.pop(normalize_code(code), None)
+
+    def invalidate(self):
+        """Make the next lookup check the coupons version"""
+        self._checked_at = 0.0
+
+    def stats(self) -> dict:
+        return {"version": self.version, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+async def bump_coupons_version(db) -> int:
+    """Tell every worker's CouponCache that coupon definitions changed"""
+    meta = await db[COUPON_META_COLLECTION].find_one_and_update(
+        {"_id": COUPON_META_ID},
+        {"$inc": {"version": 1}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return meta["version"]
+
+
+async def ensure_coupon_indexes(db):
+    await create_indexes(db, [
+        (COUPONS_COLLECTION, "batch_id", {"sparse": True}),
+        (COUPON_REDEMPTIONS_COLLECTION, "order_id", {"unique": True}),
+        (COUPON_REDEMPTIONS_COLLECTION, "code", {}),
+        # Fails on databases that still hold duplicate codes from before it existed
+        (COUPONS_COLLECTION, "code", {"unique": True})
+    ])
+
+
+async def redeem_coupon(db, code: str, order_id: str, discount_amount: float) -> dict:
+    """Take one use of an active coupon for an order
+
+    current_uses is only incremented while it is below max_uses (no limit when
+    max_uses is unset or 0), in the same update that reads it. Returns the
+    coupon after the increment; raises CouponRejected when no use is left.
+    """
+    code = normalize_code(code)
+    coupon = await db[COUPONS_COLLECTION].find_one_and_update(
+        {
+            "code": code,
+            "is_active": {"$ne": False},
+            "$or": [
+                {"max_uses": {"$in": [None, 0]}},
+                {"$expr": {"$lt": ["$current_uses", "$max_uses"]}}
+            ]
+        },
+        {"$inc": {"current_uses": 1}},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+    if coupon is None:
+        existing = await db[COUPONS_COLLECTION].find_one({"code": code}, {"_id": 0, "is_active": 1})
+        if existing is None:
+            raise CouponRejected("Cupón no válido", status_code=404)
+        if existing.get("is_active") is False:
+            raise CouponRejected("Este cupón ya no está activo")
+        raise CouponRejected("Este cupón ha alcanzado el límite de usos")
+
+    await db[COUPON_REDEMPTIONS_COLLECTION].insert_one({
+        "code": code,
+        "order_id": order_id,
+        "discount_amount": discount_amount,
+        "status": REDEMPTION_REDEEMED,
+        "redeemed_at": datetime.now(timezone.utc)
+    })
+    return coupon
+
+
+async def release_coupon(db, order_id: str, reason: str) -> Optional[str]:
+    """Give back the coupon use of an order (once); returns the released code"""
+    redemption = await db[COUPON_REDEMPTIONS_COLLECTION].find_one_and_update(
+        {"order_id": order_id, "status": REDEMPTION_REDEEMED},
+        {"$set": {
+            "status": REDEMPTION_RELEASED,
+            "released_at": datetime.now(timezone.utc),
+            "release_reason": reason
+        }}
+    )
+    if redemption is None:
+        return None
+    await db[COUPONS_COLLECTION].update_one(
+        {"code": redemption["code"], "current_uses": {"$gt": 0}},
+        {"$inc": {"current_uses": -1}}
+    )
+    logger.info(f"Coupon {redemption['code']} of order {order_id} released ({reason})")
+    return redemption["code"]
+
+
+def random_code(prefix: str, length: int) -> str:
+    return prefix + "".join(secrets.choice(CODE_ALPHABET) for _ in range(length))
+
+
+async def generate_coupons(db, template: dict, count: int, prefix: str = "", length: int = 8) -> Tuple[str, List[str]]:
+    """Insert `count` coupons with random unique codes sharing `template`
+
+    Codes that collide with existing ones (unique index on code) are drawn
+    again. Returns the batch id stored on every coupon and the new codes.
+    """
+    prefix = normalize_code(prefix)
+    batch_id = f"BATCH-{uuid.uuid4().hex[:8].upper()}"
+    created_at = datetime.now(timezone.utc).isoformat()
+    codes: List[str] = []
+    pending = count
+
+    for _ in range(5):
+        batch_codes = list({random_code(prefix, length) for _ in range(pending)})
+        docs = [
+            {
+                **template,
+                "id": str(uuid.uuid4()),
+                "code": code,
+                "current_uses": 0,
+                "batch_id": batch_id,
+                "created_at": created_at
+            }
+            for code in batch_codes
+        ]
+        try:
+            await db[COUPONS_COLLECTION].insert_many(docs, ordered=False)
+            codes.extend(batch_codes)
+        except BulkWriteError as e:
+            failed = {docs[err["index"]]["code"] for err in e.details.get("writeErrors", [])}
+            codes.extend(c for c in batch_codes if c not in failed)
+        pending = count - len(codes)
+        if pending <= 0:
+            break
+
+    if pending > 0:
+        logger.warning(f"Coupon batch {batch_id}: only {len(codes)} of {count} codes generated")
+    return batch_id, codes
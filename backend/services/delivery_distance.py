@@ -0,0 +1,206 @@
+"""
+Delivery Distance - driving distance from the store with a per-cell cache
+Points covered by the precomputed delivery grid are answered from it; other
+Google Maps lookups run in a worker thread (the googlemaps client is
+synchronous), results are cached per rounded coordinate cell, and concurrent
+quotes for the same cell share one lookup
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371
+
+# Where a distance came from
+SOURCE_GRID = "grid"
+SOURCE_GOOGLE = "google"
+SOURCE_HAVERSINE = "haversine"
+
+# Distance Matrix limit for a single origin
+MAX_DESTINATIONS_PER_REQUEST = 25
+
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Calculate distance between two points using Haversine formula"""
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    delta_lat = math.radians(lat2 - lat1)
+    delta_lon = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_lat/2)**2 + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(delta_lon/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+    return EARTH_RADIUS_KM * c
+
+
+class DistanceService:
+    """
+    Driving distance (km) from `origin` to a destination
+
+    With a `grid` (services.delivery_grid.DeliveryGrid), destinations it
+    covers are interpolated from it without any lookup. Other destinations are snapped to a cell of `cell_decimals` decimal degrees
+    (3 decimals is about 110 m) and the distance to the cell center is cached
+    for `ttl_seconds`. Without a Google Maps client, or when the lookup fails,
+    the straight-line distance is used; failed lookups are not cached so the
+    next quote retries Google.
+
+    Usage:
+        distances = DistanceService((STORE_LAT, STORE_LNG), gmaps, grid=grid)
+        km, source = await distances.distance_km(lat, lng)
+    """
+
+    def __init__(
+        self,
+        origin: Tuple[float, float],
+        client=None,
+        grid=None,
+        cell_decimals: int = 3,
+        ttl_seconds: float = 7 * 86400,
+        max_entries: int = 50000
+    ):
+        self.origin = origin
+        self.client = client
+        self.grid = grid
+        self.cell_decimals = cell_decimals
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[float, float], Tuple[float, float, str]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[float, float], asyncio.Task] = {}
+        self.grid_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.lookups = 0
+        self.lookup_errors = 0
+
+    def cell(self, lat: float, lng: float) -> Tuple[float, float]:
+        return round(lat, self.cell_decimals), round(lng, self.cell_decimals)
+
+    def cached(self, lat: float, lng: float) -> Optional[Tuple[float, str]]:
+        """(km, source) of the destination's cell if cached and fresh"""
+        key = self.cell(lat, lng)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, km, source = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return km, source
+
+    def _store(self, key: Tuple[float, float], km: float, source: str):
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, km, source)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def distance_km(self, lat: float, lng: float) -> Tuple[float, str]:
+        """(km, source) from the origin to the destination (or its cell)"""
+        return (await self.distance_km_many([(lat, lng)]))[0]
+
+    async def distance_km_many(self, points: List[Tuple[float, float]]) -> List[Tuple[float, str]]:
+        """(km, source) for every (lat, lng), with as few Google requests as possible
+
+        The grid answers all covered points in one vectorized lookup. The
+        remaining cells are served from the cache, joined to lookups already
+        in flight, or looked up MAX_DESTINATIONS_PER_REQUEST per request.
+        """
+        results: List[Optional[Tuple[float, str]]] = [None] * len(points)
+        if self.grid is not None and points:
+            kms = self.grid.lookup([lat for lat, _ in points], [lng for _, lng in points])
+            for index, km in enumerate(kms.tolist()):
+                if not math.isnan(km):
+                    self.grid_hits += 1
+                    results[index] = (km, SOURCE_GRID)
+
+        waiting: Dict[Tuple[float, float], List[int]] = {}
+        for index, (lat, lng) in enumerate(points):
+            if results[index] is not None:
+                continue
+            cached = self.cached(lat, lng)
+            if cached is not None:
+                self.hits += 1
+                results[index] = cached
+            else:
+                waiting.setdefault(self.cell(lat, lng), []).append(index)
+        if not waiting:
+            return results
+
+        new_keys = [key for key in waiting if key not in self._in_flight]
+        self.coalesced += len(waiting) - len(new_keys)
+        self.misses += len(new_keys)
+        for start in range(0, len(new_keys), MAX_DESTINATIONS_PER_REQUEST):
+            chunk = new_keys[start:start + MAX_DESTINATIONS_PER_REQUEST]
+            # Tasks of their own, so a caller going away does not cancel the
+            # lookup other callers of the same cells are waiting for
+            lookup = asyncio.create_task(self._resolve(chunk))
+            for key in chunk:
+                task = asyncio.create_task(_pick(lookup, key))
+                self._in_flight[key] = task
+                task.add_done_callback(lambda _, key=key: self._in_flight.pop(key, None))
+
+        keys = list(waiting)
+        distances = await asyncio.gather(*(asyncio.shield(self._in_flight[key]) for key in keys))
+        for key, distance in zip(keys, distances):
+            for index in waiting[key]:
+                results[index] = distance
+        return results
+
+    async def _resolve(self, keys: List[Tuple[float, float]]) -> Dict[Tuple[float, float], Tuple[float, str]]:
+        resolved = {}
+        for key, (km, source, cacheable) in (await self._lookup(keys)).items():
+            if cacheable:
+                self._store(key, km, source)
+            resolved[key] = (km, source)
+        return resolved
+
+    async def _lookup(self, keys: List[Tuple[float, float]]) -> Dict[Tuple[float, float], Tuple[float, str, bool]]:
+        """(km, source, cacheable) per cell, with one Distance Matrix request"""
+        straight = {key: haversine_distance(self.origin[0], self.origin[1], *key) for key in keys}
+        if not self.client:
+            return {key: (km, SOURCE_HAVERSINE, True) for key, km in straight.items()}
+
+        self.lookups += 1
+        try:
+            result = await asyncio.to_thread(
+                self.client.distance_matrix,
+                origins=[self.origin],
+                destinations=keys,
+                mode="driving"
+            )
+            elements = result['rows'][0]['elements']
+        except Exception as e:
+            self.lookup_errors += 1
+            logger.warning(f"Distance lookup failed for {len(keys)} destinations: {str(e)}")
+            return {key: (km, SOURCE_HAVERSINE, False) for key, km in straight.items()}
+
+        distances = {}
+        for key, element in zip(keys, elements):
+            if element.get('status') == 'OK':
+                distances[key] = (element['distance']['value'] / 1000, SOURCE_GOOGLE, True)
+            else:
+                # No driving route (e.g. across water): the answer will not change
+                distances[key] = (straight[key], SOURCE_HAVERSINE, True)
+        return distances
+
+    def stats(self) -> dict:
+        return {
+            "grid": self.grid.stats() if self.grid is not None else None,
+            "grid_hits": self.grid_hits,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "lookups": self.lookups,
+            "lookup_errors": self.lookup_errors
+        }
+
+
+async def _pick(lookup: asyncio.Task, key: Tuple[float, float]) -> Tuple[float, str]:
+    return (await lookup)[key]
@@ -0,0 +1,127 @@
+"""
+Delivery Grid - precomputed driving distances from the store over the service area
+A regular lat/lng grid of road distances (km) built offline by
+scripts/build_delivery_grid.py and stored as a compressed .npz; quotes
+interpolate it, so only the refresh job calls Google Maps
+"""
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryGrid:
+    """
+    Road distance (km) at lat0 + i * step, lng0 + j * step for every grid node
+
+    Nodes without a driving route are NaN. lookup() interpolates bilinearly
+    between the four nodes around each point and returns NaN outside the grid
+    or next to a NaN node, where the caller has to fall back to a live lookup.
+    """
+
+    def __init__(
+        self,
+        origin: Tuple[float, float],
+        lat0: float,
+        lng0: float,
+        step: float,
+        distances: np.ndarray,
+        built_at: Optional[str] = None
+    ):
+        self.origin = (float(origin[0]), float(origin[1]))
+        self.lat0 = float(lat0)
+        self.lng0 = float(lng0)
+        self.step = float(step)
+        self.distances = np.asarray(distances, dtype=np.float32)
+        self.built_at = built_at
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.distances.shape
+
+    def node_coordinates(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Latitudes of the rows and longitudes of the columns"""
+        rows, cols = self.shape
+        return self.lat0 + np.arange(rows) * self.step, self.lng0 + np.arange(cols) * self.step
+
+    def lookup(self, lats, lngs) -> np.ndarray:
+        """Interpolated road distance for each (lat, lng); NaN where the grid cannot answer"""
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lngs = np.atleast_1d(np.asarray(lngs, dtype=np.float64))
+        rows, cols = self.shape
+
+        y = (lats - self.lat0) / self.step
+        x = (lngs - self.lng0) / self.step
+        inside = (y >= 0) & (y <= rows - 1) & (x >= 0) & (x <= cols - 1)
+
+        # Top-left node of each point's cell; points on the last row/column use the cell before it
+        i = np.clip(np.floor(np.where(inside, y, 0)).astype(np.int64), 0, max(rows - 2, 0))
+        j = np.clip(np.floor(np.where(inside, x, 0)).astype(np.int64), 0, max(cols - 2, 0))
+        i1 = np.minimum(i + 1, rows - 1)
+        j1 = np.minimum(j + 1, cols - 1)
+        fy = np.where(inside, y - i, 0)
+        fx = np.where(inside, x - j, 0)
+
+        d = self.distances
+        result = (
+            d[i, j] * (1 - fy) * (1 - fx)
+            + d[i, j1] * (1 - fy) * fx
+            + d[i1, j] * fy * (1 - fx)
+            + d[i1, j1] * fy * fx
+        )
+        return np.where(inside, result, np.nan)
+
+    def distance_km(self, lat: float, lng: float) -> Optional[float]:
+        value = float(self.lookup(lat, lng)[0])
+        return None if np.isnan(value) else value
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        np.savez_compressed(
+            path,
+            distances=self.distances,
+            origin=np.array(self.origin),
+            bounds=np.array([self.lat0, self.lng0, self.step]),
+            built_at=np.array(self.built_at or datetime.now(timezone.utc).isoformat())
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "DeliveryGrid":
+        with np.load(path) as data:
+            lat0, lng0, step = data["bounds"].tolist()
+            return cls(
+                origin=tuple(data["origin"].tolist()),
+                lat0=lat0,
+                lng0=lng0,
+                step=step,
+                distances=data["distances"],
+                built_at=str(data["built_at"])
+            )
+
+    def stats(self) -> dict:
+        return {
+            "shape": list(self.shape),
+            "step": self.step,
+            "routable_nodes": int(np.count_nonzero(~np.isnan(self.distances))),
+            "built_at": self.built_at
+        }
+
+
+def load_delivery_grid(path: str, origin: Tuple[float, float]) -> Optional[DeliveryGrid]:
+    """The grid at `path`, or None if it is missing, unreadable or built for another store"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        grid = DeliveryGrid.load(path)
+    except Exception as e:
+        logger.error(f"Error loading delivery grid {path}: {str(e)}")
+        return None
+    if not np.allclose(grid.origin, origin, atol=1e-6):
+        logger.warning(f"Ignoring delivery grid {path}: built for store at {grid.origin}, not {origin}")
+        return None
+    logger.info(f"Loaded delivery grid {path}: {grid.shape[0]}x{grid.shape[1]} nodes, built {grid.built_at}")
+    return grid
@@ -0,0 +1,241 @@
+"""
+ERP Client - Encom products API
+Concurrent, adaptively paced page fetcher used by the e-commerce product sync
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import AsyncIterator, Iterable, List, Optional, Tuple
+
+import httpx
+
+from services.sync_metrics import LatencyHistogram
+
+logger = logging.getLogger(__name__)
+
+# Status codes that mean "slow down / try again later"
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ErpPageError(Exception):
+    """Raised when a page could not be fetched after all retries"""
+
+    def __init__(self, page: int, reason: str):
+        self.page = page
+        self.reason = reason
+        super().__init__(f"ERP page {page} failed: {reason}")
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit that adapts to the ERP (additive increase, multiplicative decrease)
+
+    - Fast responses raise the limit by one, up to `maximum`
+    - Slow responses lower it by one
+    - 429/5xx responses halve it and add a pause before the next request
+    """
+
+    def __init__(
+        self,
+        initial: int = 2,
+        minimum: int = 1,
+        maximum: int = 4,
+        target_latency: float = 2.0,
+        max_delay: float = 30.0
+    ):
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = max(self.minimum, min(initial, self.maximum))
+        self.target_latency = target_latency
+        self.max_delay = max_delay
+        self.delay = 0.0
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+
+    async def release(self):
+        async with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def on_success(self, latency: float):
+        if latency > self.target_latency * 2:
+            self.limit = max(self.minimum, self.limit - 1)
+        elif latency < self.target_latency:
+            self.limit = min(self.maximum, self.limit + 1)
+        # Recover from earlier throttling gradually
+        self.delay = self.delay / 2 if self.delay > 0.05 else 0.0
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        self.limit = max(self.minimum, self.limit // 2)
+        self.delay = min(self.max_delay, max(retry_after or 0.0, self.delay * 2, 0.5))
+
+
+class ErpProductsClient:
+    """
+    Fetches product pages from the ERP over a single keep-alive connection pool
+
+    Usage:
+        async with ErpProductsClient(url, token) as erp:
+            first = await erp.fetch_page(1)
+            async for page, products in erp.iter_pages(range(2, total_pages + 1)):
+                ...
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        per_page: int = 500,
+        max_concurrency: int = 4,
+        max_retries: int = 4,
+        max_buffered_pages: int = 2,
+        timeout: float = 180,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url.rstrip('/')
+        self.token = token
+        self.per_page = per_page
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.max_buffered_pages = max(1, max_buffered_pages)
+        self.timeout = timeout
+        self.transport = transport
+        self.limiter = AdaptiveLimiter(initial=min(2, self.max_concurrency), maximum=self.max_concurrency)
+        self.failed_pages: List[int] = []
+        self.retries = 0
+        # Time to get each page, retries and backoff included
+        self.page_latencies = LatencyHistogram()
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def __aenter__(self):
+        self._client = httpx.AsyncClient(
+            timeout=self.timeout,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.token}"
+            },
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency
+            ),
+            transport=self.transport
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._client.aclose()
+        self._client = None
+
+    async def fetch_page(self, page: int) -> dict:
+        """Fetch one page, retrying network errors, 429 and 5xx with backoff"""
+        last_error = "unknown error"
+        page_started = time.monotonic()
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+                backoff = min(self.limiter.max_delay, 0.5 * (2 ** (attempt - 1)))
+                await asyncio.sleep(backoff + random.uniform(0, backoff / 2))
+
+            await self.limiter.acquire()
+            started = time.monotonic()
+            try:
+                response = await self._client.post(
+                    f"{self.base_url}/products",
+                    json={"limit": self.per_page, "page": page}
+                )
+            except httpx.HTTPError as e:
+                last_error = f"{type(e).__name__}: {e}"
+                self.limiter.on_throttle()
+                logger.warning(f"ERP page {page} attempt {attempt + 1} failed: {last_error}")
+                continue
+            finally:
+                await self.limiter.release()
+
+            latency = time.monotonic() - started
+
+            if response.status_code == 200:
+                try:
+                    data = response.json()
+                except ValueError as e:
+                    # Truncated or non-JSON body (proxy error page); worth another try
+                    last_error = f"Invalid JSON: {e}"
+                    logger.warning(f"ERP page {page} attempt {attempt + 1} failed: {last_error}")
+                    continue
+                self.limiter.on_success(latency)
+                self.page_latencies.observe(time.monotonic() - page_started)
+                return data
+
+            last_error = f"HTTP {response.status_code}"
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                # Auth or request errors will not fix themselves
+                break
+
+            self.limiter.on_throttle(_parse_retry_after(response))
+            logger.warning(f"ERP page {page} attempt {attempt + 1} failed: {last_error}")
+
+        raise ErpPageError(page, last_error)
+
+    async def iter_pages(self, pages: Iterable[int]) -> AsyncIterator[Tuple[int, list]]:
+        """
+        Yield (page, products) as pages complete, fetching up to the adaptive limit at once
+
+        Pages that still fail after retries are recorded in `failed_pages`
+        instead of being yielded. At most `max_buffered_pages` fetched pages wait
+        for the consumer; when the buffer is full, workers stop fetching
+        (backpressure), so memory does not grow with the catalog size.
+        """
+        pending: asyncio.Queue = asyncio.Queue()
+        for page in pages:
+            pending.put_nowait(page)
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.max_buffered_pages)
+
+        async def worker():
+            while True:
+                try:
+                    page = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    data = await self.fetch_page(page)
+                    await results.put((page, data.get('data', []), None))
+                except ErpPageError as e:
+                    await results.put((page, None, e))
+                except Exception as e:
+                    # Every page must produce exactly one result or the consumer waits forever
+                    await results.put((page, None, ErpPageError(page, f"{type(e).__name__}: {e}")))
+
+        remaining = pending.qsize()
+        workers = [asyncio.create_task(worker()) for _ in range(self.max_concurrency)]
+
+        try:
+            while remaining:
+                page, products, error = await results.get()
+                remaining -= 1
+                if error:
+                    logger.error(str(error))
+                    self.failed_pages.append(page)
+                    continue
+                yield page, products
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _parse_retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
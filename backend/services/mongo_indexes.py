@@ -0,0 +1,24 @@
+"""
+Mongo Indexes - create a list of indexes one at a time
+A failing index (e.g. unique over existing duplicates) is logged on its own and
+does not stop the indexes after it from being created
+"""
+import logging
+from typing import Iterable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (collection, keys, create_index options)
+IndexSpec = Tuple[str, object, dict]
+
+
+async def create_indexes(db, specs: Iterable[IndexSpec]) -> int:
+    """Create every index in `specs`; returns how many failed"""
+    failed = 0
+    for collection, keys, options in specs:
+        try:
+            await db[collection].create_index(keys, **options)
+        except Exception as e:
+            failed += 1
+            logger.error(f"Error creating index {keys} {options} on {collection}: {str(e)}")
+    return failed
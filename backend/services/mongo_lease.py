@@ -0,0 +1,83 @@
+"""
+Mongo Lease - a named lock shared by every worker and process using the database
+One document per lease in shop_leases; acquiring it is a single conditional
+upsert, so only one holder at a time wins. A holder that dies stops blocking
+the others once its lease expires.
+"""
+import asyncio
+import contextvars
+import os
+import socket
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+from typing import Dict
+
+from pymongo.errors import DuplicateKeyError
+
+LEASES_COLLECTION = "shop_leases"
+
+# Identifies this process in lease documents (host:pid:random)
+PROCESS_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+# Leases held in this context and the task holding each, so nested `lease()` blocks
+# do not wait on themselves (tasks spawned inside a block inherit the context but
+# not the lease)
+_held: contextvars.ContextVar[Dict[str, int]] = contextvars.ContextVar("held_leases", default={})
+
+
+class LeaseBusy(Exception):
+    """The lease is held by someone else and did not free up in time"""
+
+    def __init__(self, name: str, holder: str = None):
+        self.name = name
+        self.holder = holder
+        super().__init__(f"Lease {name} is held by {holder or 'another process'}")
+
+
+async def try_acquire(db, name: str, holder: str, ttl_seconds: float) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await db[LEASES_COLLECTION].find_one_and_update(
+            {"_id": name, "expires_at": {"$lte": now}},
+            {"$set": {"holder": holder, "acquired_at": now, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        # The document exists and is held: the upsert tried to insert a second one
+        return False
+
+
+async def release(db, name: str, holder: str):
+    await db[LEASES_COLLECTION].delete_one({"_id": name, "holder": holder})
+
+
+@asynccontextmanager
+async def lease(db, name: str, ttl_seconds: float = 600, wait_seconds: float = 30, poll_interval: float = 0.2):
+    """Hold the lease `name` for the block, waiting up to `wait_seconds` for it
+
+    Raises LeaseBusy when it stays taken. Re-entering a lease the task already
+    holds does not wait. `ttl_seconds` must cover the longest holder, as an
+    expired lease can be taken over.
+    """
+    task = id(asyncio.current_task())
+    if _held.get().get(name) == task:
+        yield
+        return
+
+    holder = f"{PROCESS_ID}:{uuid.uuid4().hex[:8]}"
+    deadline = time.monotonic() + wait_seconds
+    while not await try_acquire(db, name, holder, ttl_seconds):
+        if time.monotonic() >= deadline:
+            current = await db[LEASES_COLLECTION].find_one({"_id": name}, {"holder": 1})
+            raise LeaseBusy(name, (current or {}).get("holder"))
+        await asyncio.sleep(poll_interval)
+
+    token = _held.set({**_held.get(), name: task})
+    try:
+        yield
+    finally:
+        _held.reset(token)
+        await release(db, name, holder)
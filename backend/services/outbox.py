@@ -0,0 +1,306 @@
+"""
+Notification Outbox - durable queue for the side effects of orders and reservations
+Requests only insert outbox messages; a background dispatcher sends them
+(WhatsApp, email) with retries, a concurrency limit and per-message status,
+so customer-facing latency no longer includes third-party round-trips
+"""
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Collection, Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from services.mongo_indexes import create_indexes
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_COLLECTION = "notification_outbox"
+
+# Message lifecycle: pending -> sending -> sent, or back to pending with a
+# later next_attempt_at, until max attempts -> failed. Messages whose source
+# document never appeared are discarded.
+STATUS_PENDING = "pending"
+STATUS_SENDING = "sending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+STATUS_DISCARDED = "discarded"
+
+# Finished messages are kept this long for auditing, then removed by a TTL index
+FINISHED_MESSAGE_RETENTION_DAYS = 30
+# A message written ahead of its source (order, reservation) waits this long for it
+SOURCE_GRACE_SECONDS = 300
+
+# handler(payload, source_document, progress) -> None; raise to retry, PermanentFailure to give up
+OutboxHandler = Callable[[dict, Optional[dict], "SendProgress"], Awaitable[None]]
+_handlers: Dict[str, OutboxHandler] = {}
+_wakeup = asyncio.Event()
+
+
+class PermanentFailure(Exception):
+    """The message can never be delivered (e.g. channel not configured); do not retry"""
+
+
+class SendProgress:
+    """
+    Recipients a message already reached, stored on the message (`sent_to`)
+    so a retry after a partial failure only sends to the rest
+
+    Multi-recipient handlers pass `sent` to their sender as the recipients
+    to skip, then `record` its {"results": [(recipient, result), ...]}.
+    """
+
+    def __init__(self, db, message: dict):
+        self.db = db
+        self.message_id = message["message_id"]
+        self.sent = set(message.get("sent_to") or [])
+
+    async def record(self, result: dict, permanent_errors: Collection[str] = ()):
+        """Save the recipients reached and raise if any other can still be reached on a retry
+
+        Recipients failing with one of `permanent_errors` are given up on;
+        the message only fails for good when nobody was reached at all.
+        """
+        results = result.get("results", [])
+        reached = [recipient for recipient, r in results if r.get("success")]
+        if reached:
+            await self.db[OUTBOX_COLLECTION].update_one(
+                {"message_id": self.message_id},
+                {"$addToSet": {"sent_to": {"$each": reached}}}
+            )
+            self.sent.update(reached)
+        failed = [r for _, r in results if not r.get("success")]
+        retryable = [r for r in failed if r.get("error") not in permanent_errors]
+        if retryable:
+            raise RuntimeError(retryable[-1].get("error") or "Send failed")
+        if failed:
+            if not self.sent:
+                raise PermanentFailure(failed[-1]["error"])
+            logger.warning(f"Outbox {self.message_id}: gave up on some recipients: {failed[-1]['error']}")
+
+
+def register_handler(kind: str, handler: OutboxHandler):
+    _handlers[kind] = handler
+
+
+def outbox_message(kind: str, payload: Optional[dict] = None, source: Optional[tuple] = None) -> dict:
+    """A message of `kind`; `source` is (collection, id field, id) of the document it is about
+
+    The dispatcher loads the source document when sending and passes it to
+    the handler, so messages can be written before the document itself.
+    """
+    now = datetime.now(timezone.utc)
+    message = {
+        "message_id": f"MSG-{uuid.uuid4().hex[:12].upper()}",
+        "kind": kind,
+        "payload": payload or {},
+        "status": STATUS_PENDING,
+        "attempts": 0,
+        "last_error": None,
+        "created_at": now,
+        "next_attempt_at": now
+    }
+    if source:
+        collection, field, value = source
+        message["source"] = {"collection": collection, "field": field, "id": value}
+    return message
+
+
+async def enqueue(db, messages: List[dict]):
+    """Store messages in one insert and wake the dispatcher"""
+    if not messages:
+        return
+    await db[OUTBOX_COLLECTION].insert_many(messages)
+    for message in messages:
+        message.pop("_id", None)
+    _wakeup.set()
+
+
+async def ensure_outbox_indexes(db):
+    await create_indexes(db, [
+        (OUTBOX_COLLECTION, "message_id", {"unique": True}),
+        (OUTBOX_COLLECTION, [("status", 1), ("next_attempt_at", 1)], {}),
+        (OUTBOX_COLLECTION, [("source.collection", 1), ("source.id", 1)], {}),
+        (OUTBOX_COLLECTION, "purge_at", {"expireAfterSeconds": 0})
+    ])
+
+
+async def retry_message(db, message_id: str) -> bool:
+    """Send a failed or discarded message again"""
+    result = await db[OUTBOX_COLLECTION].update_one(
+        {"message_id": message_id, "status": {"$in": [STATUS_FAILED, STATUS_DISCARDED]}},
+        {
+            "$set": {"status": STATUS_PENDING, "next_attempt_at": datetime.now(timezone.utc)},
+            "$unset": {"purge_at": ""}
+        }
+    )
+    if result.modified_count:
+        _wakeup.set()
+    return result.modified_count > 0
+
+
+class OutboxDispatcher:
+    """
+    Drains the outbox: claims due messages, runs their handler with at most
+    `concurrency` sends in flight, and records the outcome
+
+    A claim is a lease: a worker that dies mid-send leaves the message in
+    "sending" until `lease_seconds` pass, then another dispatcher retries it.
+    Failed sends back off exponentially from `base_delay` up to `max_delay`.
+    """
+
+    def __init__(
+        self,
+        db,
+        concurrency: int = 4,
+        max_attempts: int = 8,
+        base_delay: float = 30,
+        max_delay: float = 3600,
+        lease_seconds: float = 300,
+        poll_interval: float = 10
+    ):
+        self.db = db
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._running = False
+
+    async def claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.db[OUTBOX_COLLECTION].find_one_and_update(
+            {"$or": [
+                {"status": STATUS_PENDING, "next_attempt_at": {"$lte": now}},
+                {"status": STATUS_SENDING, "locked_until": {"$lte": now}}
+            ]},
+            {
+                "$set": {"status": STATUS_SENDING, "locked_until": now + timedelta(seconds=self.lease_seconds)},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _finish(self, message: dict, status: str, error: Optional[str] = None):
+        now = datetime.now(timezone.utc)
+        update = {"status": status, "last_error": error, "finished_at": now}
+        if status == STATUS_SENT:
+            update["sent_at"] = now
+        update["purge_at"] = now + timedelta(days=FINISHED_MESSAGE_RETENTION_DAYS)
+        await self.db[OUTBOX_COLLECTION].update_one(
+            {"message_id": message["message_id"]},
+            {"$set": update, "$unset": {"locked_until": ""}}
+        )
+
+    async def _retry_later(self, message: dict, error: str, delay: Optional[float] = None, count_attempt: bool = True):
+        if delay is None:
+            delay = min(self.max_delay, self.base_delay * (2 ** (message["attempts"] - 1)))
+            delay += random.uniform(0, delay / 4)
+        update = {"$set": {
+            "status": STATUS_PENDING,
+            "last_error": error,
+            "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay)
+        }, "$unset": {"locked_until": ""}}
+        if not count_attempt:
+            update["$inc"] = {"attempts": -1}
+        await self.db[OUTBOX_COLLECTION].update_one({"message_id": message["message_id"]}, update)
+
+    async def deliver(self, message: dict):
+        """Run one claimed message's handler and record the outcome"""
+        handler = _handlers.get(message["kind"])
+        if handler is None:
+            await self._finish(message, STATUS_FAILED, f"No handler for {message['kind']}")
+            return
+
+        source_doc = None
+        source = message.get("source")
+        if source:
+            source_doc = await self.db[source["collection"]].find_one({source["field"]: source["id"]}, {"_id": 0})
+            if source_doc is None:
+                created_at = message["created_at"]
+                if created_at.tzinfo is None:
+                    created_at = created_at.replace(tzinfo=timezone.utc)
+                if datetime.now(timezone.utc) - created_at > timedelta(seconds=SOURCE_GRACE_SECONDS):
+                    await self._finish(message, STATUS_DISCARDED, f"{source['collection']} {source['id']} not found")
+                else:
+                    await self._retry_later(message, "source not written yet", delay=5, count_attempt=False)
+                return
+
+        try:
+            await handler(message.get("payload") or {}, source_doc, SendProgress(self.db, message))
+        except PermanentFailure as e:
+            logger.warning(f"Outbox {message['message_id']} ({message['kind']}) dropped: {str(e)}")
+            await self._finish(message, STATUS_FAILED, str(e))
+            return
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if message["attempts"] >= self.max_attempts:
+                logger.error(f"Outbox {message['message_id']} ({message['kind']}) failed for good: {error}")
+                await self._finish(message, STATUS_FAILED, error)
+            else:
+                logger.warning(f"Outbox {message['message_id']} ({message['kind']}) attempt {message['attempts']} failed: {error}")
+                await self._retry_later(message, error)
+            return
+        await self._finish(message, STATUS_SENT)
+
+    async def drain(self) -> int:
+        """Deliver every due message, `concurrency` at a time; returns how many were handled"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        handled = 0
+
+        async def run(message):
+            try:
+                await self.deliver(message)
+            except Exception as e:
+                logger.error(f"Outbox {message['message_id']} delivery error: {str(e)}")
+            finally:
+                semaphore.release()
+
+        while True:
+            await semaphore.acquire()
+            message = await self.claim()
+            if message is None:
+                semaphore.release()
+                break
+            handled += 1
+            task = asyncio.create_task(run(message))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        return handled
+
+    async def run(self):
+        """Drain now, then whenever a message is enqueued or every poll_interval"""
+        self._running = True
+        while self._running:
+            _wakeup.clear()
+            try:
+                await self.drain()
+            except Exception as e:
+                logger.error(f"Outbox dispatcher error: {str(e)}")
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def stop(self):
+        self._running = False
+        _wakeup.set()
+
+
+async def outbox_summary(db, recent_failures: int = 20) -> dict:
+    """Message counts per status and the latest failed messages"""
+    counts = await db[OUTBOX_COLLECTION].aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+    ]).to_list(None)
+    failed = await db[OUTBOX_COLLECTION].find(
+        {"status": {"$in": [STATUS_FAILED, STATUS_DISCARDED]}},
+        {"_id": 0, "payload": 0}
+    ).sort("finished_at", -1).limit(recent_failures).to_list(recent_failures)
+    return {"counts": {c["_id"]: c["count"] for c in counts}, "recent_failures": failed}
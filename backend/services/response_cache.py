@@ -0,0 +1,115 @@
+"""
+Response Cache - ETags and cached JSON bodies for catalog-versioned endpoints
+A response is a function of (catalog version, path, query), so its ETag can be
+derived without building it and the serialized body is reused until the
+catalog version moves
+"""
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Clients must revalidate every time; a matching ETag turns that into a bodyless 304
+CACHE_CONTROL = "no-cache"
+
+
+def normalize_query(request: Request) -> str:
+    """Path and query string with sorted parameters and empty values dropped"""
+    params = sorted(
+        (key, value.strip())
+        for key, value in request.query_params.multi_items()
+        if value and value.strip()
+    )
+    query = "&".join(f"{key}={value}" for key, value in params)
+    return f"{request.url.path}?{query}"
+
+
+def make_etag(version: Any, key: str) -> str:
+    """Strong ETag of the response to `key` at a given version"""
+    digest = hashlib.sha1(f"{version}|{key}".encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """If-None-Match check (a list of ETags or '*'; weak validators compare equal)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class ResponseCache:
+    """
+    Serialized bodies of the current catalog version, least recently used
+    evicted first. Entries of an older version are dropped as soon as a
+    request for a newer one comes in.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.version: Any = None
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, version: Any, key: str) -> Optional[bytes]:
+        if version != self.version:
+            return None
+        body = self._entries.get(key)
+        if body is not None:
+            self._entries.move_to_end(key)
+        return body
+
+    def put(self, version: Any, key: str, body: bytes):
+        if version != self.version:
+            self._entries.clear()
+            self.version = version
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"version": self.version, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _response(body: Optional[bytes], etag: str, status_code: int = 200) -> Response:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if body is None:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+async def serve_versioned(
+    request: Request,
+    cache: Optional[ResponseCache],
+    version: Any,
+    build: Callable[[], Awaitable[Any]]
+) -> Response:
+    """Response for `request` at `version`: 304, cached body or freshly built one
+
+    Without a cache only the ETag and the 304 handling apply.
+    """
+    key = normalize_query(request)
+    etag = make_etag(version, key)
+    if etag_matches(request, etag):
+        return _response(None, etag)
+
+    body = cache.get(version, key) if cache is not None else None
+    if body is not None:
+        cache.hits += 1
+        return _response(body, etag)
+
+    data = await build()
+    body = JSONResponse(content=jsonable_encoder(data)).body
+    if cache is not None:
+        cache.misses += 1
+        cache.put(version, key, body)
+    return _response(body, etag)
@@ -0,0 +1,155 @@
+"""
+Search Index - accent-insensitive inverted index for the storefront catalog
+Built with every catalog snapshot; answers multi-word queries ranked by relevance
+"""
+import bisect
+import re
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Words that carry no meaning in product searches ("remera de algodon")
+STOPWORDS = {"de", "del", "la", "el", "los", "las", "y", "con", "para", "en", "por", "un", "una"}
+
+# A term that is a whole word in the product counts more than one that only prefixes a word
+EXACT_MATCH_BOOST = 1.0
+PREFIX_MATCH_BOOST = 0.6
+
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip accents: 'Pantalón Niño' -> 'pantalon nino'"""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Accent-folded alphanumeric tokens of a text"""
+    return _TOKEN_RE.findall(fold_text(text))
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct query tokens without stopwords (stopwords are kept if they are all there is)"""
+    tokens = list(dict.fromkeys(tokenize(query)))
+    terms = [t for t in tokens if t not in STOPWORDS]
+    return terms or tokens
+
+
+class SearchIndex:
+    """
+    Inverted index: token -> {document: weight}
+
+    A document is any integer key (the catalog snapshot uses positions) with
+    text fields; every field has a weight, so a hit in the model name ranks
+    above a hit in the description. Query terms match tokens exactly or by
+    prefix, so results appear while a word is still being typed.
+    """
+
+    def __init__(self, documents: Iterable[Tuple[int, Dict[str, Optional[str]]]], field_weights: Dict[str, float]):
+        self.postings: Dict[str, Dict[int, float]] = {}
+        for doc, fields in documents:
+            for field, weight in field_weights.items():
+                for token in set(tokenize(fields.get(field) or "")):
+                    entry = self.postings.setdefault(token, {})
+                    entry[doc] = entry.get(doc, 0.0) + weight
+        self.vocabulary = sorted(self.postings)
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def _expand(self, term: str) -> List[str]:
+        """Vocabulary tokens starting with term"""
+        start = bisect.bisect_left(self.vocabulary, term)
+        end = bisect.bisect_left(self.vocabulary, term + "\uffff")
+        return self.vocabulary[start:end]
+
+    def _term_scores(self, term: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for token in self._expand(term):
+            boost = EXACT_MATCH_BOOST if token == term else PREFIX_MATCH_BOOST
+            for doc, weight in self.postings[token].items():
+                score = weight * boost
+                if score > scores.get(doc, 0.0):
+                    scores[doc] = score
+        return scores
+
+    def search(self, query: str) -> Dict[int, float]:
+        """Score of every document that matches all the query terms"""
+        terms = query_terms(query)
+        if not terms:
+            return {}
+
+        # Rarest term first keeps the running intersection small
+        per_term = sorted((self._term_scores(t) for t in terms), key=len)
+        scores = dict(per_term[0])
+        for term_scores in per_term[1:]:
+            scores = {doc: score + term_scores[doc] for doc, score in scores.items() if doc in term_scores}
+            if not scores:
+                break
+        return scores
+
+
+# Brands first, then categories, then individual products
+SUGGESTION_TYPE_PRIORITY = {"brand": 0, "category": 1, "product": 2}
+
+
+class SuggestIndex:
+    """
+    Prefix index for search-as-you-type
+
+    Every suggestion is reachable from the start of its label and from the
+    start of each later word ("negro" finds "Remera Basica Negro"). Keys are
+    folded word sequences without stopwords kept in one sorted list, so a
+    lookup is a bisect plus a scan of the matching range. Results are memoized
+    per prefix (the index never changes), which makes the short, popular
+    prefixes with long ranges cheap after the first request.
+    """
+
+    def __init__(self, suggestions: Iterable[dict], cache_size: int = 4096):
+        self.suggestions = list(suggestions)
+        self.cache_size = cache_size
+        self._cache: Dict[Tuple[str, int], List[dict]] = {}
+        keyed = []
+        for n, suggestion in enumerate(self.suggestions):
+            words = [w for w in tokenize(suggestion["label"]) if w not in STOPWORDS]
+            for w in range(len(words)):
+                keyed.append((" ".join(words[w:]), n, w == 0))
+        keyed.sort()
+        self.keys = [key for key, _, _ in keyed]
+        self.refs = [(n, from_start) for _, n, from_start in keyed]
+
+    def __len__(self):
+        return len(self.suggestions)
+
+    def suggest(self, query: str, limit: int = 8) -> List[dict]:
+        """Best `limit` completions: label prefix before word prefix, then type, then count"""
+        prefix = " ".join(query_terms(query))
+        if not prefix:
+            return []
+        cached = self._cache.get((prefix, limit))
+        if cached is not None:
+            return cached
+
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + "\uffff")
+        from_start: Dict[int, bool] = {}
+        for i in range(start, end):
+            n, is_start = self.refs[i]
+            from_start[n] = from_start.get(n, False) or is_start
+
+        def rank(n: int):
+            suggestion = self.suggestions[n]
+            return (
+                0 if from_start[n] else 1,
+                SUGGESTION_TYPE_PRIORITY.get(suggestion["type"], len(SUGGESTION_TYPE_PRIORITY)),
+                -(suggestion.get("count") or 0),
+                suggestion["label"]
+            )
+
+        result = [self.suggestions[n] for n in sorted(from_start, key=rank)[:limit]]
+        if len(self._cache) >= self.cache_size:
+            self._cache.clear()
+        self._cache[(prefix, limit)] = result
+        return result
@@ -0,0 +1,219 @@
+"""
+Stock Holds - reserve variant stock at checkout until the order is paid or confirmed
+Reservations are single conditional $inc updates on shop_products.reserved, so
+concurrent checkouts never sell more than stock - reserved and no lock is taken.
+
+`stock` always mirrors the ERP, which keeps counting sold units until the
+order is invoiced there. So a committed sale keeps its units in `reserved`
+(a ledger of sales the ERP has not seen yet) instead of lowering `stock`;
+absorb_committed_holds drops them once a sync has read the invoiced stock.
+"""
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument
+
+from services.mongo_indexes import create_indexes
+
+logger = logging.getLogger(__name__)
+
+STOCK_HOLDS_COLLECTION = "shop_stock_holds"
+
+# Hold lifecycle: active -> committed (paid / confirmed) or released (cancelled / expired).
+# Committed holds keep erp_pending=True until their units are absorbed by the ERP stock.
+HOLD_ACTIVE = "active"
+HOLD_COMMITTED = "committed"
+HOLD_RELEASED = "released"
+
+# Finished holds are kept this long for auditing, then removed by a TTL index
+FINISHED_HOLD_RETENTION_DAYS = 30
+
+
+class StockUnavailable(Exception):
+    """A line could not be reserved; nothing of the checkout stays reserved"""
+
+    def __init__(self, line: dict, available: int):
+        self.line = line
+        self.available = available
+        super().__init__(f"Insufficient stock for {line['product_id']}: requested {line['quantity']}, available {available}")
+
+
+def _available_expr(quantity: int) -> dict:
+    """stock - reserved >= quantity, with missing fields counting as 0"""
+    return {"$gte": [
+        {"$subtract": [{"$ifNull": ["$stock", 0]}, {"$ifNull": ["$reserved", 0]}]},
+        quantity
+    ]}
+
+
+def merge_lines(lines: List[dict]) -> List[dict]:
+    """One line per variant (the same size can be in the cart twice), in a stable order"""
+    quantities: Dict[str, int] = {}
+    for line in lines:
+        quantities[line["product_id"]] = quantities.get(line["product_id"], 0) + line["quantity"]
+    return [{"product_id": pid, "quantity": qty} for pid, qty in sorted(quantities.items()) if qty > 0]
+
+
+async def ensure_stock_hold_indexes(db):
+    await create_indexes(db, [
+        (STOCK_HOLDS_COLLECTION, "hold_id", {"unique": True}),
+        (STOCK_HOLDS_COLLECTION, "order_id", {}),
+        (STOCK_HOLDS_COLLECTION, [("status", 1), ("expires_at", 1)], {}),
+        (STOCK_HOLDS_COLLECTION, [("erp_pending", 1), ("finished_at", 1)], {}),
+        (STOCK_HOLDS_COLLECTION, "purge_at", {"expireAfterSeconds": 0})
+    ])
+
+
+async def _unreserve(db, lines: List[dict]):
+    for line in lines:
+        await db.shop_products.update_one(
+            {"product_id": line["product_id"]},
+            {"$inc": {"reserved": -line["quantity"]}}
+        )
+
+
+async def reserve_stock(db, order_id: str, lines: List[dict], ttl_minutes: float) -> dict:
+    """Reserve every line ({product_id, quantity}) for an order or none of them
+
+    The hold is written first and each line is added to it once its variant
+    is reserved, with one update that only matches while enough unreserved
+    stock is left. A process dying halfway leaves an active hold that expires
+    and gives back exactly what it reserved. If a line fails, the hold is
+    released and StockUnavailable is raised.
+    """
+    lines = merge_lines(lines)
+    now = datetime.now(timezone.utc)
+    hold = {
+        "hold_id": f"HOLD-{uuid.uuid4().hex[:12].upper()}",
+        "order_id": order_id,
+        "requested": lines,
+        "lines": [],
+        "status": HOLD_ACTIVE,
+        "created_at": now,
+        "expires_at": now + timedelta(minutes=ttl_minutes)
+    }
+    await db[STOCK_HOLDS_COLLECTION].insert_one(hold)
+    hold.pop("_id", None)
+
+    for line in lines:
+        result = await db.shop_products.update_one(
+            {"product_id": line["product_id"], "$expr": _available_expr(line["quantity"])},
+            {"$inc": {"reserved": line["quantity"]}}
+        )
+        if result.modified_count == 0:
+            await release_hold(db, order_id, "insufficient_stock")
+            product = await db.shop_products.find_one(
+                {"product_id": line["product_id"]}, {"_id": 0, "stock": 1, "reserved": 1}
+            )
+            available = max(0, int((product or {}).get("stock") or 0) - int((product or {}).get("reserved") or 0))
+            raise StockUnavailable(line, available)
+        await db[STOCK_HOLDS_COLLECTION].update_one({"hold_id": hold["hold_id"]}, {"$push": {"lines": line}})
+        hold["lines"].append(line)
+    return hold
+
+
+def _purge_at(now: datetime) -> datetime:
+    return now + timedelta(days=FINISHED_HOLD_RETENTION_DAYS)
+
+
+async def _finish_hold(db, query: dict, status: str, reason: str, fields: Optional[dict] = None) -> Optional[dict]:
+    """Move one active hold to a final status; only one caller can win the transition"""
+    now = datetime.now(timezone.utc)
+    return await db[STOCK_HOLDS_COLLECTION].find_one_and_update(
+        {**query, "status": HOLD_ACTIVE},
+        {"$set": {
+            "status": status,
+            "finished_at": now,
+            "finish_reason": reason,
+            **(fields if fields is not None else {"purge_at": _purge_at(now)})
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def commit_hold(db, order_id: str, reason: str = "paid") -> Optional[dict]:
+    """Turn the order's reservation into a sale
+
+    The units stay reserved (nothing changes for the storefront) until the
+    ERP stock no longer counts them, see absorb_committed_holds. Returns the
+    committed hold, or None if the order had no active hold.
+    """
+    hold = await _finish_hold(db, {"order_id": order_id}, HOLD_COMMITTED, reason, {"erp_pending": True})
+    if not hold:
+        return None
+    logger.info(f"Committed stock hold {hold['hold_id']} of order {order_id} ({reason})")
+    return hold
+
+
+async def mark_hold_invoiced(db, order_id: str) -> bool:
+    """Record that the order's sale is invoiced in the ERP (its stock drops from now on)"""
+    result = await db[STOCK_HOLDS_COLLECTION].update_one(
+        {"order_id": order_id, "status": HOLD_COMMITTED, "erp_pending": True, "invoiced_at": None},
+        {"$set": {"invoiced_at": datetime.now(timezone.utc)}}
+    )
+    return result.modified_count > 0
+
+
+async def absorb_committed_holds(db, invoiced_before: datetime, max_pending_days: float) -> List[dict]:
+    """Give back the reserved units of sales the ERP stock now accounts for
+
+    Call after a complete sync that started at `invoiced_before`: holds
+    invoiced before then were read with their units already gone from the ERP
+    stock. Holds never marked invoiced are absorbed after `max_pending_days`,
+    so a forgotten order does not hold units forever. Returns the absorbed holds.
+    """
+    now = datetime.now(timezone.utc)
+    pending = await db[STOCK_HOLDS_COLLECTION].find(
+        {"erp_pending": True, "$or": [
+            {"invoiced_at": {"$lte": invoiced_before}},
+            {"finished_at": {"$lte": now - timedelta(days=max_pending_days)}}
+        ]},
+        {"_id": 0, "hold_id": 1}
+    ).to_list(None)
+    absorbed = []
+    for h in pending:
+        hold = await db[STOCK_HOLDS_COLLECTION].find_one_and_update(
+            {"hold_id": h["hold_id"], "erp_pending": True},
+            {"$set": {"erp_pending": False, "absorbed_at": now, "purge_at": _purge_at(now)}}
+        )
+        if hold:
+            if not hold.get("invoiced_at"):
+                logger.warning(f"Stock hold {hold['hold_id']} of order {hold['order_id']} was never invoiced, no longer holding its units")
+            await _unreserve(db, hold["lines"])
+            absorbed.append(hold)
+    if absorbed:
+        logger.info(f"Absorbed {len(absorbed)} committed stock holds into the ERP stock")
+    return absorbed
+
+
+async def release_hold(db, order_id: str, reason: str = "cancelled") -> Optional[dict]:
+    """Give the order's reserved quantities back; returns the released hold or None"""
+    hold = await _finish_hold(db, {"order_id": order_id}, HOLD_RELEASED, reason)
+    if not hold:
+        return None
+    await _unreserve(db, hold["lines"])
+    logger.info(f"Released stock hold {hold['hold_id']} of order {order_id} ({reason})")
+    return hold
+
+
+async def release_expired_holds(db, limit: int = 500) -> List[dict]:
+    """Release active holds past their expiry; safe to run from several workers
+
+    Returns the holds this call released.
+    """
+    now = datetime.now(timezone.utc)
+    expired = await db[STOCK_HOLDS_COLLECTION].find(
+        {"status": HOLD_ACTIVE, "expires_at": {"$lte": now}},
+        {"_id": 0, "hold_id": 1}
+    ).limit(limit).to_list(limit)
+    released = []
+    for h in expired:
+        hold = await _finish_hold(db, {"hold_id": h["hold_id"]}, HOLD_RELEASED, "expired")
+        if hold:
+            await _unreserve(db, hold["lines"])
+            released.append(hold)
+    if released:
+        logger.info(f"Released {len(released)} expired stock holds")
+    return released
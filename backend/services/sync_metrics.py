@@ -0,0 +1,119 @@
+"""
+Sync Metrics - per-phase timings and latency histograms of the ERP product sync
+Each run records where its time went (ERP fetch, transform, Mongo writes,
+regroup...) and the run summaries are kept in a collection so the sync
+interval can be tuned from real data
+"""
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+SYNC_RUNS_COLLECTION = "shop_sync_runs"
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return round(value, 3) if value is not None else None
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with count, sum and max"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile, capped at the observed max"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= rank:
+                return min(self.buckets[i], self.max) if i < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "max": round(self.max, 3),
+            "p50": _round(self.quantile(0.5)),
+            "p95": _round(self.quantile(0.95)),
+            "buckets": dict(zip(labels, self.counts))
+        }
+
+
+class SyncMetrics:
+    """
+    Wall-clock time per sync phase
+
+    Usage:
+        metrics = SyncMetrics()
+        with metrics.phase("write"):
+            await db.shop_products.bulk_write(...)
+        metrics.to_dict()  # {"phases": {"write": {"seconds": ..., "calls": ...}}, ...}
+
+    Phases may be entered many times (once per page); time and calls add up.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.phases: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def add(self, name: str, seconds: float):
+        entry = self.phases.setdefault(name, {"seconds": 0.0, "calls": 0})
+        entry["seconds"] += seconds
+        entry["calls"] += 1
+
+    def to_dict(self) -> dict:
+        return {
+            "total_seconds": round(time.monotonic() - self.started, 3),
+            "phases": {
+                name: {"seconds": round(entry["seconds"], 3), "calls": entry["calls"]}
+                for name, entry in self.phases.items()
+            }
+        }
+
+
+async def record_sync_run(db, run: dict, keep: int):
+    """Store a run summary and drop all but the newest `keep` runs (no history when keep <= 0)"""
+    if keep <= 0:
+        return
+    await db[SYNC_RUNS_COLLECTION].insert_one(dict(run))
+    oldest_kept = await db[SYNC_RUNS_COLLECTION].find(
+        {}, {"_id": 0, "started_at": 1}
+    ).sort("started_at", -1).skip(keep - 1).limit(1).to_list(1)
+    if oldest_kept:
+        await db[SYNC_RUNS_COLLECTION].delete_many({"started_at": {"$lt": oldest_kept[0]["started_at"]}})
+
+
+async def recent_sync_runs(db, limit: int) -> List[dict]:
+    """Newest run summaries first"""
+    return await db[SYNC_RUNS_COLLECTION].find(
+        {}, {"_id": 0}
+    ).sort("started_at", -1).limit(limit).to_list(limit)
@@ -0,0 +1,94 @@
+"""
+Notification outbox - a retry after a partial failure only sends to the recipients left
+
+Runs OutboxDispatcher against a throwaway MongoDB database (MONGO_URL,
+database <DB_NAME>_test_notification_outbox, dropped around the test).
+Skipped when no MongoDB is reachable.
+
+Tests:
+- The customer is reached, the admin send fails: the message is retried
+- The retry skips the customer and the message ends up sent
+"""
+
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MONGO_URL = os.environ.get('MONGO_URL', '')
+TEST_DB_NAME = f"{os.environ.get('DB_NAME', 'avenue')}_test_notification_outbox"
+KIND = "test_two_recipients"
+
+
+def test_retry_skips_recipients_already_sent():
+    if not MONGO_URL:
+        pytest.skip("MONGO_URL not set")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from services.outbox import (
+        OUTBOX_COLLECTION, STATUS_PENDING, STATUS_SENT, OutboxDispatcher,
+        enqueue, outbox_message, register_handler
+    )
+
+    sent = []
+    admin_down = [True]
+
+    async def send_both(skip):
+        results = []
+        if "customer" not in skip:
+            sent.append("customer")
+            results.append(("customer", {"success": True}))
+        if "admin" not in skip:
+            if admin_down[0]:
+                results.append(("admin", {"success": False, "error": "Admin email send failed"}))
+            else:
+                sent.append("admin")
+                results.append(("admin", {"success": True}))
+        return {"results": results}
+
+    async def handler(_payload, _source, progress):
+        await progress.record(await send_both(progress.sent))
+
+    register_handler(KIND, handler)
+
+    async def run():
+        client = AsyncIOMotorClient(MONGO_URL, serverSelectionTimeoutMS=2000)
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            pytest.skip("MongoDB not reachable")
+        await client.drop_database(TEST_DB_NAME)
+        db = client[TEST_DB_NAME]
+        dispatcher = OutboxDispatcher(db, base_delay=0)
+        outbox = db[OUTBOX_COLLECTION]
+
+        try:
+            message = outbox_message(KIND)
+            await enqueue(db, [message])
+
+            # Customer reached, admin failed: retried, with the customer recorded
+            assert await dispatcher.drain() == 1
+            stored = await outbox.find_one({"message_id": message["message_id"]})
+            assert stored["status"] == STATUS_PENDING
+            assert stored["sent_to"] == ["customer"]
+            assert sent == ["customer"]
+
+            # The retry only sends to the admin
+            admin_down[0] = False
+            await outbox.update_one(
+                {"message_id": message["message_id"]},
+                {"$set": {"next_attempt_at": datetime.now(timezone.utc)}}
+            )
+            assert await dispatcher.drain() == 1
+            stored = await outbox.find_one({"message_id": message["message_id"]})
+            assert stored["status"] == STATUS_SENT
+            assert sorted(stored["sent_to"]) == ["admin", "customer"]
+            assert sent == ["customer", "admin"]
+        finally:
+            await client.drop_database(TEST_DB_NAME)
+            client.close()
+
+    asyncio.run(run())
@@ -0,0 +1,80 @@
+"""
+Tests for product name parsing (size and base model extraction)
+Checks the compiled parser against a golden corpus of real ERP product names
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from product_parsing import (
+    extract_size_from_name,
+    extract_base_model,
+    parse_product_name,
+    parse_product_names
+)
+
+GOLDEN_PATH = os.path.join(os.path.dirname(__file__), 'data', 'product_names_golden.json')
+
+with open(GOLDEN_PATH, encoding='utf-8') as f:
+    GOLDEN = json.load(f)
+
+
+class TestGoldenCorpus:
+    """Every real ERP name must parse exactly as it did before compilation"""
+
+    def test_corpus_loaded(self):
+        assert len(GOLDEN) > 1000
+
+    def test_sizes_match_golden(self):
+        mismatches = [
+            (row["name"], row["size"], extract_size_from_name(row["name"]))
+            for row in GOLDEN
+            if extract_size_from_name(row["name"]) != row["size"]
+        ]
+        assert not mismatches, f"{len(mismatches)} size mismatches, first: {mismatches[:5]}"
+
+    def test_base_models_match_golden(self):
+        mismatches = [
+            (row["name"], row["base_model"], extract_base_model(row["name"]))
+            for row in GOLDEN
+            if extract_base_model(row["name"]) != row["base_model"]
+        ]
+        assert not mismatches, f"{len(mismatches)} base model mismatches, first: {mismatches[:5]}"
+
+    def test_batch_matches_single(self):
+        names = [row["name"] for row in GOLDEN]
+        parsed = parse_product_names(names + names[:100])
+        assert len(parsed) == len(set(names))
+        for row in GOLDEN:
+            assert parsed[row["name"]] == (row["size"], row["base_model"])
+
+
+class TestEdgeCases:
+    """Inputs that never reach the corpus"""
+
+    @pytest.mark.parametrize("name", ["", None])
+    def test_empty_names(self, name):
+        assert extract_size_from_name(name) is None
+        assert extract_base_model(name) == name
+
+    @pytest.mark.parametrize("name,size,base_model", [
+        ("REMERA BASICA-NEGRO-XL", "XL", "REMERA BASICA-NEGRO"),
+        ("REM.PREM.BLA.M", "M", "REM.PREM.BLA"),
+        ("100394-BP-CAMISA", None, "100394-B-CAMISA"),
+        ("ZAPATILLA RUN US8", "US8", "ZAPATILLA RUN"),
+        ("GORRA UNICA", None, "GORRA UNICA"),
+    ])
+    def test_known_patterns(self, name, size, base_model):
+        assert parse_product_name(name) == (size, base_model)
+
+    def test_cache_is_used(self):
+        parse_product_name.cache_clear()
+        parse_product_name("REMERA BASICA-NEGRO-XL")
+        parse_product_name("REMERA BASICA-NEGRO-XL")
+        info = parse_product_name.cache_info()
+        assert info.hits == 1 and info.misses == 1
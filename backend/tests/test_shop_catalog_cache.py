@@ -0,0 +1,126 @@
+"""
+Shop Storefront - Catalog version ETags, 304 responses and cursor pagination
+
+Tests the public storefront endpoints:
+- Strong ETags derived from the catalog version and the normalized query
+- If-None-Match returns 304 without a body
+- next_cursor walks the listing without repeating products
+"""
+
+import pytest
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+STOREFRONT_PATHS = [
+    "/api/shop/products?limit=5",
+    "/api/shop/featured",
+    "/api/shop/filters",
+    "/api/shop/store-location",
+]
+
+
+class TestCatalogETags:
+    """ETag and If-None-Match handling"""
+
+    @pytest.mark.parametrize("path", STOREFRONT_PATHS)
+    def test_etag_and_not_modified(self, path):
+        response = requests.get(f"{BASE_URL}{path}")
+        assert response.status_code == 200
+        etag = response.headers.get("ETag")
+        assert etag and etag.startswith('"'), "Expected a strong ETag"
+
+        revalidated = requests.get(f"{BASE_URL}{path}", headers={"If-None-Match": etag})
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers.get("ETag") == etag
+
+    def test_query_order_does_not_change_etag(self):
+        first = requests.get(f"{BASE_URL}/api/shop/products?limit=5&page=1")
+        second = requests.get(f"{BASE_URL}/api/shop/products?page=1&limit=5")
+        assert first.headers.get("ETag") == second.headers.get("ETag")
+
+    def test_different_queries_have_different_etags(self):
+        first = requests.get(f"{BASE_URL}/api/shop/products?limit=5&page=1")
+        second = requests.get(f"{BASE_URL}/api/shop/products?limit=5&page=2")
+        assert first.headers.get("ETag") != second.headers.get("ETag")
+
+    def test_stale_etag_gets_full_response(self):
+        response = requests.get(f"{BASE_URL}/api/shop/products?limit=5", headers={"If-None-Match": '"stale"'})
+        assert response.status_code == 200
+        assert "products" in response.json()
+
+    def test_product_detail_etag(self):
+        products = requests.get(f"{BASE_URL}/api/shop/products?limit=1").json()["products"]
+        if not products:
+            pytest.skip("No products in catalog")
+        path = f"{BASE_URL}/api/shop/products/{products[0]['id']}"
+        response = requests.get(path)
+        assert response.status_code == 200
+        revalidated = requests.get(path, headers={"If-None-Match": response.headers["ETag"]})
+        assert revalidated.status_code == 304
+
+    def test_missing_product_is_not_cached_as_ok(self):
+        response = requests.get(f"{BASE_URL}/api/shop/products/grp_doesnotexist")
+        assert response.status_code == 404
+
+
+class TestCursorPagination:
+    """next_cursor on the storefront listing"""
+
+    def test_cursor_walk_matches_pages(self):
+        first = requests.get(f"{BASE_URL}/api/shop/products?limit=10").json()
+        if not first.get("next_cursor"):
+            pytest.skip("Catalog fits in one page")
+        by_cursor = requests.get(
+            f"{BASE_URL}/api/shop/products", params={"limit": 10, "cursor": first["next_cursor"]}
+        ).json()
+        by_page = requests.get(f"{BASE_URL}/api/shop/products?limit=10&page=2").json()
+        assert [p["id"] for p in by_cursor["products"]] == [p["id"] for p in by_page["products"]]
+
+    def test_cursor_walk_has_no_duplicates(self):
+        seen = []
+        cursor = None
+        for _ in range(5):
+            params = {"limit": 20}
+            if cursor:
+                params["cursor"] = cursor
+            data = requests.get(f"{BASE_URL}/api/shop/products", params=params).json()
+            seen += [p["id"] for p in data["products"]]
+            cursor = data.get("next_cursor")
+            if not cursor:
+                break
+        assert len(seen) == len(set(seen))
+
+    def test_invalid_cursor(self):
+        response = requests.get(f"{BASE_URL}/api/shop/products", params={"cursor": "not-a-cursor!"})
+        assert response.status_code == 400
+
+
+class TestCatalogChanges:
+    """Delta API over the catalog change log"""
+
+    def test_listing_reports_catalog_version(self):
+        data = requests.get(f"{BASE_URL}/api/shop/products?limit=1").json()
+        assert isinstance(data.get("catalog_version"), int)
+
+    def test_no_changes_at_current_version(self):
+        version = requests.get(f"{BASE_URL}/api/shop/products?limit=1").json()["catalog_version"]
+        response = requests.get(f"{BASE_URL}/api/shop/catalog/changes", params={"since": version})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["reset"] is False
+        assert data["upserted"] == [] and data["removed"] == []
+        assert data["version"] >= version
+
+    def test_delta_shape(self):
+        version = requests.get(f"{BASE_URL}/api/shop/products?limit=1").json()["catalog_version"]
+        data = requests.get(f"{BASE_URL}/api/shop/catalog/changes", params={"since": max(0, version - 1)}).json()
+        assert set(data) >= {"since", "version", "reset", "upserted", "removed"}
+        for item in data["upserted"]:
+            assert "id" in item and "available_sizes" in item
+
+    def test_since_is_required(self):
+        response = requests.get(f"{BASE_URL}/api/shop/catalog/changes")
+        assert response.status_code == 422
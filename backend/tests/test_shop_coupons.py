@@ -0,0 +1,74 @@
+"""
+Shop Coupons - validation through the coupon cache and bulk generation
+
+Tests:
+- /apply-coupon prices a coupon and rejects unknown codes
+- Edits are seen right away (the cache is dropped on update)
+- /coupons/bulk requires an admin
+- /use-coupon no longer counts uses (redemption happens at checkout)
+"""
+
+import os
+import uuid
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+
+@pytest.fixture
+def coupon():
+    code = f"TEST{uuid.uuid4().hex[:8].upper()}"
+    response = requests.post(f"{BASE_URL}/api/shop/coupons", json={
+        "code": code,
+        "discount_type": "percentage",
+        "discount_value": 10,
+        "max_uses": 1
+    })
+    assert response.status_code == 200
+    created = response.json()["coupon"]
+    yield created
+    requests.delete(f"{BASE_URL}/api/shop/coupons/{created['id']}")
+
+
+class TestCoupons:
+    """Coupon validation and admin endpoints"""
+
+    def test_apply_coupon(self, coupon):
+        response = requests.post(f"{BASE_URL}/api/shop/apply-coupon", json={"code": coupon["code"].lower(), "subtotal": 100000})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["valid"] is True
+        assert data["discount_amount"] == 10000
+        assert data["new_subtotal"] == 90000
+
+    def test_unknown_code(self):
+        response = requests.post(f"{BASE_URL}/api/shop/apply-coupon", json={"code": "NOEXISTE-XYZ", "subtotal": 100000})
+        assert response.status_code == 404
+
+    def test_edit_is_seen_immediately(self, coupon):
+        requests.post(f"{BASE_URL}/api/shop/apply-coupon", json={"code": coupon["code"], "subtotal": 100000})
+        response = requests.put(f"{BASE_URL}/api/shop/coupons/{coupon['id']}", json={
+            "code": coupon["code"],
+            "discount_type": "percentage",
+            "discount_value": 10,
+            "is_active": False
+        })
+        assert response.status_code == 200
+        response = requests.post(f"{BASE_URL}/api/shop/apply-coupon", json={"code": coupon["code"], "subtotal": 100000})
+        assert response.status_code == 400
+
+    def test_use_coupon_does_not_count(self, coupon):
+        for _ in range(2):
+            assert requests.post(f"{BASE_URL}/api/shop/use-coupon/{coupon['code']}").status_code == 200
+        response = requests.post(f"{BASE_URL}/api/shop/apply-coupon", json={"code": coupon["code"], "subtotal": 100000})
+        assert response.status_code == 200
+
+    def test_bulk_requires_admin(self):
+        response = requests.post(f"{BASE_URL}/api/shop/coupons/bulk", json={
+            "count": 10,
+            "discount_type": "fixed",
+            "discount_value": 5000
+        })
+        assert response.status_code in (401, 403)
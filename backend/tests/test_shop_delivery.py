@@ -0,0 +1,59 @@
+"""
+Shop Delivery - single and batch delivery quotes
+
+Tests:
+- /calculate-delivery prices a point in Paraguay and rejects one outside
+- /calculate-delivery/batch quotes several points in one call, with the
+  same prices as single quotes
+- Quoting saved addresses requires a session
+"""
+
+import requests
+import os
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+
+ASUNCION_POINTS = [
+    {"id": "centro", "lat": -25.2820, "lng": -57.6350},
+    {"id": "san-lorenzo", "lat": -25.3400, "lng": -57.5080},
+    {"id": "luque", "lat": -25.2700, "lng": -57.4870},
+]
+
+
+class TestDeliveryQuotes:
+    """Delivery pricing"""
+
+    def test_single_quote(self):
+        response = requests.post(f"{BASE_URL}/api/shop/calculate-delivery", json={"lat": -25.2820, "lng": -57.6350})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["min_price"] <= data["delivery_cost"] <= data["max_price"]
+
+    def test_outside_paraguay_rejected(self):
+        response = requests.post(f"{BASE_URL}/api/shop/calculate-delivery", json={"lat": -34.6, "lng": -58.4})
+        assert response.status_code == 400
+
+    def test_batch_matches_single_quotes(self):
+        response = requests.post(f"{BASE_URL}/api/shop/calculate-delivery/batch", json={"points": ASUNCION_POINTS})
+        assert response.status_code == 200
+        quotes = response.json()["quotes"]
+        assert [q["id"] for q in quotes] == [p["id"] for p in ASUNCION_POINTS]
+        for point, quote in zip(ASUNCION_POINTS, quotes):
+            assert quote["available"] is True
+            single = requests.post(
+                f"{BASE_URL}/api/shop/calculate-delivery", json={"lat": point["lat"], "lng": point["lng"]}
+            ).json()
+            assert quote["delivery_cost"] == single["delivery_cost"]
+
+    def test_batch_flags_points_outside_paraguay(self):
+        response = requests.post(f"{BASE_URL}/api/shop/calculate-delivery/batch", json={
+            "points": [{"id": "bsas", "lat": -34.6, "lng": -58.4}]
+        })
+        assert response.status_code == 200
+        quote = response.json()["quotes"][0]
+        assert quote["available"] is False
+        assert quote["reason"] == "outside_paraguay"
+
+    def test_saved_addresses_require_session(self):
+        response = requests.post(f"{BASE_URL}/api/shop/calculate-delivery/batch", json={})
+        assert response.status_code == 401
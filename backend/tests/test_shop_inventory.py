@@ -0,0 +1,89 @@
+"""
+Shop Inventory - cart resolution and ERP stock pushes
+
+Tests:
+- /resolve-cart and /validate-inventory answer for unknown products
+- /erp/stock-updates rejects unsigned, badly signed and stale pushes
+- A signed push is applied once per event_id and rejected without one
+  (needs ERP_WEBHOOK_SECRET)
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import time
+import uuid
+
+import pytest
+import requests
+
+BASE_URL = os.environ.get('REACT_APP_BACKEND_URL', '').rstrip('/')
+ERP_WEBHOOK_SECRET = os.environ.get('ERP_WEBHOOK_SECRET', '')
+PUSH_URL = f"{BASE_URL}/api/shop/erp/stock-updates"
+
+
+def signed_push(payload: dict, secret: str = ERP_WEBHOOK_SECRET, timestamp: str = None):
+    body = json.dumps(payload).encode('utf-8')
+    timestamp = timestamp or str(int(time.time()))
+    signature = hmac.new(secret.encode('utf-8'), timestamp.encode('utf-8') + b"." + body, hashlib.sha256).hexdigest()
+    return requests.post(PUSH_URL, data=body, headers={
+        "Content-Type": "application/json",
+        "X-ERP-Timestamp": timestamp,
+        "X-ERP-Signature": signature
+    })
+
+
+class TestCartResolution:
+    """Batched cart lookups"""
+
+    def test_resolve_unknown_product(self):
+        response = requests.post(f"{BASE_URL}/api/shop/resolve-cart", json={
+            "items": [{"product_id": "grp_doesnotexist", "quantity": 1}]
+        })
+        assert response.status_code == 200
+        data = response.json()
+        assert data["all_available"] is False
+
+    def test_validate_unknown_product(self):
+        response = requests.post(f"{BASE_URL}/api/shop/validate-inventory", json={
+            "items": [{"product_id": "grp_doesnotexist", "quantity": 1}]
+        })
+        assert response.status_code == 200
+        assert response.json()["valid"] is False
+
+
+class TestErpStockPush:
+    """Signed stock pushes from the ERP"""
+
+    def test_unsigned_push_rejected(self):
+        response = requests.post(PUSH_URL, json={"updates": []})
+        assert response.status_code in (401, 503)
+
+    def test_bad_signature_rejected(self):
+        response = signed_push({"updates": []}, secret="wrong-secret")
+        assert response.status_code in (401, 503)
+
+    def test_stale_push_rejected(self):
+        if not ERP_WEBHOOK_SECRET:
+            pytest.skip("ERP_WEBHOOK_SECRET not set")
+        response = signed_push({"updates": []}, timestamp=str(int(time.time()) - 3600))
+        assert response.status_code == 401
+
+    def test_event_applied_once(self):
+        if not ERP_WEBHOOK_SECRET:
+            pytest.skip("ERP_WEBHOOK_SECRET not set")
+        payload = {"event_id": f"TEST-{uuid.uuid4().hex}", "updates": [{"sku": "TEST-UNKNOWN-SKU", "stock": 1}]}
+        first = signed_push(payload)
+        assert first.status_code == 200
+        assert first.json()["duplicate"] is False
+        assert first.json()["unknown"] == ["TEST-UNKNOWN-SKU"]
+        second = signed_push(payload)
+        assert second.status_code == 200
+        assert second.json()["duplicate"] is True
+
+    def test_push_without_event_id_rejected(self):
+        if not ERP_WEBHOOK_SECRET:
+            pytest.skip("ERP_WEBHOOK_SECRET not set")
+        response = signed_push({"updates": [{"sku": "TEST-UNKNOWN-SKU", "stock_delta": -1}]})
+        assert response.status_code == 422
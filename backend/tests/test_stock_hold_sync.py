@@ -0,0 +1,114 @@
+"""
+Stock holds vs ERP sync - a committed sale is not put back on sale by a sync
+
+Runs sync_products_from_erp against a mocked ERP and a throwaway MongoDB
+database (MONGO_URL, database <DB_NAME>_test_stock_hold_sync, dropped around
+the test). Skipped when no MongoDB is reachable.
+
+Tests:
+- A sync before the order is invoiced keeps the sold units out of the available stock
+- Once invoiced, the next sync takes the ERP stock as is and the units are released
+"""
+
+import asyncio
+import functools
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MONGO_URL = os.environ.get('MONGO_URL', '')
+TEST_DB_NAME = f"{os.environ.get('DB_NAME', 'avenue')}_test_stock_hold_sync"
+PRODUCT_ID = "HOLDSYNC001"
+ORDER_ID = "ORD-HOLDSYNC"
+
+
+class FakeErp:
+    """ERP with a single product whose stock the test changes"""
+
+    def __init__(self, stock: int):
+        self.stock = stock
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        rows = [{
+            "ID": PRODUCT_ID,
+            "Name": "REMERA HOLD SYNC - M",
+            "sku": "HOLDSYNC-SKU-001",
+            "price": 100000,
+            "stock": self.stock,
+            "discount": 0,
+            "description": "",
+            "img_url": "",
+            "category": "TEST",
+            "brand": "TEST",
+            "online": True
+        }]
+        return httpx.Response(200, json={"total": len(rows), "data": rows if body["page"] == 1 else []})
+
+
+@pytest.fixture
+def sync_env(monkeypatch):
+    if not MONGO_URL:
+        pytest.skip("MONGO_URL not set")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import ecommerce
+
+    erp = FakeErp(stock=3)
+    monkeypatch.setattr(ecommerce, "ENCOM_API_URL", "http://erp.test")
+    monkeypatch.setattr(ecommerce, "ErpProductsClient", functools.partial(
+        ecommerce.ErpProductsClient, transport=httpx.MockTransport(erp.handler)
+    ))
+    return ecommerce, erp, AsyncIOMotorClient
+
+
+def test_sync_after_commit_does_not_resell(sync_env):
+    ecommerce, erp, motor_client = sync_env
+    from services.stock_holds import reserve_stock, commit_hold, STOCK_HOLDS_COLLECTION
+
+    async def run():
+        client = motor_client(MONGO_URL, serverSelectionTimeoutMS=2000)
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            pytest.skip("MongoDB not reachable")
+        await client.drop_database(TEST_DB_NAME)
+        ecommerce.set_database(client[TEST_DB_NAME])
+        db = client[TEST_DB_NAME]
+
+        async def available():
+            product = await db.shop_products.find_one({"product_id": PRODUCT_ID})
+            grouped = await db.shop_products_grouped.find_one({"base_model": product["base_model"]})
+            return product["stock"] - product.get("reserved", 0), (grouped or {}).get("total_stock", 0)
+
+        try:
+            await ecommerce.sync_products_from_erp(full=True)
+            assert await available() == (3, 3)
+
+            # Two units sold and paid; the ERP does not know yet
+            await reserve_stock(db, ORDER_ID, [{"product_id": PRODUCT_ID, "quantity": 2}], 10)
+            assert await commit_hold(db, ORDER_ID, "paid")
+
+            # The ERP still reports 3: only 1 is for sale
+            await ecommerce.sync_products_from_erp(full=True)
+            assert await available() == (1, 1)
+
+            # Invoiced: the ERP stock drops to 1 and the next sync absorbs the sale
+            await ecommerce.apply_order_status_to_stock(ORDER_ID, "facturado")
+            erp.stock = 1
+            await ecommerce.sync_products_from_erp(full=True)
+            product = await db.shop_products.find_one({"product_id": PRODUCT_ID})
+            assert product["stock"] == 1
+            assert product.get("reserved", 0) == 0
+            assert await available() == (1, 1)
+            hold = await db[STOCK_HOLDS_COLLECTION].find_one({"order_id": ORDER_ID})
+            assert hold["erp_pending"] is False
+        finally:
+            await client.drop_database(TEST_DB_NAME)
+            client.close()
+
+    asyncio.run(run())
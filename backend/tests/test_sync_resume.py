@@ -0,0 +1,122 @@
+"""
+ERP sync resume - an interrupted sync resumed against a shifted catalog
+
+Runs sync_products_from_erp against a mocked ERP and a throwaway MongoDB
+database (MONGO_URL, database <DB_NAME>_test_sync_resume, dropped around the
+test). Skipped when no MongoDB is reachable.
+
+Tests:
+- Products that moved onto already-synced pages are not pruned by the resumed run
+- The next complete run removes the product that really left the ERP
+"""
+
+import asyncio
+import functools
+import json
+import os
+import sys
+
+import httpx
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MONGO_URL = os.environ.get('MONGO_URL', '')
+TEST_DB_NAME = f"{os.environ.get('DB_NAME', 'avenue')}_test_sync_resume"
+PAGE_SIZE = 2
+
+
+def erp_row(i: int) -> dict:
+    return {
+        "ID": f"RESUME{i:03d}",
+        "Name": f"REMERA TEST {i:03d} - M",
+        "sku": f"RESUME-SKU-{i:03d}",
+        "price": 100000,
+        "stock": 3,
+        "discount": 0,
+        "description": "",
+        "img_url": "",
+        "category": "TEST",
+        "brand": "TEST",
+        "online": True
+    }
+
+
+class FakeErp:
+    """ERP paging by offset over a mutable list of rows; `broken_pages` answer HTTP 400"""
+
+    def __init__(self, rows: list):
+        self.rows = rows
+        self.broken_pages = set()
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        page, limit = body["page"], body["limit"]
+        if page in self.broken_pages:
+            return httpx.Response(400, json={"error": "broken page"})
+        start = (page - 1) * limit
+        return httpx.Response(200, json={"total": len(self.rows), "data": self.rows[start:start + limit]})
+
+
+@pytest.fixture
+def sync_env(monkeypatch):
+    if not MONGO_URL:
+        pytest.skip("MONGO_URL not set")
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import ecommerce
+
+    erp = FakeErp([erp_row(i) for i in range(6)])
+    monkeypatch.setattr(ecommerce, "ERP_PAGE_SIZE", PAGE_SIZE)
+    monkeypatch.setattr(ecommerce, "SYNC_MODE", "delta")
+    monkeypatch.setattr(ecommerce, "ENCOM_API_URL", "http://erp.test")
+    monkeypatch.setattr(ecommerce, "ErpProductsClient", functools.partial(
+        ecommerce.ErpProductsClient, transport=httpx.MockTransport(erp.handler)
+    ))
+    return ecommerce, erp, AsyncIOMotorClient
+
+
+def test_resumed_sync_keeps_products_that_moved(sync_env):
+    ecommerce, erp, motor_client = sync_env
+
+    async def run():
+        client = motor_client(MONGO_URL, serverSelectionTimeoutMS=2000)
+        try:
+            await client.admin.command("ping")
+        except Exception:
+            pytest.skip("MongoDB not reachable")
+        await client.drop_database(TEST_DB_NAME)
+        ecommerce.set_database(client[TEST_DB_NAME])
+        db = client[TEST_DB_NAME]
+
+        async def product_ids():
+            return set(await db.shop_products.distinct("product_id"))
+
+        try:
+            # Interrupted run: pages 1-2 written, page 3 fails and is left for the resume
+            erp.broken_pages = {3}
+            await ecommerce.sync_products_from_erp()
+            assert ecommerce.sync_status["last_stats"]["failed_pages"] == [3]
+
+            # The ERP drops row 0 and adds row 6: same total, every row moves one slot left
+            erp.broken_pages = set()
+            erp.rows = [erp_row(i) for i in range(1, 7)]
+            await ecommerce.sync_products_from_erp()
+            stats = ecommerce.sync_status["last_stats"]
+            assert stats["resumed_pages"] == 2
+            assert stats["removed"] == 0
+            # Nothing written before the interruption is pruned (RESUME003 now sits on
+            # page 2, which the resumed run did not fetch again)
+            assert {f"RESUME{i:03d}" for i in range(0, 4)} <= await product_ids()
+
+            # A complete run picks up RESUME004 (moved onto page 2 while it was
+            # missing) and prunes only the product that really left the ERP
+            await ecommerce.sync_products_from_erp()
+            stats = ecommerce.sync_status["last_stats"]
+            assert not stats.get("resumed_pages")
+            assert stats["removed"] == 1
+            assert await product_ids() == {f"RESUME{i:03d}" for i in range(1, 7)}
+        finally:
+            await client.drop_database(TEST_DB_NAME)
+            client.close()
+
+    asyncio.run(run())
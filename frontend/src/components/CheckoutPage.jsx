@@ -110,6 +110,11 @@ export const CheckoutPage = ({ cart, setCart, user, onLoginClick, onLogout, lang
   const [selectedLocation, setSelectedLocation] = useState(null);
   const [address, setAddress] = useState('');
   const [reference, setReference] = useState('');
+  
+  // Saved addresses of the logged-in user, each with its delivery quote
+  const [savedAddresses, setSavedAddresses] = useState([]);
+  const [selectedAddressId, setSelectedAddressId] = useState(null);
+  const [savingAddress, setSavingAddress] = useState(false);
   const [checkoutSuccess, setCheckoutSuccess] = useState(false);
   const [acceptedTerms, setAcceptedTerms] = useState(false);
   
@@ -212,9 +217,89 @@ export const CheckoutPage = ({ cart, setCart, user, onLoginClick, onLogout, lang
     }
   }, []);
 
+  // One batch call quotes every saved address, instead of one call per address
+  const loadSavedAddresses = useCallback(async () => {
+    if (!user) {
+      setSavedAddresses([]);
+      return;
+    }
+    const token = localStorage.getItem('auth_token');
+    try {
+      const [addressesRes, quotesRes] = await Promise.all([
+        fetch(`${API_URL}/api/user/addresses`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        }),
+        fetch(`${API_URL}/api/shop/calculate-delivery/batch`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`
+          },
+          body: JSON.stringify({})
+        })
+      ]);
+      if (!addressesRes.ok || !quotesRes.ok) return;
+      const { addresses } = await addressesRes.json();
+      const { quotes } = await quotesRes.json();
+      const quotesById = Object.fromEntries(quotes.map(q => [q.id, q]));
+      setSavedAddresses((addresses || []).map(a => ({ ...a, quote: quotesById[a.id] })));
+    } catch (err) {
+      console.error('Error loading saved addresses:', err);
+    }
+  }, [user]);
+
+  useEffect(() => {
+    loadSavedAddresses();
+  }, [loadSavedAddresses]);
+
+  const selectSavedAddress = (saved) => {
+    const quote = saved.quote;
+    if (!quote || !quote.available) return;
+    setSelectedAddressId(saved.id);
+    setSelectedLocation({ lat: quote.lat, lng: quote.lng });
+    setAddress(saved.direccion);
+    setReference(saved.referencia || '');
+    setDeliveryCost(quote.delivery_cost);
+    setDeliveryDistance(quote.distance_km);
+  };
+
+  const saveSelectedAddress = async () => {
+    if (!user || !selectedLocation) return;
+    setSavingAddress(true);
+    try {
+      const token = localStorage.getItem('auth_token');
+      const response = await fetch(`${API_URL}/api/user/addresses`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'Authorization': `Bearer ${token}`
+        },
+        body: JSON.stringify({
+          alias: `Dirección ${savedAddresses.length + 1}`,
+          direccion: address || 'Ubicación seleccionada',
+          ciudad: '',
+          referencia: reference,
+          is_default: savedAddresses.length === 0,
+          lat: selectedLocation.lat,
+          lng: selectedLocation.lng
+        })
+      });
+      if (response.ok) {
+        const data = await response.json();
+        await loadSavedAddresses();
+        setSelectedAddressId(data.address.id);
+      }
+    } catch (err) {
+      console.error('Error saving address:', err);
+    } finally {
+      setSavingAddress(false);
+    }
+  };
+
   const onMapClick = useCallback((e) => {
     const lat = e.latLng.lat();
     const lng = e.latLng.lng();
+    setSelectedAddressId(null);
     setSelectedLocation({ lat, lng });
     calculateDelivery(lat, lng);
 
@@ -425,11 +510,6 @@ export const CheckoutPage = ({ cart, setCart, user, onLoginClick, onLogout, lang
         // Mark checkout as successful BEFORE clearing cart
         setCheckoutSuccess(true);
         
-        // Increment coupon usage if a coupon was applied
-        if (appliedCoupon?.code) {
-          fetch(`${API_URL}/api/shop/use-coupon/${appliedCoupon.code}`, { method: 'POST' }).catch(() => {});
-        }
-        
         // Clear cart
         setCart([]);
         localStorage.removeItem('avenue_cart');
@@ -730,6 +810,39 @@ export const CheckoutPage = ({ cart, setCart, user, onLoginClick, onLogout, lang
                 {/* Map for delivery */}
                 {deliveryType === 'delivery' && (
                   <div className="space-y-4">
+                    {savedAddresses.length > 0 && (
+                      <div className="space-y-2">
+                        <p className="text-sm text-gray-500">Tus direcciones guardadas</p>
+                        {savedAddresses.map((saved) => {
+                          const quote = saved.quote;
+                          const available = quote && quote.available;
+                          return (
+                            <button
+                              key={saved.id}
+                              type="button"
+                              disabled={!available}
+                              onClick={() => selectSavedAddress(saved)}
+                              className={`w-full p-4 text-left transition-all border ${
+                                selectedAddressId === saved.id
+                                  ? 'border-gray-900 bg-gray-50'
+                                  : 'border-gray-200 hover:border-gray-300'
+                              } ${available ? '' : 'opacity-50 cursor-not-allowed'}`}
+                            >
+                              <p className="text-sm font-medium text-gray-900">{saved.alias}</p>
+                              <p className="text-xs text-gray-500 mt-1">{saved.direccion}</p>
+                              <p className="text-xs mt-1 text-gray-500">
+                                {available
+                                  ? `${quote.distance_km.toFixed(1)} km • ${formatPrice(quote.delivery_cost)}`
+                                  : quote && quote.reason === 'outside_paraguay'
+                                    ? 'Fuera de nuestra zona de entrega'
+                                    : 'Sin ubicación en el mapa: marcala abajo'}
+                              </p>
+                            </button>
+                          );
+                        })}
+                      </div>
+                    )}
+                    
                     <p className="text-sm text-gray-500">
                       Selecciona tu ubicación de entrega en el mapa
                     </p>
@@ -805,6 +918,17 @@ export const CheckoutPage = ({ cart, setCart, user, onLoginClick, onLogout, lang
                             className="w-full px-4 py-3 bg-white border-0 text-sm text-gray-900 focus:outline-none focus:ring-1 focus:ring-gray-200"
                           />
                         </div>
+                        
+                        {user && !selectedAddressId && (
+                          <button
+                            type="button"
+                            onClick={saveSelectedAddress}
+                            disabled={savingAddress}
+                            className="mt-3 text-xs text-gray-600 underline hover:text-gray-900 disabled:opacity-50"
+                          >
+                            {savingAddress ? 'Guardando...' : 'Guardar esta dirección para próximas compras'}
+                          </button>
+                        )}
                       </div>
                     )}
                   </div>
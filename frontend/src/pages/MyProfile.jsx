@@ -42,8 +42,11 @@ const MyProfile = ({ user, onLogout }) => {
     direccion: '',
     ciudad: '',
     referencia: '',
-    is_default: false
+    is_default: false,
+    lat: null,
+    lng: null
   });
+  const [locating, setLocating] = useState(false);
   
   // Order history
   const [orders, setOrders] = useState([]);
@@ -172,7 +175,7 @@ const MyProfile = ({ user, onLogout }) => {
       if (res.ok) {
         const data = await res.json();
         setAddresses([...addresses, data.address]);
-        setNewAddress({ alias: '', direccion: '', ciudad: '', referencia: '', is_default: false });
+        setNewAddress({ alias: '', direccion: '', ciudad: '', referencia: '', is_default: false, lat: null, lng: null });
         setShowAddressForm(false);
         setSuccess('Dirección agregada');
         setTimeout(() => setSuccess(''), 3000);
@@ -184,6 +187,29 @@ const MyProfile = ({ user, onLogout }) => {
     }
   };
 
+  // The location lets checkout quote delivery for the saved address
+  const handleUseCurrentLocation = () => {
+    if (!navigator.geolocation) {
+      setError('Tu navegador no permite obtener la ubicación');
+      return;
+    }
+    setLocating(true);
+    navigator.geolocation.getCurrentPosition(
+      (position) => {
+        setNewAddress((current) => ({
+          ...current,
+          lat: position.coords.latitude,
+          lng: position.coords.longitude
+        }));
+        setLocating(false);
+      },
+      () => {
+        setError('No se pudo obtener tu ubicación');
+        setLocating(false);
+      }
+    );
+  };
+
   const handleDeleteAddress = async (addressId) => {
     try {
       const token = localStorage.getItem('auth_token');
@@ -461,6 +487,9 @@ const MyProfile = ({ user, onLogout }) => {
                         {addr.referencia && (
                           <p className="text-gray-400 text-sm mt-1">Ref: {addr.referencia}</p>
                         )}
+                        {(addr.lat == null || addr.lng == null) && (
+                          <p className="text-gray-400 text-xs mt-1">Sin ubicación: el envío se calcula en el checkout</p>
+                        )}
                       </div>
                       <button
                         onClick={() => handleDeleteAddress(addr.id)}
@@ -519,6 +548,19 @@ const MyProfile = ({ user, onLogout }) => {
                       className="w-full px-3 py-2 border border-gray-200 rounded-lg focus:border-[#d4a968] focus:outline-none"
                     />
                   </div>
+                  <div className="md:col-span-2">
+                    <button
+                      type="button"
+                      onClick={handleUseCurrentLocation}
+                      disabled={locating}
+                      className="flex items-center gap-2 text-sm text-gray-600 hover:text-black disabled:opacity-50"
+                    >
+                      {locating ? <Loader2 className="w-4 h-4 animate-spin" /> : <MapPin className="w-4 h-4" />}
+                      {newAddress.lat != null && newAddress.lng != null
+                        ? 'Ubicación agregada'
+                        : 'Usar mi ubicación actual (para calcular el envío)'}
+                    </button>
+                  </div>
                   <div className="md:col-span-2">
                     <label className="flex items-center gap-2 cursor-pointer">
                       <input